@@ -0,0 +1,163 @@
+# account.py
+import asyncio
+import json
+import random
+import threading
+import time
+import traceback
+
+import aiohttp
+
+from streaming import STREAM_URL, TESTNET_STREAM_URL, _sleep_unless_stopped
+
+# Binance invalida el listen key a los 60 minutos sin keepalive
+KEEPALIVE_SECONDS = 30 * 60
+RECONCILE_SECONDS = 5 * 60
+FINAL_ORDER_STATUSES = ("FILLED", "CANCELED", "REJECTED", "EXPIRED", "EXPIRED_IN_MATCH")
+
+
+class AccountModel:
+    """
+    Saldos de la cuenta en memoria, alimentados por el user data stream.
+
+    reconcile() los carga con get_account; después, cada evento
+    outboundAccountPosition (y balanceUpdate, para depósitos y retiros) los
+    actualiza en el acto, sin consultas REST. Los executionReport se guardan
+    en 'orders' y se pasan a on_execution(evento), que recibe también las
+    ejecuciones parciales y las órdenes hechas a mano. El listen key se
+    renueva cada keepalive_seconds y se reconcilia por REST al conectar
+    (por los eventos perdidos durante un corte) y cada reconcile_seconds.
+    Se lee desde cualquier hilo con free() y locked().
+    """
+
+    def __init__(self, client, log=print, on_execution=None, url=None, testnet=False,
+                 keepalive_seconds=KEEPALIVE_SECONDS, reconcile_seconds=RECONCILE_SECONDS, max_backoff=60):
+        self.client = client
+        self.log = log
+        self.on_execution = on_execution
+        self.base_url = (url or (TESTNET_STREAM_URL if testnet else STREAM_URL)).rstrip('/')
+        self.keepalive_seconds = keepalive_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.max_backoff = max_backoff
+
+        self.balances = {}  # asset -> (free, locked)
+        self.orders = {}  # orderId -> último executionReport de las órdenes abiertas
+        self.updated = 0.0  # time.time() del último cambio, para saber qué tan fresco está
+        self._lock = threading.Lock()
+        self.thread = None
+
+    def free(self, asset):
+        with self._lock:
+            return self.balances.get(asset, (0.0, 0.0))[0]
+
+    def locked(self, asset):
+        with self._lock:
+            return self.balances.get(asset, (0.0, 0.0))[1]
+
+    def reconcile(self):
+        """Reemplaza los saldos por los de get_account (una consulta firmada)."""
+        account = self.client.get_account()
+        balances = {b['asset']: (float(b['free']), float(b['locked'])) for b in account['balances']}
+        with self._lock:
+            self.balances = balances
+            self.updated = time.time()
+
+    def apply(self, event):
+        """Aplica un evento del user data stream al modelo."""
+        kind = event.get('e')
+        if kind == 'outboundAccountPosition':
+            with self._lock:
+                for b in event['B']:
+                    self.balances[b['a']] = (float(b['f']), float(b['l']))
+                self.updated = time.time()
+        elif kind == 'balanceUpdate':
+            with self._lock:
+                free, locked = self.balances.get(event['a'], (0.0, 0.0))
+                self.balances[event['a']] = (free + float(event['d']), locked)
+                self.updated = time.time()
+        elif kind == 'executionReport':
+            with self._lock:
+                if event['X'] in FINAL_ORDER_STATUSES:
+                    self.orders.pop(event['i'], None)
+                else:
+                    self.orders[event['i']] = event
+            if self.on_execution:
+                self.on_execution(event)
+
+    def start(self, stop_event):
+        """Mantiene el modelo al día en un hilo propio hasta que stop_event se activa."""
+        if hasattr(self.client, "subscribe_user_data"):
+            # Exchange simulado (simulator.SimulatedExchange): entrega los eventos sin WebSocket
+            self.client.subscribe_user_data(self.apply)
+            return
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.run(stop_event)),
+                                       name="user-data-stream", daemon=True)
+        self.thread.start()
+
+    async def run(self, stop_event):
+        backoff = 1
+        async with aiohttp.ClientSession() as session:
+            while not stop_event.is_set():
+                listen_key = None
+                try:
+                    listen_key = await asyncio.to_thread(self.client.stream_get_listen_key)
+                    async with session.ws_connect(f"{self.base_url}/ws/{listen_key}", heartbeat=20) as ws:
+                        self.log("Stream de la cuenta conectado.")
+                        backoff = 1
+                        await asyncio.to_thread(self.reconcile)
+                        await self._consume(ws, listen_key, stop_event)
+                    if not stop_event.is_set():
+                        self.log("⚠️ Stream de la cuenta cerrado.")
+                except Exception as e:
+                    self.log(f"⚠️ Stream de la cuenta desconectado: {e}")
+
+                if listen_key is not None and stop_event.is_set():
+                    try:
+                        await asyncio.to_thread(self.client.stream_close, listen_key)
+                    except Exception:
+                        pass
+                if stop_event.is_set():
+                    break
+                delay = backoff + random.uniform(0, backoff / 2)
+                await _sleep_unless_stopped(delay, stop_event)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    async def _consume(self, ws, listen_key, stop_event):
+        async def close_on_stop():
+            await _sleep_unless_stopped(float("inf"), stop_event)
+            await ws.close()
+
+        async def maintain():
+            # Keepalive del listen key y reconciliación periódica por REST
+            last_keepalive = last_reconcile = time.monotonic()
+            while not stop_event.is_set():
+                await _sleep_unless_stopped(min(self.keepalive_seconds, self.reconcile_seconds), stop_event)
+                now = time.monotonic()
+                try:
+                    if now - last_keepalive >= self.keepalive_seconds:
+                        await asyncio.to_thread(self.client.stream_keepalive, listen_key)
+                        last_keepalive = now
+                    if now - last_reconcile >= self.reconcile_seconds:
+                        await asyncio.to_thread(self.reconcile)
+                        last_reconcile = now
+                except Exception as e:
+                    self.log(f"⚠️ Error al mantener el stream de la cuenta: {e}")
+
+        tasks = [asyncio.create_task(close_on_stop()), asyncio.create_task(maintain())]
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                try:
+                    event = json.loads(msg.data)
+                    if event.get('e') == 'listenKeyExpired':
+                        self.log("⚠️ Listen key vencido, reconectando...")
+                        break
+                    self.apply(event)
+                except (ValueError, KeyError) as e:
+                    self.log(f"⚠️ Evento de cuenta inválido: {e}")
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            for task in tasks:
+                task.cancel()
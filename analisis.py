@@ -1,112 +1,502 @@
 # analisis.py
+import io
+import json
+import os
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+import matplotlib.style as mstyle
 import matplotlib.ticker as mticker
+from matplotlib.figure import Figure
+
+from logger import trade_log_files
 
 BINANCE_YELLOW = "#F0B90B"
 DARK_BG = "#2B2B2B"
 DARK_TEXT = "#EAECEE"
 
-def analizar_trades_para_gui(archivo_csv='trades.csv', dark_mode=False):
+# Tolerancia relativa al emparejar: tramos más chicos son restos de redondeo del cumsum
+EPSILON_RELATIVO = 1e-9
+# Filas del resumen de texto: con millones de operaciones no tiene sentido listarlas todas
+FILAS_RESUMEN = 100
+
+def emparejar_trades_fifo(df):
+    """
+    Empareja compras y ventas por símbolo en orden FIFO, admitiendo ventas
+    parciales, compras sin venta y símbolos intercalados.
+
+    Las ventas sin posición abierta (o la parte que excede la posición) se
+    ignoran. Sobre cada símbolo, las compras y las ventas se ven como intervalos
+    consecutivos de cantidad acumulada; cada tramo donde un intervalo de
+    compra se solapa con uno de venta es una porción emparejada. Todo se
+    calcula con cumsum/searchsorted/bincount sobre el DataFrame completo,
+    sin recorrer filas en Python.
+
+    Devuelve (cerrados, abiertos):
+      - cerrados: una fila por venta con symbol, fecha_cierre, cantidad
+        emparejada, pnl_operacion y pnl_acumulado (ordenado por fecha).
+      - abiertos: las compras con cantidad pendiente de vender (symbol,
+        timestamp, quantity, precio_unitario), en orden FIFO.
+    """
+    df = df.reset_index(drop=True)
+    es_compra = (df['action'] == 'BUY').to_numpy()
+    es_venta = (df['action'] == 'SELL').to_numpy()
+    cantidad = df['quantity'].to_numpy(dtype=np.float64)
+    precio = df['price'].to_numpy(dtype=np.float64)
+    cost = df['cost'].to_numpy(dtype=np.float64)
+    revenue = df['revenue'].to_numpy(dtype=np.float64)
+
+    # Precio unitario efectivo: lo pagado/cobrado de verdad si está registrado
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unit_compra = np.where(cost > 0, cost / cantidad, precio)
+        unit_venta = np.where(revenue > 0, revenue / cantidad, precio)
+
+    simbolos, codigo = np.unique(df['symbol'].to_numpy(dtype=str), return_inverse=True)
+    idx_compras = np.flatnonzero(es_compra)
+    idx_ventas = np.flatnonzero(es_venta)
+    # Orden estable por símbolo: dentro de cada uno se conserva el orden del archivo (FIFO)
+    idx_compras = idx_compras[np.argsort(codigo[idx_compras], kind='stable')]
+    idx_ventas = idx_ventas[np.argsort(codigo[idx_ventas], kind='stable')]
+
+    # Una venta solo puede cerrar lo comprado antes que ella: se recorta a la
+    # posición abierta en ese momento (posición = cumsum con piso en cero,
+    # que es c - min(0, mínimo acumulado de c) dentro de cada símbolo)
+    delta = pd.Series(np.where(es_compra, cantidad, np.where(es_venta, -cantidad, 0.0)))
+    por_simbolo = delta.groupby(codigo)
+    c = por_simbolo.cumsum()
+    posicion = c - np.minimum(0.0, c.groupby(codigo).cummin())
+    posicion_previa = posicion.groupby(codigo).shift(fill_value=0.0)
+    venta_efectiva = (posicion_previa - posicion).to_numpy()
+
+    q_compra = cantidad[idx_compras]
+    q_venta = venta_efectiva[idx_ventas]
+    total_compra = np.bincount(codigo[idx_compras], weights=q_compra, minlength=len(simbolos))
+    total_venta = np.bincount(codigo[idx_ventas], weights=q_venta, minlength=len(simbolos))
+
+    # Cada símbolo ocupa su propio tramo del eje de cantidades para no mezclarse
+    tramo = np.maximum(total_compra, total_venta)
+    offset = np.concatenate(([0.0], np.cumsum(tramo)[:-1]))
+    fin_emparejado = offset + np.minimum(total_compra, total_venta)
+
+    fin_compras = _acumulado_por_grupo(q_compra, codigo[idx_compras], offset)
+    fin_ventas = _acumulado_por_grupo(q_venta, codigo[idx_ventas], offset)
+
+    cortes = np.unique(np.concatenate((fin_compras, fin_ventas, offset, fin_emparejado)))
+    tolerancia = EPSILON_RELATIVO * max(1.0, cortes[-1])
+    inicio, fin = cortes[:-1], cortes[1:]
+    medio = (inicio + fin) / 2
+    simbolo_tramo = np.searchsorted(offset, medio, side='right') - 1
+    valido = (medio < fin_emparejado[simbolo_tramo]) & (fin - inicio > tolerancia)
+    medio, q_tramo = medio[valido], (fin - inicio)[valido]
+
+    compra_tramo = np.searchsorted(fin_compras, medio)
+    venta_tramo = np.searchsorted(fin_ventas, medio)
+    pnl_tramo = q_tramo * (unit_venta[idx_ventas[venta_tramo]] - unit_compra[idx_compras[compra_tramo]])
+
+    # Resultado por venta
+    pnl_venta = np.bincount(venta_tramo, weights=pnl_tramo, minlength=len(idx_ventas))
+    q_emparejada = np.bincount(venta_tramo, weights=q_tramo, minlength=len(idx_ventas))
+    con_pareja = q_emparejada > tolerancia
+    filas = idx_ventas[con_pareja]
+    cerrados = pd.DataFrame({
+        'symbol': df['symbol'].to_numpy()[filas],
+        'fecha_cierre': df['timestamp'].to_numpy()[filas],
+        'cantidad': q_emparejada[con_pareja],
+        'pnl_operacion': pnl_venta[con_pareja],
+    })
+    cerrados = cerrados.sort_values('fecha_cierre', kind='stable').reset_index(drop=True)
+    cerrados['pnl_acumulado'] = cerrados['pnl_operacion'].cumsum()
+
+    # Lo que queda sin vender de cada compra
+    q_vendida = np.bincount(compra_tramo, weights=q_tramo, minlength=len(idx_compras))
+    pendiente = q_compra - q_vendida
+    abierta = pendiente > tolerancia
+    filas = idx_compras[abierta]
+    abiertos = pd.DataFrame({
+        'symbol': df['symbol'].to_numpy()[filas],
+        'timestamp': df['timestamp'].to_numpy()[filas],
+        'quantity': pendiente[abierta],
+        'precio_unitario': unit_compra[filas],
+    })
+    return cerrados, abiertos
+
+def _acumulado_por_grupo(cantidades, grupos, offset):
+    """Cantidad acumulada al final de cada fila dentro de su grupo, desplazada por el offset del grupo."""
+    acumulado = np.cumsum(cantidades)
+    if len(cantidades) == 0:
+        return acumulado
+    # Restar lo acumulado por los grupos anteriores (las filas vienen agrupadas)
+    inicio_grupo = np.flatnonzero(np.concatenate(([True], grupos[1:] != grupos[:-1])))
+    base = np.repeat(acumulado[inicio_grupo] - cantidades[inicio_grupo],
+                     np.diff(np.append(inicio_grupo, len(cantidades))))
+    return acumulado - base + offset[grupos]
+
+def leer_trades(archivo_csv='trades.csv'):
+    """
+    Lee el CSV de operaciones con tipos fijos (más rápido que dejar que pandas
+    los adivine), junto con los CSV por bot del supervisor (trades_<bot>.csv).
+    """
+    archivos = trade_log_files(archivo_csv)
+    if not archivos:
+        raise FileNotFoundError(archivo_csv)
+    df = pd.concat([pd.read_csv(a, dtype=TIPOS_CSV) for a in archivos], ignore_index=True)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+    return df.sort_values('timestamp', kind='stable', ignore_index=True)
+
+# --- Análisis incremental ---
+# El resultado del análisis se guarda junto al CSV (<archivo>.analisis.npz)
+# con la posición hasta donde se leyó y los agregados acumulados. La próxima
+# vez solo se parsean las filas agregadas desde entonces.
+
+TIPOS_CSV = {'action': str, 'symbol': str, 'price': np.float64, 'quantity': np.float64,
+             'cost': np.float64, 'revenue': np.float64, 'pnl': np.float64}
+# Bytes del comienzo del archivo que identifican el CSV; si cambian, se rotó
+BYTES_HUELLA = 256
+VERSION_CACHE = 1
+
+def _ruta_cache(archivo_csv):
+    return archivo_csv + ".analisis.npz"
+
+def _cache_vacia(huella):
+    return {
+        'version': VERSION_CACHE, 'offset': 0, 'huella': huella, 'filas': 0,
+        'pnl_total': 0.0, 'pico': 0.0, 'max_drawdown': 0.0, 'ganadoras': 0, 'perdedoras': 0,
+        'cerrados': pd.DataFrame({'symbol': np.array([], dtype=str),
+                                  'fecha_cierre': np.array([], dtype='datetime64[ns]'),
+                                  'cantidad': np.array([], dtype=np.float64),
+                                  'pnl_operacion': np.array([], dtype=np.float64),
+                                  'pnl_acumulado': np.array([], dtype=np.float64)}),
+        'abiertos': pd.DataFrame({'symbol': np.array([], dtype=str),
+                                  'timestamp': np.array([], dtype='datetime64[ns]'),
+                                  'quantity': np.array([], dtype=np.float64),
+                                  'precio_unitario': np.array([], dtype=np.float64)}),
+    }
+
+def _cargar_cache(archivo_csv):
+    try:
+        with np.load(_ruta_cache(archivo_csv)) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != VERSION_CACHE:
+                return None
+            meta['cerrados'] = pd.DataFrame({c: data['cerrados_' + c] for c in
+                                             ('symbol', 'fecha_cierre', 'cantidad', 'pnl_operacion', 'pnl_acumulado')})
+            meta['abiertos'] = pd.DataFrame({c: data['abiertos_' + c] for c in
+                                             ('symbol', 'timestamp', 'quantity', 'precio_unitario')})
+            return meta
+    except (OSError, KeyError, ValueError):
+        return None
+
+def _guardar_cache(archivo_csv, cache):
+    meta = {k: v for k, v in cache.items() if k not in ('cerrados', 'abiertos')}
+    arrays = {'meta': np.array(json.dumps(meta))}
+    for nombre in ('cerrados', 'abiertos'):
+        for columna, serie in cache[nombre].items():
+            valores = serie.to_numpy()
+            if valores.dtype == object:
+                valores = valores.astype(str)
+            elif np.issubdtype(valores.dtype, np.datetime64):
+                valores = valores.astype('datetime64[ns]')
+            arrays[f'{nombre}_{columna}'] = valores
+    tmp = _ruta_cache(archivo_csv) + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, _ruta_cache(archivo_csv))
+
+def analisis_incremental(archivo_csv='trades.csv'):
+    """
+    Devuelve el análisis completo del CSV (operaciones cerradas, compras
+    abiertas, PnL total, pico de equity, máximo drawdown, ganadoras y
+    perdedoras) leyendo solo lo que se agregó desde la última llamada.
+
+    Las compras que quedaron abiertas se anteponen a las filas nuevas para
+    seguir emparejando en orden FIFO. Si el archivo se truncó o se rotó (su
+    comienzo ya no coincide) el análisis se reconstruye desde cero.
+    """
+    with open(archivo_csv, 'rb') as f:
+        huella = f.read(BYTES_HUELLA)
+        f.seek(0, os.SEEK_END)
+        tamano = f.tell()
+
+        huella_hex = huella.hex()
+        cache = _cargar_cache(archivo_csv)
+        if (cache is None or tamano < cache['offset'] or
+                not huella_hex.startswith(cache['huella']) and not cache['huella'].startswith(huella_hex)):
+            cache = _cache_vacia(huella_hex)
+        elif len(cache['huella']) < len(huella_hex):
+            cache['huella'] = huella_hex  # El archivo creció: la huella puede ser más larga
+
+        if cache['offset'] == 0:
+            f.seek(0)
+            cabecera = f.readline()
+            cache['offset'] = len(cabecera)
+        f.seek(cache['offset'])
+        nuevo = f.read()
+
+    # Solo líneas completas: la última puede estar a medio escribir
+    fin = nuevo.rfind(b"\n") + 1
+    if fin == 0:
+        return cache
+    columnas = ",".join(["timestamp", "action", "symbol", "price", "quantity", "cost", "revenue", "pnl"])
+    df = pd.read_csv(io.BytesIO(columnas.encode() + b"\n" + nuevo[:fin]), dtype=TIPOS_CSV)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+    cache['offset'] += fin
+    cache['filas'] += len(df)
+
+    # Las compras abiertas de la pasada anterior van primero (son las más viejas)
+    abiertos = cache['abiertos']
+    previas = pd.DataFrame({
+        'timestamp': abiertos['timestamp'], 'action': 'BUY', 'symbol': abiertos['symbol'],
+        'price': abiertos['precio_unitario'], 'quantity': abiertos['quantity'],
+        'cost': abiertos['quantity'] * abiertos['precio_unitario'], 'revenue': np.nan, 'pnl': np.nan,
+    })
+    cerrados, cache['abiertos'] = emparejar_trades_fifo(pd.concat([previas, df], ignore_index=True))
+
+    if not cerrados.empty:
+        pnl = cerrados['pnl_operacion'].to_numpy()
+        equity = cache['pnl_total'] + np.cumsum(pnl)
+        pico = np.maximum.accumulate(np.maximum(equity, cache['pico']))
+        cerrados['pnl_acumulado'] = equity
+        cache['pnl_total'] = float(equity[-1])
+        cache['pico'] = float(pico[-1])
+        cache['max_drawdown'] = max(cache['max_drawdown'], float(np.max(pico - equity)))
+        cache['ganadoras'] += int(np.count_nonzero(pnl > 0))
+        cache['perdedoras'] += int(np.count_nonzero(pnl < 0))
+        cache['cerrados'] = pd.concat([cache['cerrados'], cerrados], ignore_index=True) if len(cache['cerrados']) else cerrados
+
+    try:
+        _guardar_cache(archivo_csv, cache)
+    except OSError:
+        pass  # Sin cache el análisis sigue siendo correcto, solo más lento la próxima vez
+    return cache
+
+def analisis_combinado(archivo_csv='trades.csv'):
+    """
+    Análisis de 'archivo_csv' y de los CSV por bot que escribe el supervisor
+    (trades_<bot>.csv, ver logger.trade_log_files). Las compras y ventas de
+    un bot quedan siempre en su archivo, así que cada uno se analiza con
+    analisis_incremental y su propio checkpoint; después se unen las
+    operaciones cerradas por fecha de cierre y se recalculan la curva y el
+    drawdown. 'checkpoint' es el archivo cuya cache guarda lo combinado.
+    """
+    archivos = trade_log_files(archivo_csv)
+    if not archivos:
+        raise FileNotFoundError(archivo_csv)
+    partes = [analisis_incremental(a) for a in archivos]
+    if len(partes) == 1:
+        return dict(partes[0], archivos=archivos, checkpoint=(archivos[0], partes[0]))
+
+    cerrados = pd.concat([p['cerrados'] for p in partes], ignore_index=True)
+    cerrados = cerrados.sort_values('fecha_cierre', kind='stable', ignore_index=True)
+    equity = np.cumsum(cerrados['pnl_operacion'].to_numpy())
+    pico = np.maximum.accumulate(np.maximum(equity, 0.0))
+    cerrados['pnl_acumulado'] = equity
+    return {
+        'filas': sum(p['filas'] for p in partes),
+        'pnl_total': float(equity[-1]) if len(equity) else 0.0,
+        'pico': float(pico[-1]) if len(pico) else 0.0,
+        'max_drawdown': float(np.max(pico - equity)) if len(equity) else 0.0,
+        'ganadoras': sum(p['ganadoras'] for p in partes),
+        'perdedoras': sum(p['perdedoras'] for p in partes),
+        'cerrados': cerrados,
+        'abiertos': pd.concat([p['abiertos'] for p in partes], ignore_index=True),
+        'archivos': archivos,
+        'checkpoint': (archivos[0], partes[0]),
+    }
+
+# Puntos que se dibujan como máximo en la curva de PnL; el resto se reduce con LTTB
+PUNTOS_GRAFICO = 2000
+# Remuestreos de Monte Carlo cuando se piden en el resumen (robustez.py permite muchos más desde la consola)
+REMUESTREOS_RESUMEN = 2000
+
+class AnalisisCancelado(Exception):
+    """Se pidió cancelar el análisis antes de que terminara."""
+
+def reducir_lttb(x, y, puntos=PUNTOS_GRAFICO):
+    """
+    Reduce la serie (x, y) a 'puntos' puntos con Largest-Triangle-Three-Buckets.
+
+    Conserva el primero y el último, y de cada tramo intermedio elige el punto
+    que forma el triángulo más grande con el elegido en el tramo anterior y el
+    promedio del siguiente, así que los picos y valles de la curva se
+    mantienen. Devuelve los índices elegidos (ordenados), para poder aplicarlos
+    también a otras columnas. Si la serie ya es corta devuelve todos.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if puntos >= n or puntos < 3:
+        return np.arange(n)
+
+    # Límites de los tramos sin contar el primer y el último punto
+    bordes = (np.arange(puntos - 1) * ((n - 2) / (puntos - 2))).astype(np.int64) + 1
+    bordes[-1] = n - 1
+    inicios, fines = bordes[:-1], bordes[1:]
+    tamanos = fines - inicios
+    media_x = np.add.reduceat(x[1:n - 1], inicios - 1) / tamanos
+    media_y = np.add.reduceat(y[1:n - 1], inicios - 1) / tamanos
+    # El "siguiente promedio" del último tramo es el punto final
+    media_x = np.append(media_x[1:], x[-1])
+    media_y = np.append(media_y[1:], y[-1])
+
+    elegidos = np.empty(puntos, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, n - 1
+    a = 0
+    for i in range(puntos - 2):
+        xs = x[inicios[i]:fines[i]]
+        ys = y[inicios[i]:fines[i]]
+        # El doble del área alcanza para comparar
+        area = np.abs((x[a] - media_x[i]) * (ys - y[a]) - (x[a] - xs) * (media_y[i] - y[a]))
+        a = inicios[i] + int(np.argmax(area))
+        elegidos[i + 1] = a
+    return elegidos
+
+def _robustez(analisis, remuestreos, capital, etapa):
+    """Resumen de Monte Carlo de las operaciones cerradas, desde el checkpoint si sigue vigente."""
+    from robustez import monte_carlo, resumen_monte_carlo  # Trae el optimizador: solo si se pide
+
+    archivo_csv, cache = analisis['checkpoint']
+    clave = {'filas': analisis['filas'], 'archivos': analisis['archivos'], 'remuestreos': remuestreos,
+             'capital': capital}
+    guardado = cache.get('robustez')
+    if guardado is None or guardado['clave'] != clave:
+        etapa(0.55, "Remuestreando operaciones...")
+        # En este proceso: la GUI empaquetada no puede lanzar un pool desde un hilo de fondo.
+        # etapa() entre bloques permite cancelar
+        resultado = monte_carlo(analisis['cerrados'], remuestreos, capital=capital, workers=1,
+                                progreso=lambda f: etapa(0.55 + 0.05 * f, "Remuestreando operaciones..."))
+        cache['robustez'] = guardado = {'clave': clave, 'resultado': resultado}
+        try:
+            _guardar_cache(archivo_csv, cache)
+        except OSError:
+            pass
+    return resumen_monte_carlo(guardado['resultado'])
+
+def analizar_trades_para_gui(archivo_csv='trades.csv', dark_mode=False, progreso=None, cancelar=None,
+                             nueva_figura=None, capital=None, remuestreos=0):
     """
     Lee el archivo de trades, calcula el PnL y devuelve un gráfico y un resumen en texto.
-    Acepta un parámetro dark_mode para ajustar los colores del gráfico.
+    Acepta un parámetro dark_mode para ajustar los colores del gráfico. Con
+    remuestreos > 0 el resumen incluye las bandas de robustez.monte_carlo
+    partiendo de 'capital'; el resultado se guarda con el checkpoint
+    incremental y solo se recalcula si llegaron operaciones nuevas.
+
+    Puede ejecutarse en un hilo de fondo: la figura se crea con
+    matplotlib.figure.Figure (sin pyplot, que no es seguro entre hilos),
+    progreso(fraccion, texto) se llama entre etapas y si el threading.Event
+    'cancelar' se activa se lanza AnalisisCancelado. La curva se reduce a
+    PUNTOS_GRAFICO puntos con reducir_lttb para que dibujarla sea inmediato.
     """
+    def etapa(fraccion, texto):
+        if cancelar is not None and cancelar.is_set():
+            raise AnalisisCancelado()
+        if progreso:
+            progreso(fraccion, texto)
+
     output_summary = []
-    
+
+    etapa(0.0, "Leyendo operaciones...")
     try:
-        df = pd.read_csv(archivo_csv)
+        analisis = analisis_combinado(archivo_csv)
     except FileNotFoundError:
         return None, f"Error: No se encontró el archivo '{archivo_csv}'."
 
-    if df.empty or len(df) < 2:
+    if analisis['filas'] < 2:
         return None, "No hay suficientes datos en trades.csv para generar un análisis."
 
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    trades_completados = []
-    pnl_total = 0
-
-    for i in range(0, len(df) - 1, 2):
-        if i + 1 < len(df):
-            compra = df.iloc[i]
-            venta = df.iloc[i+1]
-            if compra['action'] == 'BUY' and venta['action'] == 'SELL':
-                costo_total = compra['cost']
-                ingreso_total = venta['price'] * compra['quantity']
-                pnl_operacion = ingreso_total - costo_total
-                pnl_total += pnl_operacion
-                trades_completados.append({
-                    'fecha_cierre': venta['timestamp'],
-                    'pnl_operacion': pnl_operacion,
-                    'pnl_acumulado': pnl_total
-                })
-
-    if not trades_completados:
-        return None, "No se encontraron operaciones completadas (pares de compra/venta)."
+    df_resultados, abiertos = analisis['cerrados'], analisis['abiertos']
 
-    df_resultados = pd.DataFrame(trades_completados)
+    if df_resultados.empty:
+        return None, "No se encontraron operaciones completadas (pares de compra/venta)."
 
+    etapa(0.5, "Preparando resumen...")
     output_summary.append("--- Resumen de Operaciones ---")
-    output_summary.append(df_resultados[['fecha_cierre', 'pnl_operacion', 'pnl_acumulado']].round(4).to_string())
+    if len(analisis['archivos']) > 1:
+        output_summary.append(f"Archivos: {', '.join(os.path.basename(a) for a in analisis['archivos'])}")
+    if len(df_resultados) > FILAS_RESUMEN:
+        output_summary.append(f"(Mostrando las últimas {FILAS_RESUMEN} de {len(df_resultados)} operaciones)")
+    output_summary.append(df_resultados[['symbol', 'fecha_cierre', 'pnl_operacion', 'pnl_acumulado']].tail(FILAS_RESUMEN).round({'pnl_operacion': 4, 'pnl_acumulado': 4}).to_string())
     output_summary.append(f"\n\nResultado Final (PnL Total): {df_resultados['pnl_acumulado'].iloc[-1]:.4f} USDT")
+    output_summary.append(f"Ganadoras: {analisis['ganadoras']} | Perdedoras: {analisis['perdedoras']} | Máximo drawdown: {analisis['max_drawdown']:.4f} USDT")
+    if not abiertos.empty:
+        output_summary.append(f"Posiciones abiertas: {len(abiertos)} compras con {abiertos['quantity'].sum():.8f} unidades sin vender.")
+
+    if remuestreos:
+        output_summary.append("\n" + _robustez(analisis, remuestreos, capital, etapa))
+
+    etapa(0.6, "Reduciendo la curva de PnL...")
+    fechas = df_resultados['fecha_cierre'].to_numpy(dtype='datetime64[ns]')
+    pnl_acumulado = df_resultados['pnl_acumulado'].to_numpy(dtype=np.float64)
+    idx = reducir_lttb(fechas.astype(np.int64), pnl_acumulado)
+    reducida = len(idx) < len(fechas)
+    fechas, pnl_acumulado = fechas[idx], pnl_acumulado[idx]
 
     # --- Graficar los resultados ---
+    etapa(0.8, "Generando gráfico...")
+    nueva_figura = nueva_figura or Figure
     if dark_mode:
-        plt.style.use('dark_background')
-        fig, ax = plt.subplots(figsize=(12, 7), facecolor=DARK_BG)
-        ax.set_facecolor("#1C1C1C")
+        estilo = 'dark_background'
+        figsize, facecolor = (12, 7), DARK_BG
         main_color = BINANCE_YELLOW
         text_color = DARK_TEXT
         pnl_pos_color = '#2E7D32' # Verde oscuro
         pnl_neg_color = '#C62828' # Rojo oscuro
         grid_color = '#424242'
     else:
-        plt.style.use('ggplot')
-        fig, ax = plt.subplots(figsize=(12, 7))
+        estilo = 'ggplot'
+        figsize, facecolor = (12, 7), None
         main_color = 'royalblue'
         text_color = 'black'
         pnl_pos_color = 'green'
         pnl_neg_color = 'red'
         grid_color = None # Estilo por defecto
 
-    ax.plot(df_resultados['fecha_cierre'], df_resultados['pnl_acumulado'], 
-            marker='o', linestyle='-', color=main_color, label='PnL Acumulado')
-
-    ax.fill_between(df_resultados['fecha_cierre'], df_resultados['pnl_acumulado'], 0,
-                    where=(df_resultados['pnl_acumulado'] >= 0), 
-                    facecolor=pnl_pos_color, alpha=0.5, interpolate=True)
-    ax.fill_between(df_resultados['fecha_cierre'], df_resultados['pnl_acumulado'], 0,
-                    where=(df_resultados['pnl_acumulado'] < 0), 
-                    facecolor=pnl_neg_color, alpha=0.5, interpolate=True)
-    
-    ax.axhline(0, color=text_color, linewidth=0.8, linestyle='--', alpha=0.7)
-    
-    # Formato y etiquetas
-    ax.set_title('Evolución del PnL del Bot de Trading', fontsize=16, color=text_color)
-    ax.set_ylabel('PnL Acumulado (USDT)', fontsize=12, color=text_color)
-    ax.set_xlabel('Fecha de Operación', fontsize=12, color=text_color)
-    
-    ax.tick_params(axis='x', colors=text_color)
-    ax.tick_params(axis='y', colors=text_color)
-    ax.spines['bottom'].set_color(text_color)
-    ax.spines['top'].set_color(text_color) 
-    ax.spines['right'].set_color(text_color)
-    ax.spines['left'].set_color(text_color)
-    if grid_color: ax.grid(color=grid_color)
-
-    formatter = mticker.FormatStrFormatter('$%1.2f')
-    ax.yaxis.set_major_formatter(formatter)
-    
-    fig.autofmt_xdate()
-    fig.tight_layout()
-    legend = ax.legend()
-    plt.setp(legend.get_texts(), color=text_color)
+    with mstyle.context(estilo):
+        fig = nueva_figura(figsize=figsize, facecolor=facecolor)
+        ax = fig.add_subplot()
+        if dark_mode:
+            ax.set_facecolor("#1C1C1C")
 
+        # Con miles de puntos los marcadores tapan la curva
+        ax.plot(fechas, pnl_acumulado, marker=None if reducida else 'o',
+                linestyle='-', color=main_color, label='PnL Acumulado')
+
+        ax.fill_between(fechas, pnl_acumulado, 0,
+                        where=(pnl_acumulado >= 0),
+                        facecolor=pnl_pos_color, alpha=0.5, interpolate=True)
+        ax.fill_between(fechas, pnl_acumulado, 0,
+                        where=(pnl_acumulado < 0),
+                        facecolor=pnl_neg_color, alpha=0.5, interpolate=True)
+
+        ax.axhline(0, color=text_color, linewidth=0.8, linestyle='--', alpha=0.7)
+
+        # Formato y etiquetas
+        ax.set_title('Evolución del PnL del Bot de Trading', fontsize=16, color=text_color)
+        ax.set_ylabel('PnL Acumulado (USDT)', fontsize=12, color=text_color)
+        ax.set_xlabel('Fecha de Operación', fontsize=12, color=text_color)
+
+        ax.tick_params(axis='x', colors=text_color)
+        ax.tick_params(axis='y', colors=text_color)
+        ax.spines['bottom'].set_color(text_color)
+        ax.spines['top'].set_color(text_color)
+        ax.spines['right'].set_color(text_color)
+        ax.spines['left'].set_color(text_color)
+        if grid_color: ax.grid(color=grid_color)
+
+        formatter = mticker.FormatStrFormatter('$%1.2f')
+        ax.yaxis.set_major_formatter(formatter)
+
+        fig.autofmt_xdate()
+        fig.tight_layout()
+        legend = ax.legend()
+        for text in legend.get_texts():
+            text.set_color(text_color)
+
+    etapa(1.0, "Análisis listo.")
     return fig, "\n".join(output_summary)
 
 def analizar_trades(archivo_csv='trades.csv'):
     """Función original que muestra el gráfico y el resumen en la consola."""
-    fig, summary = analizar_trades_para_gui(archivo_csv, dark_mode=False)
+    import matplotlib.pyplot as plt  # Solo la versión de consola necesita pyplot y su backend
+
+    fig, summary = analizar_trades_para_gui(archivo_csv, dark_mode=False, nueva_figura=plt.figure)
     if fig:
         print(summary)
         plt.show()
@@ -0,0 +1,214 @@
+# backtest.py
+import csv
+import math
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+from config import INTERVAL_MS, load_config
+
+# Columnas del array OHLCV (mismo orden que devuelve client.get_klines)
+OPEN_TIME, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6)
+OHLCV_COLUMNS = ["open_time", "open", "high", "low", "close", "volume"]
+
+# Mismas columnas que escribe logger.log_trade
+TRADE_COLUMNS = ["timestamp", "action", "symbol", "price", "quantity", "cost", "revenue", "pnl"]
+
+# Reglas de trading por defecto (BTCUSDT) si no se pasan las del símbolo
+DEFAULT_STEP_SIZE = 0.00001
+DEFAULT_MIN_NOTIONAL = 5.0
+
+
+def klines_to_array(klines):
+    """Convierte la respuesta de client.get_klines en un array OHLCV (n, 6) de float64."""
+    return np.array([[float(v) for v in k[:6]] for k in klines], dtype=np.float64).reshape(-1, 6)
+
+
+def load_ohlcv(path, mmap_mode=None):
+    """
+    Carga velas (n, 6) de un .npy o de un .npz por columnas (el formato de
+    downloader.py: open_time, open, high, low, close, volume).
+    """
+    data = np.load(path, mmap_mode=mmap_mode)
+    if not isinstance(data, np.lib.npyio.NpzFile):
+        return data
+    with data:
+        return np.column_stack([data[name].astype(np.float64) for name in OHLCV_COLUMNS]).reshape(-1, 6)
+
+
+def resample_ohlcv(ohlcv, interval):
+    """
+    Agrupa velas de un intervalo menor (p. ej. 1m) en velas de 'interval'.
+    Las velas de entrada deben estar ordenadas por open_time.
+    """
+    ohlcv = np.asarray(ohlcv, dtype=np.float64)
+    if len(ohlcv) == 0:
+        return ohlcv.reshape(0, 6)
+    buckets = np.floor(ohlcv[:, OPEN_TIME] / INTERVAL_MS[interval])
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.concatenate((starts[1:], [len(ohlcv)])) - 1
+    out = np.empty((len(starts), 6), dtype=np.float64)
+    out[:, OPEN_TIME] = buckets[starts] * INTERVAL_MS[interval]
+    out[:, OPEN] = ohlcv[starts, OPEN]
+    out[:, HIGH] = np.maximum.reduceat(ohlcv[:, HIGH], starts)
+    out[:, LOW] = np.minimum.reduceat(ohlcv[:, LOW], starts)
+    out[:, CLOSE] = ohlcv[ends, CLOSE]
+    out[:, VOLUME] = np.add.reduceat(ohlcv[:, VOLUME], starts)
+    return out
+
+
+def moving_average(closes, window):
+    """Media móvil simple de cada vela; las primeras window-1 quedan en NaN."""
+    # Restar el primer cierre antes del cumsum reduce el error de redondeo en
+    # series largas y no cambia la comparación entre dos medias.
+    shifted = closes - closes[0]
+    csum = np.concatenate(([0.0], np.cumsum(shifted)))
+    ma = np.full(len(closes), np.nan)
+    if len(closes) >= window:
+        ma[window - 1:] = (csum[window:] - csum[:-window]) / window
+    return ma
+
+
+def crossover_buy_signals(closes, fast, slow):
+    """
+    Índices de las velas donde MovingAverageCrossover.should_buy da True si la
+    lista de cierres termina en esa vela.
+    """
+    # Import local: strategy importa las constantes de columnas de este módulo
+    from strategy import exact_moving_averages, near_tie
+
+    closes = np.asarray(closes, dtype=np.float64)
+    ma_fast = moving_average(closes, fast)
+    ma_slow = moving_average(closes, slow)
+    ties = np.flatnonzero(near_tie(ma_fast, ma_slow))
+    exact_moving_averages(closes, fast, ma_fast, ties)
+    exact_moving_averages(closes, slow, ma_slow, ties)
+    buy = np.zeros(len(closes), dtype=bool)
+    first = max(fast, slow)
+    if len(closes) > first:
+        buy[first:] = (ma_fast[first:] > ma_slow[first:]) & (ma_fast[first - 1:-1] <= ma_slow[first - 1:-1])
+    return np.flatnonzero(buy)
+
+
+def _find_trailing_exit(closes, entry_idx, trailing_stop):
+    """
+    Primer índice posterior a entry_idx donde el cierre cae por debajo del
+    máximo desde la compra * (1 - trailing_stop), igual que Bot.run.
+    Devuelve -1 si el stop no se activa antes del final de la serie.
+    """
+    highest = closes[entry_idx]
+    start = entry_idx + 1
+    chunk = 256
+    n = len(closes)
+    while start < n:
+        window = closes[start:start + chunk]
+        highs = np.maximum.accumulate(np.maximum(window, highest))
+        hits = np.flatnonzero(window < highs * (1 - trailing_stop))
+        if hits.size:
+            return start + int(hits[0])
+        highest = highs[-1]
+        start += chunk
+        chunk *= 2  # Ventanas crecientes: las posiciones largas no cuestan O(n²)
+    return -1
+
+
+def _timestamp(ms):
+    """Mismo formato que datetime.utcnow().isoformat() en logger.log_trade."""
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+def run_backtest(ohlcv, cfg=None, step_size=DEFAULT_STEP_SIZE, min_notional=DEFAULT_MIN_NOTIONAL,
+                 initial_balance=None, fee=0.0):
+    """
+    Reproduce la lógica de Bot.run sobre un histórico OHLCV.
+
+    Cada vela cerrada equivale a una pasada del bucle: compra en el cruce de
+    medias con usdt_amount * risk (redondeado a step_size y filtrado por
+    min_notional) y vende cuando el cierre cae por debajo del trailing stop.
+    Las señales y el trailing stop se calculan con NumPy sobre toda la serie;
+    el único bucle en Python es por operación, no por vela.
+
+    Devuelve una lista de diccionarios con el esquema de logger.log_trade.
+    """
+    cfg = cfg or load_config()
+    ohlcv = np.asarray(ohlcv, dtype=np.float64)
+    closes = np.ascontiguousarray(ohlcv[:, CLOSE])
+    # El bot decide al cierre de la vela: se registra la hora de cierre
+    times = ohlcv[:, OPEN_TIME] + INTERVAL_MS.get(cfg["interval"], 0)
+
+    symbol = cfg["symbol"]
+    capital_to_risk = cfg["usdt_amount"] * cfg["risk"]
+    trailing_stop = cfg["trailing_stop"]
+    usdt_balance = cfg["usdt_amount"] if initial_balance is None else initial_balance
+
+    entries = crossover_buy_signals(closes, cfg["ma_fast"], cfg["ma_slow"])
+    trades = []
+    pos = 0
+    while pos < len(entries):
+        i = int(entries[pos])
+        price = closes[i]
+        if usdt_balance < capital_to_risk:
+            # Sin fondos no habrá más compras: el saldo solo cambia al vender
+            break
+        adjusted_qty = math.floor(capital_to_risk / price / step_size) * step_size
+        if adjusted_qty * price < min_notional:
+            pos += 1
+            continue
+
+        cost = adjusted_qty * price * (1 + fee)
+        entry_price = cost / adjusted_qty
+        usdt_balance -= cost
+        trades.append(dict(timestamp=_timestamp(times[i]), action="BUY", symbol=symbol,
+                           price=entry_price, quantity=adjusted_qty, cost=cost, revenue=None, pnl=None))
+
+        j = _find_trailing_exit(closes, i, trailing_stop)
+        if j < 0:
+            break  # Posición abierta al final del histórico
+        revenue = adjusted_qty * closes[j] * (1 - fee)
+        pnl = revenue - entry_price * adjusted_qty
+        usdt_balance += revenue
+        trades.append(dict(timestamp=_timestamp(times[j]), action="SELL", symbol=symbol,
+                           price=revenue / adjusted_qty, quantity=adjusted_qty, cost=None, revenue=revenue, pnl=pnl))
+
+        # Tras la venta el bot vuelve a buscar cruces a partir de la vela siguiente
+        pos = int(np.searchsorted(entries, j, side="right"))
+
+    return trades
+
+
+def summarize(trades):
+    """PnL total, máximo drawdown (sobre el PnL realizado) y cantidad de operaciones cerradas."""
+    pnls = np.array([t["pnl"] for t in trades if t["action"] == "SELL"], dtype=np.float64)
+    if pnls.size == 0:
+        return {"pnl": 0.0, "max_drawdown": 0.0, "trades": 0, "win_rate": 0.0}
+    equity = np.cumsum(pnls)
+    peak = np.maximum.accumulate(np.maximum(equity, 0.0))
+    return {
+        "pnl": float(equity[-1]),
+        "max_drawdown": float(np.max(peak - equity)),
+        "trades": int(pnls.size),
+        "win_rate": float(np.mean(pnls > 0)),
+    }
+
+
+def save_trades_csv(trades, archivo_csv="backtest_trades.csv"):
+    """Escribe las operaciones con el mismo formato que trades.csv para analisis.py."""
+    with open(archivo_csv, mode='w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(TRADE_COLUMNS)
+        for t in trades:
+            writer.writerow([t["timestamp"], t["action"], t["symbol"], t["price"], t["quantity"],
+                             t["cost"] or "", t["revenue"] or "", t["pnl"] or ""])
+
+
+if __name__ == "__main__":
+    # Uso: python backtest.py velas.npy|velas.npz [salida.csv]
+    if len(sys.argv) < 2:
+        print("Uso: python backtest.py velas.npy|velas.npz [salida.csv]")
+        sys.exit(1)
+    trades = run_backtest(load_ohlcv(sys.argv[1]))
+    salida = sys.argv[2] if len(sys.argv) > 2 else "backtest_trades.csv"
+    save_trades_csv(trades, salida)
+    print(summarize(trades))
+    print(f"Operaciones guardadas en {salida}")
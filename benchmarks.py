@@ -0,0 +1,490 @@
+# benchmarks.py
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backtest import CLOSE, OPEN_TIME, TRADE_COLUMNS, _timestamp, crossover_buy_signals, load_ohlcv, run_backtest
+from config import get_default_config
+from downloader import KlineDownloader, serve_klines
+from log_channel import WARNING, LogChannel
+from simulator import SimulatedExchange, run_simulation, synthetic_ohlcv
+from strategy import MovingAverageCrossover
+from streaming import MarketStream, replay_server
+from symbol_rules import SymbolRules
+
+RESULTS_DIR = os.getenv("BENCHMARK_DIR", "benchmark_results")
+# Variación relativa a partir de la cual compare() marca un benchmark como regresión
+REGRESSION_THRESHOLD = 0.10
+
+
+def synthetic_trades(n, symbols=("BTCUSDT",), seed=None):
+    """
+    Operaciones sintéticas (n filas, pares BUY/SELL) con el esquema de
+    logger.log_trade, para medir el análisis con volúmenes crecientes.
+    """
+    rng = np.random.default_rng(seed)
+    pairs = max(1, n // 2)
+    start = datetime(2024, 1, 1)
+    prices = 30000.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, pairs)))
+    exits = prices * (1 + rng.normal(0.0, 0.02, pairs))
+    qty = np.round(10.0 / prices, 5)
+    rows = []
+    for i in range(pairs):
+        symbol = symbols[i % len(symbols)]
+        buy_time = (start + timedelta(hours=2 * i)).isoformat()
+        sell_time = (start + timedelta(hours=2 * i + 1)).isoformat()
+        cost, revenue = prices[i] * qty[i], exits[i] * qty[i]
+        rows.append([buy_time, "BUY", symbol, prices[i], qty[i], cost, "", ""])
+        rows.append([sell_time, "SELL", symbol, exits[i], qty[i], "", revenue, revenue - cost])
+    return rows[:n]
+
+
+def write_trades_csv(path, rows):
+    with open(path, mode='w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(TRADE_COLUMNS)
+        writer.writerows(rows)
+
+
+def measure(func, number=1, repeat=5, setup=None):
+    """
+    Ejecuta func() 'number' veces por ronda durante 'repeat' rondas (con
+    setup() antes de cada ronda, fuera del tiempo) y devuelve los segundos
+    por llamada: la mejor ronda, la mediana y las operaciones por segundo.
+    """
+    rounds = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - started) / number)
+    best = min(rounds)
+    return {"best_s": best, "median_s": statistics.median(rounds),
+            "ops_per_s": 1.0 / best if best > 0 else float("inf"), "number": number, "repeat": repeat}
+
+
+def _quiet_bot(tmp, **kwargs):
+    from main import Bot
+
+    cfg = get_default_config()
+    return Bot(log_queue=LogChannel(maxlen=100, level=WARNING), cfg=cfg,
+               state_file=os.path.join(tmp, "state.json"), **kwargs)
+
+
+# --- Benchmarks ---
+
+def bench_strategy(quick):
+    """should_buy sobre la ventana de 100 cierres del modo polling, update incremental y signals en lote."""
+    ohlcv = synthetic_ohlcv(20_000 if quick else 200_000, seed=1)
+    closes = ohlcv[:, CLOSE]
+    strat = MovingAverageCrossover(10, 50)
+    window = closes[-100:].tolist()
+    results = {"should_buy_100": measure(lambda: strat.should_buy(window), number=2000)}
+
+    def stream():
+        strat.reset()
+        for close in closes:
+            strat.update(close)
+            strat.buy_signal()
+    per_run = measure(stream, repeat=3)
+    results["update_per_candle"] = dict(per_run, best_s=per_run["best_s"] / len(closes),
+                                        median_s=per_run["median_s"] / len(closes),
+                                        ops_per_s=per_run["ops_per_s"] * len(closes))
+    results["signals_batch"] = dict(measure(lambda: strat.signals(closes), repeat=5), candles=len(closes))
+    return results
+
+
+def bench_quantization(quick):
+    """Cálculo de la cantidad de una orden como en Bot._buy_quantity y ajuste al stepSize."""
+    exchange = SimulatedExchange(synthetic_ohlcv(200, seed=2))
+    rules = SymbolRules(exchange.symbol_info)
+    number = 5000 if quick else 50_000
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = _quiet_bot(tmp)
+        bot.rules = rules
+        return {
+            "buy_quantity": measure(lambda: bot._buy_quantity(30123.45, 1000.0), number=number),
+            "quantity": measure(lambda: rules.quantity(0.0033219), number=number),
+            "price_up": measure(lambda: rules.price(30123.456789, up=True), number=number),
+        }
+
+
+def bench_persistence(quick):
+    """Costo de _save_state (forzado y agrupado) y de log_trade (encolar y escribir al disco)."""
+    from logger import TradeLogWriter
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = _quiet_bot(tmp)
+        bot._load_state()
+        state = {"btc_balance": 0.001, "entry_price": 30000.0, "highest_price_since_buy": 30000.0}
+
+        def save(force):
+            state["highest_price_since_buy"] += 0.01
+            bot.state = state
+            bot._save_state(force=force)
+        results["save_state_forced"] = measure(lambda: save(True), number=50 if quick else 200, repeat=3)
+        results["save_state_throttled"] = measure(lambda: save(False), number=10_000, repeat=3)
+        bot.journal.close(bot.state)
+
+        rows = 10_000 if quick else 100_000
+        writer = TradeLogWriter(path=os.path.join(tmp, "trades.csv"))
+        row = ["2024-01-01T00:00:00", "BUY", "BTCUSDT", 30000.0, 0.00033, 9.9, "", ""]
+        results["log_trade_enqueue"] = measure(lambda: writer.write(row), number=rows, repeat=3)
+
+        def flush():
+            for _ in range(rows):
+                writer.write(row)
+            writer.flush()
+        throughput = measure(flush, repeat=3)
+        results["log_trade_to_disk"] = dict(throughput, best_s=throughput["best_s"] / rows,
+                                            median_s=throughput["median_s"] / rows,
+                                            ops_per_s=throughput["ops_per_s"] * rows)
+    return results
+
+
+def bench_analysis(quick):
+    """analizar_trades_para_gui con cantidades crecientes de operaciones, sin cache (frío) y con ella."""
+    try:
+        from analisis import _ruta_cache, analizar_trades_para_gui
+    except ImportError as e:
+        return {"skipped": f"analisis no disponible: {e}"}
+
+    sizes = (1_000, 10_000) if quick else (1_000, 10_000, 100_000, 1_000_000)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            path = os.path.join(tmp, f"trades_{n}.csv")
+            write_trades_csv(path, synthetic_trades(n, symbols=("BTCUSDT", "ETHUSDT"), seed=n))
+
+            def clear_cache():
+                if os.path.exists(_ruta_cache(path)):
+                    os.remove(_ruta_cache(path))
+            repeat = 3 if n < 100_000 else 1
+            results[f"cold_{n}"] = measure(lambda: analizar_trades_para_gui(path), repeat=repeat, setup=clear_cache)
+            results[f"warm_{n}"] = measure(lambda: analizar_trades_para_gui(path), repeat=repeat)
+    return results
+
+
+def bench_simulation(quick):
+    """Bot.run completo contra el exchange simulado; una iteración es una vela de 1h (entrada + trailing)."""
+    candles = 1_000 if quick else 10_000
+    ohlcv = synthetic_ohlcv(candles, seed=3)
+    exchange = None
+
+    def run():
+        nonlocal exchange
+        exchange, _ = run_simulation(ohlcv, {"interval": "1h"})
+    total = measure(run, repeat=3 if quick else 1)
+    iterations = candles - 100  # SimulatedExchange arranca en la vela 100
+    return {
+        "bot_run": dict(total, candles=candles),
+        "iteration": dict(total, best_s=total["best_s"] / iterations, median_s=total["median_s"] / iterations,
+                          ops_per_s=total["ops_per_s"] * iterations, calls_per_iteration=sum(exchange.calls.values()) / iterations),
+    }
+
+
+BENCHMARKS = {
+    "strategy": bench_strategy,
+    "quantization": bench_quantization,
+    "persistence": bench_persistence,
+    "analysis": bench_analysis,
+    "simulation": bench_simulation,
+}
+
+
+# --- Verificaciones ---
+# Rutas que tienen que dar el mismo resultado; cada una devuelve la lista de diferencias encontradas
+
+def check_simulation(quick):
+    """
+    Bot.run contra el exchange simulado y run_backtest sobre las mismas
+    velas tienen que comprar y vender en las mismas velas. Con el trailing
+    stop revisado una vez por vela, el bot lo evalúa al cierre, como el
+    backtest.
+    """
+    ohlcv = synthetic_ohlcv(1_000 if quick else 3_000, "1h", seed=3)
+    _, simulated = run_simulation(ohlcv, {"interval": "1h", "trailing_seconds": 3600})
+    cfg = dict(get_default_config(), interval="1h")
+    # El simulador arranca en la vela 100 con las anteriores como historia
+    start = _timestamp(ohlcv[100, OPEN_TIME])
+    backtest = run_backtest(ohlcv, cfg)
+    first = next((i for i, t in enumerate(backtest) if t["action"] == "BUY" and t["timestamp"] >= start), len(backtest))
+    # El bot opera un segundo después del cierre: se compara hasta el minuto
+    sim = [(t["action"], t["timestamp"][:16]) for t in simulated]
+    ref = [(t["action"], t["timestamp"][:16]) for t in backtest[first:]]
+    if sim == ref:
+        return []
+    mismatch = next((i for i, (a, b) in enumerate(zip(sim, ref)) if a != b), min(len(sim), len(ref)))
+    return [f"{len(sim)} operaciones simuladas vs {len(ref)} del backtest; la primera diferencia es la "
+            f"#{mismatch}: {sim[mismatch] if mismatch < len(sim) else None} vs {ref[mismatch] if mismatch < len(ref) else None}"]
+
+
+def check_strategy(quick):
+    """
+    MovingAverageCrossover: should_buy/should_sell (np.mean) son la referencia;
+    el modo streaming, signals() y crossover_buy_signals tienen que dar las
+    mismas señales vela a vela. Los cierres son caminatas cuantizadas al tick
+    con muchas velas planas, donde las medias empatan y el redondeo decide.
+    """
+    problems = []
+    for seed in range(10 if quick else 30):
+        rng = np.random.default_rng(seed)
+        n = 600
+        tick = rng.choice([0.01, 0.1, 1.0])
+        steps = rng.choice([-1, 0, 0, 0, 1], n) * tick * rng.integers(1, 4, n)
+        closes = np.round((rng.uniform(10, 50_000) + np.cumsum(steps)) / tick) * tick
+        fast, slow = int(rng.integers(2, 15)), int(rng.integers(16, 60))
+        strat = MovingAverageCrossover(fast, slow)
+        batch_buy, batch_sell = strat.signals(closes)
+        backtest_buy = np.zeros(n, dtype=bool)
+        backtest_buy[crossover_buy_signals(closes, fast, slow)] = True
+        for i in range(n):
+            strat.update(closes[i])
+            buy, sell = strat.should_buy(closes[:i + 1]), strat.should_sell(closes[:i + 1])
+            paths = {
+                "buy_signal": (strat.buy_signal(), buy),
+                "sell_signal": (strat.sell_signal(), sell),
+                "signals (compra)": (bool(batch_buy[i]), buy),
+                "signals (venta)": (bool(batch_sell[i]), sell),
+                "crossover_buy_signals": (bool(backtest_buy[i]), buy),
+            }
+            problems += [f"semilla {seed} ({fast}/{slow}), vela {i}: {path} = {got}, referencia {ref}"
+                         for path, (got, ref) in paths.items() if got != ref]
+    return problems
+
+
+def check_downloader(quick):
+    """
+    Una descarga con una ventana caída y luego reanudada con un fin
+    posterior (el "ahora" de la segunda ejecución) tiene que terminar con
+    la serie completa: la última ventana de la primera ejecución quedó
+    corta y hay que volver a pedirla.
+    """
+    from rest_client import RateLimitedClient, RateLimiter
+
+    n = 5_000 if quick else 15_000
+    start = 1_600_000_000_000 // 60_000 * 60_000
+    history = synthetic_ohlcv(n, "1m", start_ms=start, seed=1)
+    server = serve_klines({("BTCUSDT", "1m"): history})
+    url = f"http://127.0.0.1:{server.server_address[1]}/api"
+    limiter = RateLimiter(weight_per_minute=100_000)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            downloader = KlineDownloader(lambda: RateLimitedClient(api_url=url, limiter=limiter), out_dir=tmp,
+                                         workers=4, log=lambda message: None)
+            fetch = downloader._fetch_chunk
+
+            def flaky(job, chunk):
+                if chunk[0] == start + 60_000_000:  # La segunda ventana
+                    raise RuntimeError("ventana caída")
+                return fetch(job, chunk)
+
+            downloader._fetch_chunk = flaky
+            first = downloader.download(["BTCUSDT"], ["1m"], start, start + (n - 500) * 60_000)
+            downloader._fetch_chunk = fetch
+            second = downloader.download(["BTCUSDT"], ["1m"], start, start + n * 60_000)
+            path = second[("BTCUSDT", "1m")]
+            if first[("BTCUSDT", "1m")] is not None or path is None:
+                return [f"resultados inesperados: {first} y luego {second}"]
+            ohlcv = load_ohlcv(path)
+            if len(ohlcv) != n or not np.array_equal(ohlcv[:, OPEN_TIME], history[:, OPEN_TIME]):
+                return [f"{len(ohlcv)} velas tras reanudar, se esperaban {n}"]
+            return []
+    finally:
+        server.shutdown()
+
+
+def check_streaming(quick):
+    """
+    MarketStream sobre streaming.replay_server: cada vela cerrada y cada
+    precio grabados tienen que llegar, en orden, a los callbacks, y éstos
+    tienen que correr fuera del hilo del event loop (pueden bloquear en REST).
+    """
+    n = 20 if quick else 200
+    messages, expected = [], [("connect", None)]
+    for i in range(n):
+        t = 1_600_000_000_000 + i * 60_000
+        kline = {"t": t, "T": t + 59_999, "o": "1", "h": "2", "l": "0.5", "c": str(100 + i), "v": "3"}
+        messages.append({"stream": "btcusdt@kline_1m", "data": {"e": "kline", "k": dict(kline, x=False)}})
+        messages.append({"stream": "btcusdt@bookTicker", "data": {"u": i, "b": str(99 + i), "a": str(101 + i)}})
+        messages.append({"stream": "btcusdt@kline_1m", "data": {"e": "kline", "k": dict(kline, x=True)}})
+        expected += [("price", 99.0 + i), ("kline", str(100 + i))]
+
+    calls, threads = [], set()
+    stop = threading.Event()
+
+    def record(kind, value):
+        threads.add(threading.get_ident())
+        calls.append((kind, value))
+        if len(calls) == len(expected):
+            stop.set()
+
+    async def replay(path):
+        runner = await replay_server(path, port=0)
+        port = runner.addresses[0][1]
+        stream = MarketStream("BTCUSDT", "1m", lambda price: record("price", price),
+                              lambda k: record("kline", k["c"]), on_connect=lambda: record("connect", None),
+                              url=f"ws://127.0.0.1:{port}", log=lambda message: None)
+        try:
+            await asyncio.wait_for(stream.run(stop), timeout=30)
+        finally:
+            await runner.cleanup()
+        return threading.get_ident()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stream.jsonl")
+        with open(path, "w") as f:
+            f.writelines(json.dumps(message) + "\n" for message in messages)
+        try:
+            loop_thread = asyncio.run(replay(path))
+        except asyncio.TimeoutError:
+            return [f"el stream no entregó todos los mensajes: {len(calls)} de {len(expected)} callbacks"]
+
+    problems = [f"callback {i}: {got}, se esperaba {want}"
+                for i, (got, want) in enumerate(zip(calls, expected)) if got != want]
+    if len(calls) != len(expected):
+        problems.append(f"{len(calls)} callbacks, se esperaban {len(expected)}")
+    if loop_thread in threads:
+        problems.append("los callbacks corrieron en el hilo del event loop")
+    return problems
+
+
+CHECKS = {
+    "simulation": check_simulation,
+    "strategy": check_strategy,
+    "downloader": check_downloader,
+    "streaming": check_streaming,
+}
+
+
+def run_checks(names=None, quick=False, log=print):
+    """Ejecuta las verificaciones indicadas (todas si es None); devuelve {nombre: diferencias}."""
+    failures = {}
+    for name in names or CHECKS:
+        problems = CHECKS[name](quick)
+        log(f"{'✔' if not problems else '✘'} {name}")
+        for problem in problems:
+            log(f"    {problem}")
+        if problems:
+            failures[name] = problems
+    return failures
+
+
+# --- Resultados ---
+
+def _commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(names=None, quick=False, log=print):
+    """Ejecuta los benchmarks indicados (todos si es None) y devuelve el documento de resultados."""
+    results = {}
+    for name in names or BENCHMARKS:
+        log(f"Ejecutando {name}...")
+        started = time.perf_counter()
+        results[name] = BENCHMARKS[name](quick)
+        log(f"  {name}: {time.perf_counter() - started:.1f} s")
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": _commit(),
+        "quick": quick,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+
+def save_results(document, path=None):
+    """Guarda los resultados como JSON; por defecto en RESULTS_DIR/<fecha>_<commit>.json."""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = document["timestamp"].replace(":", "").split(".")[0]
+        path = os.path.join(RESULTS_DIR, f"{stamp}_{document['commit'] or 'sin-commit'}.json")
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
+    return path
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compara la mejor marca de cada medición con la de 'baseline'. Devuelve
+    una lista de (benchmark, medición, antes, ahora, variación) con las que
+    empeoraron más de 'threshold' (variación relativa del tiempo por llamada).
+    """
+    regressions = []
+    for name, metrics in current["results"].items():
+        for metric, values in metrics.items():
+            before = baseline.get("results", {}).get(name, {}).get(metric)
+            if not isinstance(values, dict) or not isinstance(before, dict):
+                continue
+            change = values["best_s"] / before["best_s"] - 1 if before["best_s"] > 0 else 0.0
+            if change > threshold:
+                regressions.append((name, metric, before["best_s"], values["best_s"], change))
+    return regressions
+
+
+def _format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de las rutas críticas del bot con datos sintéticos.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Benchmarks a ejecutar")
+    parser.add_argument("--quick", action="store_true", help="Tamaños chicos, para una pasada rápida")
+    parser.add_argument("--out", default=None, help="Archivo JSON de salida")
+    parser.add_argument("--compare", default=None, help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--check", nargs="*", choices=list(CHECKS), default=None,
+                        help="En lugar de medir, verifica que las rutas equivalentes den lo mismo (todas sin nombres)")
+    args = parser.parse_args()
+
+    if args.check is not None:
+        sys.exit(1 if run_checks(args.check or None, quick=args.quick) else 0)
+
+    document = run_benchmarks(args.only, quick=args.quick)
+    for name, metrics in document["results"].items():
+        print(f"--- {name} ---")
+        for metric, values in metrics.items():
+            if isinstance(values, dict):
+                print(f"{metric:>24}: {_format_seconds(values['best_s'])}/op | {values['ops_per_s']:,.0f} op/s")
+            else:
+                print(f"{metric:>24}: {values}")
+    print(f"Resultados guardados en {save_results(document, args.out)}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), document, args.threshold)
+        for name, metric, before, now, change in regressions:
+            print(f"⚠️ {name}.{metric}: {_format_seconds(before)} -> {_format_seconds(now)} (+{change:.0%})")
+        if regressions:
+            sys.exit(1)
+        print("Sin regresiones.")
+
+
+if __name__ == "__main__":
+    main()
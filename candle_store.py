@@ -0,0 +1,110 @@
+# candle_store.py
+import os
+
+import numpy as np
+
+from backtest import OPEN_TIME, CLOSE
+
+CANDLE_DIR = os.getenv("CANDLE_DIR", "data")
+
+# Un archivo binario por columna: open_time en int64 y el resto en float64
+COLUMNS = [("open_time", np.int64), ("open", np.float64), ("high", np.float64),
+           ("low", np.float64), ("close", np.float64), ("volume", np.float64)]
+
+
+class CandleStore:
+    """
+    Almacén local de velas por símbolo e intervalo.
+
+    Cada columna vive en su propio archivo binario de solo-anexar y se lee con
+    np.memmap, así que leer la ventana que necesita la estrategia no copia ni
+    parsea el histórico completo. Las velas se deduplican por open_time: solo
+    se anexan las posteriores a la última guardada.
+    """
+
+    def __init__(self, symbol, interval, base_dir=CANDLE_DIR):
+        self.symbol = symbol
+        self.interval = interval
+        self.path = os.path.join(base_dir, f"{symbol}_{interval}")
+        os.makedirs(self.path, exist_ok=True)
+        self._maps = None
+        self._length = self._repair()
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _repair(self):
+        """
+        Deja todas las columnas con la misma cantidad de filas.
+        Si un corte dejó una escritura a medias, se descarta la fila incompleta.
+        """
+        sizes = []
+        for name, dtype in COLUMNS:
+            file = self._file(name)
+            if not os.path.exists(file):
+                open(file, 'wb').close()
+            sizes.append(os.path.getsize(file) // np.dtype(dtype).itemsize)
+        length = min(sizes)
+        for (name, dtype), size in zip(COLUMNS, sizes):
+            if size != length or os.path.getsize(self._file(name)) % np.dtype(dtype).itemsize:
+                with open(self._file(name), 'r+b') as f:
+                    f.truncate(length * np.dtype(dtype).itemsize)
+        return length
+
+    def __len__(self):
+        return self._length
+
+    def _columns(self):
+        """Mapas de memoria de cada columna, recreados solo cuando crece el archivo."""
+        if self._maps is None or len(self._maps[0]) != self._length:
+            if self._length == 0:
+                self._maps = [np.empty(0, dtype=dtype) for _, dtype in COLUMNS]
+            else:
+                self._maps = [np.memmap(self._file(name), dtype=dtype, mode='r', shape=(self._length,))
+                              for name, dtype in COLUMNS]
+        return self._maps
+
+    def last_open_time(self):
+        """open_time (ms) de la última vela guardada, o None si el almacén está vacío."""
+        if self._length == 0:
+            return None
+        return int(self._columns()[OPEN_TIME][-1])
+
+    def append(self, ohlcv):
+        """
+        Anexa velas cerradas con formato (n, 6). Descarta las que ya están
+        guardadas o repiten open_time. Devuelve cuántas filas se anexaron.
+        """
+        ohlcv = np.asarray(ohlcv, dtype=np.float64).reshape(-1, 6)
+        if len(ohlcv) == 0:
+            return 0
+        open_times = ohlcv[:, OPEN_TIME].astype(np.int64)
+        # Si hay repetidas dentro del lote gana la última (la más actualizada)
+        _, last_idx = np.unique(open_times[::-1], return_index=True)
+        keep = np.sort(len(open_times) - 1 - last_idx)
+        last = self.last_open_time()
+        if last is not None:
+            keep = keep[open_times[keep] > last]
+        if keep.size == 0:
+            return 0
+
+        rows = ohlcv[keep]
+        for i, (name, dtype) in enumerate(COLUMNS):
+            with open(self._file(name), 'ab') as f:
+                f.write(rows[:, i].astype(dtype).tobytes())
+        self._length += len(rows)
+        return len(rows)
+
+    def tail(self, n):
+        """Últimas n velas como array (n, 6) de float64."""
+        cols = self._columns()
+        start = max(0, self._length - n)
+        return np.column_stack([c[start:].astype(np.float64) for c in cols]).reshape(-1, 6)
+
+    def closes(self, n):
+        """Últimos n cierres (vista de solo lectura sobre el archivo)."""
+        return self._columns()[CLOSE][max(0, self._length - n):]
+
+    def load(self):
+        """Histórico completo como array (n, 6), listo para backtest.run_backtest."""
+        return self.tail(self._length)
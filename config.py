@@ -4,6 +4,24 @@ import os
 
 CONFIG_FILE = "config.json"
 
+# Duración en milisegundos de cada intervalo de velas de Binance
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 3_600_000,
+    "2h": 2 * 3_600_000,
+    "4h": 4 * 3_600_000,
+    "6h": 6 * 3_600_000,
+    "8h": 8 * 3_600_000,
+    "12h": 12 * 3_600_000,
+    "1d": 86_400_000,
+    "3d": 3 * 86_400_000,
+    "1w": 7 * 86_400_000,
+}
+
 def get_default_config():
     """Devuelve un diccionario con la configuración por defecto."""
     return {
@@ -16,7 +34,14 @@ def get_default_config():
         "trailing_stop": 0.02,
         "testnet": True,
         "ma_fast": 10,
-        "ma_slow": 50
+        "ma_slow": 50,
+        "strategy": "ma_crossover",
+        "mode": "polling",
+        "trailing_seconds": 60,
+        "protection": "client",
+        "take_profit": 0.05,
+        "stream_url": "",
+        "api_url": ""
     }
 
 def load_config():
@@ -49,11 +74,36 @@ def load_config():
         print(f"Error al leer {CONFIG_FILE}: {e}. Se usará la configuración por defecto.")
         return get_default_config()
 
-def save_config(config_data):
-    """Guarda el diccionario de configuración en config.json."""
+def symbol_configs(cfg):
+    """
+    Configuración completa de cada símbolo: cfg["symbols"] puede listar
+    símbolos o diccionarios que reemplazan claves de la configuración base.
+    Sin "symbols" se usa solo cfg["symbol"].
+    """
+    configs = []
+    for entry in cfg.get("symbols") or [cfg["symbol"]]:
+        override = {"symbol": entry} if isinstance(entry, str) else entry
+        configs.append(dict(cfg, **override))
+    return configs
+
+def bot_names(configs):
+    """
+    Nombre único de cada configuración de symbol_configs: su "name" o el
+    símbolo, numerado si se repite (BTCUSDT, BTCUSDT-2). Así varios bots
+    pueden operar el mismo símbolo con otra estrategia sin pisarse el estado.
+    """
+    names, seen = [], {}
+    for sym_cfg in configs:
+        name = sym_cfg.get("name") or sym_cfg["symbol"]
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}-{seen[name]}")
+    return names
+
+def save_config(config_data, path=CONFIG_FILE):
+    """Guarda el diccionario de configuración en config.json (o en la ruta indicada)."""
     try:
-        with open(CONFIG_FILE, 'w') as f:
+        with open(path, 'w') as f:
             json.dump(config_data, f, indent=4)
-        return True, f"Configuración guardada en {CONFIG_FILE}"
+        return True, f"Configuración guardada en {path}"
     except IOError as e:
         return False, f"Error al guardar la configuración: {e}"
\ No newline at end of file
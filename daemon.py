@@ -0,0 +1,150 @@
+# daemon.py
+"""
+Ejecuta el bot sin interfaz gráfica (servidores y contenedores).
+
+Arranca un Bot por símbolo con la configuración de config.json, las
+variables de entorno y los argumentos de la línea de comandos (en ese
+orden de prioridad creciente) y se detiene limpiamente con SIGTERM o
+SIGINT. Solo importa lo necesario para operar: nada de la GUI ni de
+pandas/matplotlib, que se cargan únicamente al pedir un análisis.
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+from config import load_config, symbol_configs
+
+# Segundos que se espera a cada bot al detenerse antes de salir igual
+STOP_TIMEOUT = float(os.getenv("STOP_TIMEOUT", "20"))
+
+# Variables de entorno que reemplazan claves de config.json
+ENV_OVERRIDES = {
+    "SYMBOL": ("symbol", str),
+    "INTERVAL": ("interval", str),
+    "USDT_AMOUNT": ("usdt_amount", float),
+    "RISK": ("risk", float),
+    "TRAILING_STOP": ("trailing_stop", float),
+    "MA_FAST": ("ma_fast", int),
+    "MA_SLOW": ("ma_slow", int),
+    "MODE": ("mode", str),
+    "TRAILING_SECONDS": ("trailing_seconds", int),
+}
+
+
+def _env_flag(value):
+    return value.strip().lower() in ("1", "true", "yes", "si", "sí")
+
+
+def apply_environment(cfg, environ=os.environ):
+    """
+    Aplica al diccionario de configuración las variables de entorno
+    documentadas en el Readme: TESTNET, las claves (BINANCE_* o TESTNET_*
+    según el entorno), SYMBOLS (separados por coma) y ENV_OVERRIDES.
+    """
+    cfg = dict(cfg)
+    for name, (key, cast) in ENV_OVERRIDES.items():
+        if environ.get(name):
+            cfg[key] = cast(environ[name])
+    if environ.get("TESTNET"):
+        cfg["testnet"] = _env_flag(environ["TESTNET"])
+    prefix = "TESTNET" if cfg["testnet"] else "BINANCE"
+    if environ.get(f"{prefix}_API_KEY"):
+        cfg["api_key"] = environ[f"{prefix}_API_KEY"]
+    secret = environ.get(f"{prefix}_SECRET_KEY") or environ.get(f"{prefix}_API_SECRET")
+    if secret:
+        cfg["api_secret"] = secret
+    if environ.get("SYMBOLS"):
+        cfg["symbols"] = [s.strip().upper() for s in environ["SYMBOLS"].split(",") if s.strip()]
+    return cfg
+
+
+def apply_arguments(cfg, args):
+    cfg = dict(cfg)
+    if args.testnet:
+        cfg["testnet"] = True
+    for key, value in (("interval", args.interval), ("ma_fast", args.fast), ("ma_slow", args.slow),
+                       ("risk", args.risk), ("mode", args.mode)):
+        if value is not None:
+            cfg[key] = value
+    if args.symbols:
+        cfg["symbols"] = [s.strip().upper() for s in args.symbols.split(",") if s.strip()]
+    return cfg
+
+
+def build_bots(cfg):
+    """Un Bot por símbolo; con uno solo usa state.json, como la GUI."""
+    from main import Bot
+
+    configs = symbol_configs(cfg)
+    if len(configs) == 1:
+        return [Bot(cfg=configs[0])]
+    return [Bot(cfg=c, name=c["symbol"], state_file=f"state_{c['symbol']}.json") for c in configs]
+
+
+def run(cfg, stop_event=None):
+    """
+    Arranca los bots y bloquea hasta que se active stop_event (SIGTERM o
+    SIGINT) o terminen todos. Devuelve el código de salida del proceso.
+    """
+    from logger import flush_trades
+
+    stop_event = stop_event or threading.Event()
+    bots = build_bots(cfg)
+    for bot in bots:
+        bot.start()
+
+    while not stop_event.wait(1.0):
+        if not any(bot.bot_thread.is_alive() for bot in bots):
+            break  # Todos terminaron solos: error de configuración o stop externo
+
+    finished_alone = not stop_event.is_set()
+    print("Deteniendo bots...", flush=True)
+    for bot in bots:
+        bot.stop_event.set()
+    for bot in bots:
+        bot.bot_thread.join(STOP_TIMEOUT)
+        if bot.bot_thread.is_alive():
+            print(f"⚠️ {bot.name or 'bot'} no se detuvo en {STOP_TIMEOUT:.0f} s.", flush=True)
+    flush_trades(timeout=5.0)
+    return 1 if finished_alone else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ejecuta el bot sin interfaz gráfica.")
+    parser.add_argument("--testnet", action="store_true", help="Usar Binance Testnet")
+    parser.add_argument("--symbols", help="Símbolos separados por coma (p. ej. BTCUSDT,ETHUSDT)")
+    parser.add_argument("--interval", help="Intervalo de velas (1m, 5m, 1h, ...)")
+    parser.add_argument("--fast", type=int, help="Periodo de la media rápida")
+    parser.add_argument("--slow", type=int, help="Periodo de la media lenta")
+    parser.add_argument("--risk", type=float, help="Fracción del capital por operación")
+    parser.add_argument("--mode", choices=("polling", "streaming"))
+    parser.add_argument("--processes", type=int,
+                        help="Repartir los bots en N procesos supervisados (0 = uno por núcleo)")
+    parser.add_argument("--no-feed", action="store_true",
+                        help="Con --processes, que cada bot pida sus propios datos de mercado")
+    args = parser.parse_args()
+
+    load_dotenv()
+    cfg = apply_arguments(apply_environment(load_config()), args)
+
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        print(f"Señal {signal.Signals(signum).name} recibida.", flush=True)
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    if args.processes is not None:
+        from supervisor import Supervisor
+
+        sys.exit(Supervisor(cfg, processes=args.processes or None, feed=not args.no_feed).run(stop_event))
+    sys.exit(run(cfg, stop_event))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+# downloader.py
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from backtest import OPEN_TIME, klines_to_array, load_ohlcv
+from candle_store import COLUMNS
+from config import INTERVAL_MS
+
+KLINES_DIR = os.getenv("KLINES_DIR", os.path.join("data", "klines"))
+# Máximo de velas por petición que acepta Binance
+PAGE_LIMIT = 1000
+
+
+def parse_date(text):
+    """'2020-01-01' o '2020-01-01T12:00' (UTC) a milisegundos epoch."""
+    return int(datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def plan_chunks(first_ms, end_ms, interval_ms, limit=PAGE_LIMIT):
+    """Ventanas [inicio, fin) de hasta 'limit' velas que cubren [first_ms, end_ms)."""
+    span = interval_ms * limit
+    return [(start, min(start + span, end_ms)) for start in range(first_ms, end_ms, span)]
+
+
+def find_gaps(open_times, interval_ms):
+    """Huecos de la serie como array (k, 2): open_time antes y después de cada salto."""
+    open_times = np.asarray(open_times, dtype=np.int64)
+    jumps = np.flatnonzero(np.diff(open_times) != interval_ms)
+    return np.column_stack((open_times[jumps], open_times[jumps + 1])).reshape(-1, 2)
+
+
+def output_path(out_dir, symbol, interval):
+    return os.path.join(out_dir, f"{symbol}_{interval}.npz")
+
+
+def save_klines(path, ohlcv, gaps):
+    """Guarda las velas por columnas con np.savez_compressed (escritura atómica)."""
+    tmp = path + ".tmp.npz"
+    columns = {name: ohlcv[:, i].astype(dtype) for i, (name, dtype) in enumerate(COLUMNS)}
+    np.savez_compressed(tmp, gaps=gaps, **columns)
+    os.replace(tmp, path)
+
+
+def load_gaps(path):
+    with np.load(path) as data:
+        return data["gaps"] if "gaps" in data.files else np.empty((0, 2), dtype=np.int64)
+
+
+class _Job:
+    """Descarga de un símbolo e intervalo: sus ventanas pendientes y el directorio de checkpoints."""
+
+    def __init__(self, symbol, interval, out_dir):
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.path = output_path(out_dir, symbol, interval)
+        self.chunk_dir = os.path.join(out_dir, f".{symbol}_{interval}.parts")
+        self.chunks = []
+        self.failed = 0
+
+    def chunk_file(self, chunk):
+        # El fin va en el nombre: el fin por defecto es "ahora", así que al reanudar la última
+        # ventana de la ejecución anterior termina antes y se vuelve a pedir completa
+        start, stop = chunk
+        return os.path.join(self.chunk_dir, f"{start}-{stop}.npy")
+
+    def __str__(self):
+        return f"{self.symbol} {self.interval}"
+
+
+class KlineDownloader:
+    """
+    Descarga de velas históricas de muchos símbolos e intervalos en paralelo.
+
+    El rango de cada símbolo se parte en ventanas fijas de PAGE_LIMIT velas
+    (startTime/endTime), independientes entre sí, así que todas las
+    ventanas de todos los símbolos se reparten en un pool acotado de
+    'workers' hilos. Cada hilo tiene su propio cliente (client_factory) y
+    todos comparten el RateLimiter del proceso, que frena las peticiones
+    según el peso consumido y las cabeceras de Binance.
+
+    Cada ventana descargada se guarda como checkpoint (.npy) en un
+    directorio oculto junto a la salida: si la descarga se interrumpe, la
+    siguiente ejecución solo pide las que faltan. Con todas las ventanas de
+    un símbolo, se unen, se deduplican, se verifican los huecos y se
+    escribe <SYMBOL>_<interval>.npz por columnas (ver backtest.load_ohlcv).
+    Si el .npz ya existe, solo se descargan las velas posteriores.
+    """
+
+    def __init__(self, client_factory, out_dir=KLINES_DIR, workers=8, log=print):
+        self.client_factory = client_factory
+        self.out_dir = out_dir
+        self.workers = workers
+        self.log = log
+        self._local = threading.local()
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.client_factory()
+        return client
+
+    def download(self, symbols, intervals, start_ms, end_ms=None):
+        """Descarga todas las combinaciones; devuelve {(símbolo, intervalo): ruta o None si quedó incompleta}."""
+        client = self._client()
+        now_ms = client.get_server_time()["serverTime"]
+        jobs = [_Job(s, i, self.out_dir) for s in symbols for i in intervals]
+        for job in jobs:
+            self._plan(job, client, start_ms, now_ms if end_ms is None else min(end_ms, now_ms))
+
+        pending = [(job, chunk) for job in jobs for chunk in job.chunks
+                   if not os.path.exists(job.chunk_file(chunk))]
+        total = sum(len(job.chunks) for job in jobs)
+        self.log(f"{len(jobs)} series, {total} ventanas ({total - len(pending)} ya descargadas).")
+        # Intercalar series: todas avanzan a la vez y el progreso es parejo
+        pending.sort(key=lambda item: item[1][0])
+
+        started = time.monotonic()
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="klines") as pool:
+            items = iter(pending)
+            futures = {}
+            # Se encolan como mucho 2x workers ventanas: no se crean miles de futures de golpe
+            for job, chunk in items:
+                futures[pool.submit(self._fetch_chunk, job, chunk)] = job
+                if len(futures) >= 2 * self.workers:
+                    break
+            while futures:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = futures.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        job.failed += 1
+                        self.log(f"⚠️ Falló una ventana de {job}: {e}")
+                    done += 1
+                    if done % 100 == 0 or done == len(pending):
+                        rate = done / max(time.monotonic() - started, 1e-9)
+                        self.log(f"{done}/{len(pending)} ventanas ({rate:.1f}/s)")
+                    next_item = next(items, None)
+                    if next_item is not None:
+                        futures[pool.submit(self._fetch_chunk, *next_item)] = next_item[0]
+
+        return {(job.symbol, job.interval): self._assemble(job) for job in jobs}
+
+    def _plan(self, job, client, start_ms, end_ms):
+        interval_ms = job.interval_ms
+        # Solo velas cerradas: la vela en curso no entra en el histórico
+        end_ms -= end_ms % interval_ms
+        first = start_ms - start_ms % interval_ms
+        if os.path.exists(job.path):
+            existing = load_ohlcv(job.path)
+            if len(existing):
+                first = max(first, int(existing[-1, OPEN_TIME]) + interval_ms)
+        else:
+            # La primera vela disponible (fecha de listado del par), para no pedir ventanas vacías
+            probe = client.get_klines(symbol=job.symbol, interval=job.interval, startTime=first, limit=1)
+            if not probe:
+                self.log(f"{job}: sin velas en el rango pedido.")
+                return
+            first = int(probe[0][0])
+        job.chunks = plan_chunks(first, end_ms, interval_ms)
+        if job.chunks:
+            os.makedirs(job.chunk_dir, exist_ok=True)
+
+    def _fetch_chunk(self, job, chunk):
+        start, stop = chunk
+        klines = self._client().get_klines(symbol=job.symbol, interval=job.interval, startTime=start,
+                                           endTime=stop - 1, limit=PAGE_LIMIT)
+        data = klines_to_array(klines)
+        data = data[(data[:, OPEN_TIME] >= start) & (data[:, OPEN_TIME] < stop)]
+        # Checkpoint atómico: un archivo a medias nunca cuenta como ventana descargada
+        tmp = job.chunk_file(chunk) + ".tmp.npy"
+        np.save(tmp, data)
+        os.replace(tmp, job.chunk_file(chunk))
+        return len(data)
+
+    def _assemble(self, job):
+        if not job.chunks and not os.path.exists(job.path):
+            return None
+        missing = [c for c in job.chunks if not os.path.exists(job.chunk_file(c))]
+        if missing:
+            self.log(f"⚠️ {job}: faltan {len(missing)} ventanas; vuelve a ejecutar para completarlas.")
+            return None
+
+        parts = [load_ohlcv(job.path)] if os.path.exists(job.path) else []
+        parts += [np.load(job.chunk_file(chunk)) for chunk in job.chunks]
+        ohlcv = np.concatenate(parts) if parts else np.empty((0, 6))
+        _, keep = np.unique(ohlcv[:, OPEN_TIME].astype(np.int64), return_index=True)
+        ohlcv = ohlcv[keep]
+
+        gaps = find_gaps(ohlcv[:, OPEN_TIME], job.interval_ms)
+        if len(gaps):
+            # Binance tiene huecos reales (mantenimientos): se informan y se guardan junto a las velas
+            missing_candles = int(((gaps[:, 1] - gaps[:, 0]) // job.interval_ms - 1).sum())
+            self.log(f"⚠️ {job}: {len(gaps)} huecos ({missing_candles} velas sin datos en Binance).")
+        save_klines(job.path, ohlcv, gaps)
+        if os.path.isdir(job.chunk_dir):
+            # También las ventanas de planes anteriores que quedaron cortas
+            for name in os.listdir(job.chunk_dir):
+                os.remove(os.path.join(job.chunk_dir, name))
+            os.rmdir(job.chunk_dir)
+        self.log(f"{job}: {len(ohlcv)} velas en {job.path}")
+        return job.path
+
+
+# --- Servidor local de pruebas ---
+
+def serve_klines(histories, host="127.0.0.1", port=0, weight_per_minute=6000):
+    """
+    Servidor HTTP local que imita los endpoints ping, time y klines de la
+    API de Binance sobre velas en memoria ({(símbolo, intervalo): ohlcv}),
+    con las cabeceras de peso usado y 429 al pasarse del límite, para
+    probar el descargador sin conexión. Devuelve el ThreadingHTTPServer ya
+    escuchando en un hilo; su URL base es http://host:puerto/api.
+    """
+    lock = threading.Lock()
+    usage = {"minute": 0, "weight": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, payload, weight):
+            with lock:
+                minute = int(time.time() // 60)
+                if usage["minute"] != minute:
+                    usage.update(minute=minute, weight=0)
+                usage["weight"] += weight
+                used = usage["weight"]
+            if used > weight_per_minute:
+                status, payload = 429, {"code": -1003, "msg": "Too many requests."}
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("x-mbx-used-weight-1m", str(used))
+            if status == 429:
+                self.send_header("Retry-After", str(60 - int(time.time()) % 60))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            endpoint = re.sub(r"^.*/v\d+/", "", url.path)
+            if endpoint == "ping":
+                return self._send(200, {}, 1)
+            if endpoint == "time":
+                return self._send(200, {"serverTime": int(time.time() * 1000)}, 1)
+            if endpoint != "klines":
+                return self._send(404, {"code": -1, "msg": "Not found"}, 1)
+            ohlcv = histories.get((query.get("symbol"), query.get("interval")))
+            if ohlcv is None:
+                return self._send(400, {"code": -1121, "msg": "Invalid symbol."}, 2)
+            open_times = ohlcv[:, OPEN_TIME]
+            limit = min(int(query.get("limit", 500)), PAGE_LIMIT)
+            lo = np.searchsorted(open_times, int(query["startTime"])) if "startTime" in query else 0
+            hi = np.searchsorted(open_times, int(query["endTime"]), side="right") if "endTime" in query else len(ohlcv)
+            if "startTime" not in query:
+                lo = max(lo, hi - limit)
+            rows = ohlcv[lo:min(hi, lo + limit)]
+            interval_ms = INTERVAL_MS[query["interval"]]
+            klines = [[int(r[0]), f"{r[1]:.8f}", f"{r[2]:.8f}", f"{r[3]:.8f}", f"{r[4]:.8f}", f"{r[5]:.8f}",
+                       int(r[0]) + interval_ms - 1, "0", 0, "0", "0", "0"] for r in rows]
+            return self._send(200, klines, 2)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="klines-stand-in", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Descarga velas históricas de Binance en paralelo y reanudable.")
+    parser.add_argument("symbols", nargs="+", help="Símbolos, p. ej. BTCUSDT ETHUSDT")
+    parser.add_argument("--intervals", nargs="+", default=["1m"])
+    parser.add_argument("--start", required=True, help="Fecha inicial UTC (AAAA-MM-DD)")
+    parser.add_argument("--end", default=None, help="Fecha final UTC (por defecto, ahora)")
+    parser.add_argument("--out", default=KLINES_DIR)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--weight-per-minute", type=int, default=6000,
+                        help="Límite de peso por minuto de la IP (el de Binance hoy es 6000)")
+    parser.add_argument("--api-url", default=None, help="URL base de la API (p. ej. un servidor local de pruebas)")
+    parser.add_argument("--stand-in", action="store_true",
+                        help="Descargar de un servidor local con velas sintéticas en lugar de Binance")
+    args = parser.parse_args()
+
+    from rest_client import RateLimitedClient, RateLimiter
+
+    start_ms = parse_date(args.start)
+    end_ms = parse_date(args.end) if args.end else None
+    api_url = args.api_url
+    if args.stand_in:
+        from simulator import synthetic_ohlcv
+
+        stop = end_ms or int(time.time() * 1000)
+        histories = {}
+        for i, symbol in enumerate(args.symbols):
+            for interval in args.intervals:
+                n = (stop - start_ms) // INTERVAL_MS[interval]
+                histories[(symbol, interval)] = synthetic_ohlcv(n, interval, start_ms=start_ms, seed=i)
+        server = serve_klines(histories, weight_per_minute=args.weight_per_minute)
+        api_url = f"http://127.0.0.1:{server.server_address[1]}/api"
+        print(f"Servidor de pruebas en {api_url}")
+
+    limiter = RateLimiter(weight_per_minute=args.weight_per_minute)
+    downloader = KlineDownloader(lambda: RateLimitedClient(api_url=api_url, limiter=limiter),
+                                 out_dir=args.out, workers=args.workers)
+    started = time.monotonic()
+    results = downloader.download(args.symbols, args.intervals, start_ms, end_ms)
+    print(f"Listo en {time.monotonic() - started:.1f} s.")
+    if any(path is None for path in results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,19 @@ import tkinter
 import customtkinter as ctk
 from tkinter import messagebox
 import queue
+import threading
 from PIL import Image
 import sys
 import os
 
 # Importaciones de nuestro proyecto
 import config
-from analisis import analizar_trades_para_gui
+from logger import flush_trades
+from log_channel import LogChannel
 from main import Bot
+from protection import PROTECTION_MODES
 
-# Importaciones para el gráfico de Matplotlib
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+# analisis (pandas + matplotlib) se importa recién cuando se pide un análisis
 
 # --- CLASE PARA TOOLTIPS ---
 class Tooltip:
@@ -52,6 +54,9 @@ def resource_path(relative_path):
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("blue")
 BINANCE_YELLOW = "#F0B90B"
+# Líneas que conserva el visor de logs y mensajes que se insertan como máximo por tick
+MAX_LOG_LINES = 5000
+LOG_BATCH_SIZE = 1000
 
 TOOLTIP_TEXTS = {
     "api_key": "Tu clave API pública de Binance.",
@@ -63,7 +68,11 @@ TOOLTIP_TEXTS = {
     "trailing_stop": "El porcentaje de caída desde el precio máximo para activar la venta. Ejemplo: 2 para 2%.",
     "testnet": "Activa el modo de prueba (Paper Trading). No se usará dinero real.",
     "ma_fast": "El periodo de la media móvil rápida. Ejemplo: 10.",
-    "ma_slow": "El periodo de la media móvil lenta. Ejemplo: 50."
+    "ma_slow": "El periodo de la media móvil lenta. Ejemplo: 50.",
+    "mode": "'polling' evalúa la entrada al cierre de cada vela y el trailing stop cada cierto tiempo. 'streaming' reacciona a cada precio por WebSocket.",
+    "trailing_seconds": "Modo polling: cada cuántos segundos se revisa el trailing stop con una posición abierta.",
+    "protection": "'client': el bot vende a mercado al tocar el stop. 'stop_loss', 'trailing_delta' y 'oco': la posición queda protegida con una orden en Binance aunque el bot esté caído.",
+    "take_profit": "Modo oco: ganancia sobre el precio de compra a la que se vende con la orden límite. Ejemplo: 5 para 5%."
 }
 
 class App(ctk.CTk):
@@ -82,7 +91,9 @@ class App(ctk.CTk):
         self.crear_widgets_bot(self.tab_view.tab("Bot"))
         self.crear_widgets_analisis(self.tab_view.tab("Análisis"))
         self.crear_widgets_configuracion(self.tab_view.tab("Configuración"))
-        self.log_queue = queue.Queue()
+        self.log_queue = LogChannel()
+        self.analysis_queue = queue.Queue()
+        self.analysis_cancel = None
         self.bot = Bot(log_queue=self.log_queue)
         self.load_config_to_ui()
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -115,6 +126,16 @@ class App(ctk.CTk):
         tab.grid_rowconfigure(1, weight=1)
         self.run_analysis_button = ctk.CTkButton(tab, text="Ejecutar Análisis de Trades", command=self.ejecutar_analisis, fg_color=BINANCE_YELLOW, text_color="#000000", hover_color="#D9A60A")
         self.run_analysis_button.grid(row=0, column=0, padx=20, pady=20, sticky="w")
+        self.cancel_analysis_button = ctk.CTkButton(tab, text="Cancelar", command=self.cancelar_analisis, state="disabled")
+        self.cancel_analysis_button.grid(row=0, column=0, padx=(240, 20), pady=20, sticky="w")
+        self.analysis_progress = ctk.CTkProgressBar(tab, progress_color=BINANCE_YELLOW)
+        self.analysis_progress.set(0)
+        self.analysis_progress.grid(row=0, column=0, padx=(400, 20), pady=20, sticky="ew")
+        self.analysis_status_label = ctk.CTkLabel(tab, text="")
+        self.analysis_status_label.grid(row=2, column=0, padx=20, pady=(0, 10), sticky="w")
+        # Monte Carlo opcional: con muchas operaciones tarda más que el resto del análisis
+        self.montecarlo_switch = ctk.CTkSwitch(tab, text="Incluir Monte Carlo")
+        self.montecarlo_switch.grid(row=2, column=0, padx=20, pady=(0, 10), sticky="e")
         self.results_frame = ctk.CTkFrame(tab, fg_color="transparent")
         self.results_frame.grid(row=1, column=0, padx=20, pady=(0, 20), sticky="nsew")
         self.results_frame.grid_rowconfigure(0, weight=1)
@@ -144,6 +165,7 @@ class App(ctk.CTk):
         self.config_entries['interval'] = self._crear_campo_config(market_frame, "Intervalo", 1, col=2, options=["1m", "5m", "15m", "30m", "1h", "4h", "1d"], tooltip=TOOLTIP_TEXTS['interval'])
         self.config_entries['ma_fast'] = self._crear_campo_config(market_frame, "MA Rápida", 2, col=0, tooltip=TOOLTIP_TEXTS['ma_fast'])
         self.config_entries['ma_slow'] = self._crear_campo_config(market_frame, "MA Lenta", 2, col=2, tooltip=TOOLTIP_TEXTS['ma_slow'])
+        self.config_entries['mode'] = self._crear_campo_config(market_frame, "Modo", 3, col=0, options=["polling", "streaming"], tooltip=TOOLTIP_TEXTS['mode'])
 
         risk_frame = ctk.CTkFrame(tab, fg_color="transparent")
         risk_frame.grid(row=2, column=0, padx=20, pady=20, sticky="ew")
@@ -153,6 +175,9 @@ class App(ctk.CTk):
         self.config_entries['usdt_amount'] = self._crear_campo_config(risk_frame, "Capital (USDT)", 1, col=0, tooltip=TOOLTIP_TEXTS['usdt_amount'])
         self.config_entries['risk'] = self._crear_campo_config(risk_frame, "Riesgo por Trade (%)", 1, col=2, tooltip=TOOLTIP_TEXTS['risk'])
         self.config_entries['trailing_stop'] = self._crear_campo_config(risk_frame, "Trailing Stop (%)", 2, col=0, tooltip=TOOLTIP_TEXTS['trailing_stop'])
+        self.config_entries['trailing_seconds'] = self._crear_campo_config(risk_frame, "Revisar Trailing (s)", 2, col=2, tooltip=TOOLTIP_TEXTS['trailing_seconds'])
+        self.config_entries['protection'] = self._crear_campo_config(risk_frame, "Protección", 3, col=0, options=list(PROTECTION_MODES), tooltip=TOOLTIP_TEXTS['protection'])
+        self.config_entries['take_profit'] = self._crear_campo_config(risk_frame, "Take Profit (%)", 3, col=2, tooltip=TOOLTIP_TEXTS['take_profit'])
 
         other_frame = ctk.CTkFrame(tab, fg_color="transparent")
         other_frame.grid(row=3, column=0, padx=20, pady=0, sticky="ew")
@@ -184,7 +209,7 @@ class App(ctk.CTk):
         cfg = config.load_config()
         for key, widget in self.config_entries.items():
             value = cfg.get(key)
-            if key in ['risk', 'trailing_stop']:
+            if key in ['risk', 'trailing_stop', 'take_profit']:
                 value = float(value) * 100
             
             if isinstance(widget, ctk.CTkEntry):
@@ -197,7 +222,8 @@ class App(ctk.CTk):
                 else: widget.deselect()
 
     def save_config_from_ui(self):
-        new_cfg = {}
+        # Se parte de la configuración actual para no perder claves que no están en la UI
+        new_cfg = config.load_config()
         try:
             for key, widget in self.config_entries.items():
                 if isinstance(widget, ctk.CTkEntry):
@@ -210,8 +236,10 @@ class App(ctk.CTk):
             new_cfg['usdt_amount'] = float(new_cfg['usdt_amount'])
             new_cfg['risk'] = float(new_cfg['risk']) / 100.0
             new_cfg['trailing_stop'] = float(new_cfg['trailing_stop']) / 100.0
+            new_cfg['take_profit'] = float(new_cfg['take_profit']) / 100.0
             new_cfg['ma_fast'] = int(new_cfg['ma_fast'])
             new_cfg['ma_slow'] = int(new_cfg['ma_slow'])
+            new_cfg['trailing_seconds'] = int(new_cfg['trailing_seconds'])
 
             success, msg = config.save_config(new_cfg)
             if success:
@@ -243,18 +271,20 @@ class App(ctk.CTk):
         self.stop_button.configure(state="disabled")
 
     def procesar_cola_logs(self):
+        """Vuelca en el visor, con una sola inserción, los mensajes llegados desde el último tick."""
         try:
-            while True:
-                message = self.log_queue.get_nowait()
-                self.log_message(message)
-                if "Bucle del bot detenido." in message or "Finalizando el bot" in message:
-                    self.start_button.configure(state="normal")
-                    self.stop_button.configure(state="disabled")
-                    self.status_label.configure(text="Estado: Detenido")
-                    self.run_analysis_button.configure(state="normal")
-                    self.set_config_state("normal")
-        except queue.Empty:
-            pass
+            items, dropped = self.log_queue.drain(LOG_BATCH_SIZE)
+            messages = [message for _, message in items]
+            if dropped:
+                messages.insert(0, f"⚠️ {dropped} mensajes descartados (la cola de logs estaba llena).")
+            if messages:
+                self.log_message("\n".join(messages))
+            if any("Bucle del bot detenido." in m or "Finalizando el bot" in m for m in messages):
+                self.start_button.configure(state="normal")
+                self.stop_button.configure(state="disabled")
+                self.status_label.configure(text="Estado: Detenido")
+                self.run_analysis_button.configure(state="normal")
+                self.set_config_state("normal")
         finally:
             self.after(100, self.procesar_cola_logs)
 
@@ -267,14 +297,75 @@ class App(ctk.CTk):
             self.destroy()
     
     def ejecutar_analisis(self):
+        """Lanza el análisis en un hilo de fondo para no congelar la ventana."""
         self.log_message("Ejecutando análisis...")
         self.run_analysis_button.configure(state="disabled")
+        self.cancel_analysis_button.configure(state="normal")
+        self.analysis_progress.set(0)
+        self.analysis_status_label.configure(text="")
         for widget in self.canvas_frame.winfo_children():
             widget.destroy()
         self.summary_text.configure(state='normal')
         self.summary_text.delete('1.0', tkinter.END)
+        self.summary_text.configure(state='disabled')
+
+        # Cada ejecución tiene su propio Event: los mensajes de una cancelada se descartan
+        cancel = threading.Event()
+        self.analysis_cancel = cancel
+        montecarlo = bool(self.montecarlo_switch.get())  # Los widgets solo se leen desde el hilo de Tk
+        threading.Thread(target=self._analisis_worker, args=(cancel, montecarlo), daemon=True).start()
+        self.after(100, self.procesar_cola_analisis)
+
+    def _analisis_worker(self, cancel, montecarlo=False):
+        def progreso(fraccion, texto):
+            self.analysis_queue.put((cancel, "progreso", (fraccion, texto)))
         try:
-            fig, summary = analizar_trades_para_gui(dark_mode=True)
+            progreso(0.0, "Cargando módulos de análisis...")
+            import analisis
+        except Exception as e:
+            self.analysis_queue.put((cancel, "error", e))
+            return
+        try:
+            flush_trades(timeout=5.0)  # Incluir las operaciones que el escritor aún no volcó
+            result = analisis.analizar_trades_para_gui(dark_mode=True, progreso=progreso, cancelar=cancel,
+                                                       capital=config.load_config()['usdt_amount'],
+                                                       remuestreos=analisis.REMUESTREOS_RESUMEN if montecarlo else 0)
+            self.analysis_queue.put((cancel, "resultado", result))
+        except analisis.AnalisisCancelado:
+            self.analysis_queue.put((cancel, "cancelado", None))
+        except Exception as e:
+            self.analysis_queue.put((cancel, "error", e))
+
+    def cancelar_analisis(self):
+        if self.analysis_cancel is not None:
+            self.analysis_cancel.set()
+            self.cancel_analysis_button.configure(state="disabled")
+            self.analysis_status_label.configure(text="Cancelando...")
+
+    def procesar_cola_analisis(self):
+        """Recoge en el hilo de Tk el progreso y el resultado del hilo de análisis."""
+        try:
+            while True:
+                cancel, kind, payload = self.analysis_queue.get_nowait()
+                if cancel is not self.analysis_cancel:
+                    continue  # Restos de una ejecución anterior
+                if kind == "progreso":
+                    fraccion, texto = payload
+                    self.analysis_progress.set(fraccion)
+                    self.analysis_status_label.configure(text=texto)
+                    continue
+                self._terminar_analisis(kind, payload)
+                return
+        except queue.Empty:
+            pass
+        self.after(100, self.procesar_cola_analisis)
+
+    def _terminar_analisis(self, kind, payload):
+        self.analysis_cancel = None
+        self.cancel_analysis_button.configure(state="disabled")
+        self.summary_text.configure(state='normal')
+        if kind == "resultado":
+            fig, summary = payload
             if fig:
                 self.mostrar_grafico(fig)
                 self.summary_text.insert(tkinter.END, summary)
@@ -282,16 +373,21 @@ class App(ctk.CTk):
             else:
                 self.summary_text.insert(tkinter.END, summary)
                 self.log_message(f"Aviso de análisis: {summary}")
-        except Exception as e:
-            error_msg = f"Ocurrió un error inesperado durante el análisis: {e}"
+        elif kind == "cancelado":
+            self.analysis_progress.set(0)
+            self.analysis_status_label.configure(text="Análisis cancelado.")
+            self.log_message("Análisis cancelado.")
+        else:
+            error_msg = f"Ocurrió un error inesperado durante el análisis: {payload}"
             self.log_message(error_msg)
             self.summary_text.insert(tkinter.END, error_msg)
-        finally:
-            self.summary_text.configure(state='disabled')
-            if "Corriendo" not in self.status_label.cget("text"):
-                self.run_analysis_button.configure(state="normal")
+        self.summary_text.configure(state='disabled')
+        if "Corriendo" not in self.status_label.cget("text"):
+            self.run_analysis_button.configure(state="normal")
 
     def mostrar_grafico(self, fig):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
         fig.set_facecolor("#1C1C1C")
         canvas = FigureCanvasTkAgg(fig, master=self.canvas_frame)
         canvas.draw()
@@ -300,6 +396,10 @@ class App(ctk.CTk):
     def log_message(self, message):
         self.log_area.configure(state='normal')
         self.log_area.insert(tkinter.END, message + '\n')
+        # Conservar solo las últimas MAX_LOG_LINES líneas
+        lines = int(self.log_area.index('end-1c').split('.')[0]) - 1
+        if lines > MAX_LOG_LINES:
+            self.log_area.delete('1.0', f'{lines - MAX_LOG_LINES + 1}.0')
         self.log_area.configure(state='disabled')
         self.log_area.see(tkinter.END)
 
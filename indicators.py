@@ -0,0 +1,364 @@
+# indicators.py
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from backtest import HIGH, LOW, CLOSE, VOLUME
+
+NAN = float("nan")
+
+
+def as_ohlcv(data):
+    """
+    Acepta una lista/array de cierres o un array (n, 6) de velas y devuelve
+    siempre (n, 6). Con solo cierres, high = low = close y volumen 1.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 2:
+        return data
+    ohlcv = np.ones((len(data), 6), dtype=np.float64)
+    ohlcv[:, 0] = np.arange(len(data))
+    ohlcv[:, 1:5] = data[:, None]
+    return ohlcv
+
+
+def _smooth(values, alpha, first, out):
+    """
+    out[j] = (1 - alpha) * out[j-1] + alpha * values[j], con out[-1] = first.
+
+    La recursión se resuelve en bloques con una fórmula cerrada (potencias de
+    1 - alpha y cumsum), de modo que NumPy procesa todo el histórico sin un
+    bucle por vela. El tamaño del bloque limita las potencias a ~e^300.
+    """
+    beta = 1.0 - alpha
+    if beta <= 0.0:
+        out[:] = values
+        return
+    block = max(1, int(300.0 / -math.log(beta))) if beta < 1.0 else len(values)
+    prev = first
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        j = np.arange(len(chunk))
+        acc = np.cumsum(alpha * chunk * beta ** -j)
+        y = beta ** (j + 1) * prev + beta ** j * acc
+        out[start:start + len(chunk)] = y
+        prev = y[-1]
+
+
+def _ema_batch(values, alpha, period):
+    """EMA sembrada con la media simple de los primeros 'period' valores (NaN hasta entonces)."""
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+    out[period - 1] = values[:period].mean()
+    _smooth(values[period:], alpha, out[period - 1], out[period:])
+    return out
+
+
+class Indicator:
+    """
+    Interfaz común de los indicadores.
+
+    En modo streaming se empuja una vela cerrada por vez con
+    update(close, high, low, volume), que cuesta O(1) y devuelve el valor
+    actual (NaN mientras no haya velas suficientes). batch(datos) calcula la
+    serie completa de un histórico (cierres o array (n, 6)) con NumPy, sin
+    tocar el estado del modo streaming; ambos modos dan el mismo resultado
+    salvo por el redondeo de float.
+    """
+
+    value = NAN
+
+    def reset(self):
+        raise NotImplementedError
+
+    def update(self, close, high=None, low=None, volume=None):
+        raise NotImplementedError
+
+    def batch(self, data):
+        raise NotImplementedError
+
+    @property
+    def ready(self):
+        return not math.isnan(self.value)
+
+
+class EMA(Indicator):
+    """Media móvil exponencial (alpha = 2 / (period + 1)), sembrada con la media simple."""
+
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.reset()
+
+    def reset(self):
+        self._count = 0
+        self._sum = 0.0
+        self.value = NAN
+
+    def update(self, close, high=None, low=None, volume=None):
+        n = self._count
+        self._count = n + 1
+        if n < self.period:
+            self._sum += close
+            if n == self.period - 1:
+                self.value = self._sum / self.period
+        else:
+            self.value += self.alpha * (close - self.value)
+        return self.value
+
+    def batch(self, data):
+        return _ema_batch(as_ohlcv(data)[:, CLOSE], self.alpha, self.period)
+
+
+class RSI(Indicator):
+    """RSI de Wilder: medias de subas y bajas suavizadas con alpha = 1 / period."""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self._prev = None
+        self._count = 0
+        self._gain = 0.0
+        self._loss = 0.0
+        self.value = NAN
+
+    @staticmethod
+    def _rsi(gain, loss):
+        total = gain + loss
+        return 50.0 if total == 0 else 100.0 * gain / total
+
+    def update(self, close, high=None, low=None, volume=None):
+        if self._prev is None:
+            self._prev = close
+            return self.value
+        delta = close - self._prev
+        self._prev = close
+        gain, loss = max(delta, 0.0), max(-delta, 0.0)
+        n = self._count
+        self._count = n + 1
+        if n < self.period:
+            self._gain += gain
+            self._loss += loss
+            if n == self.period - 1:
+                self._gain /= self.period
+                self._loss /= self.period
+                self.value = self._rsi(self._gain, self._loss)
+        else:
+            self._gain += (gain - self._gain) / self.period
+            self._loss += (loss - self._loss) / self.period
+            self.value = self._rsi(self._gain, self._loss)
+        return self.value
+
+    def batch(self, data):
+        closes = as_ohlcv(data)[:, CLOSE]
+        out = np.full(len(closes), np.nan)
+        if len(closes) < 2:
+            return out
+        delta = np.diff(closes)
+        gain = _ema_batch(np.maximum(delta, 0.0), 1.0 / self.period, self.period)
+        loss = _ema_batch(np.maximum(-delta, 0.0), 1.0 / self.period, self.period)
+        total = gain + loss
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[1:] = np.where(total == 0, 50.0, 100.0 * gain / total)
+        return out
+
+
+class MACD(Indicator):
+    """MACD = EMA(fast) - EMA(slow); 'signal' es la EMA del MACD e 'histogram' la diferencia."""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast, self.slow, self.signal_period = fast, slow, signal
+        self.reset()
+
+    def reset(self):
+        self._fast = EMA(self.fast)
+        self._slow = EMA(self.slow)
+        self._signal = EMA(self.signal_period)
+        self.value = self.signal = self.histogram = NAN
+
+    def update(self, close, high=None, low=None, volume=None):
+        fast = self._fast.update(close)
+        slow = self._slow.update(close)
+        if not math.isnan(slow):
+            self.value = fast - slow
+            self.signal = self._signal.update(self.value)
+            self.histogram = self.value - self.signal
+        return self.value
+
+    @property
+    def ready(self):
+        return not math.isnan(self.signal)
+
+    def batch(self, data):
+        """Devuelve (macd, signal, histogram)."""
+        closes = as_ohlcv(data)[:, CLOSE]
+        fast = _ema_batch(closes, 2.0 / (self.fast + 1), self.fast)
+        macd = fast - _ema_batch(closes, 2.0 / (self.slow + 1), self.slow)
+        signal = np.full(len(closes), np.nan)
+        start = self.slow - 1
+        if len(closes) > start:
+            signal[start:] = _ema_batch(macd[start:], 2.0 / (self.signal_period + 1), self.signal_period)
+        return macd, signal, macd - signal
+
+
+class Bollinger(Indicator):
+    """
+    Bandas de Bollinger: media simple de 'period' cierres ± k desvíos
+    (poblacionales). La varianza de la ventana se actualiza con la fórmula
+    de Welford para ventanas deslizantes, estable aunque los precios sean
+    grandes y la varianza chica.
+    """
+
+    RESYNC_EVERY = 1024
+
+    def __init__(self, period=20, k=2.0):
+        self.period, self.k = period, k
+        self.reset()
+
+    def reset(self):
+        self._buffer = [0.0] * self.period
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.value = self.upper = self.lower = NAN
+
+    def update(self, close, high=None, low=None, volume=None):
+        n = self._count
+        slot = n % self.period
+        if n < self.period:
+            delta = close - self._mean
+            self._mean += delta / (n + 1)
+            self._m2 += delta * (close - self._mean)
+        else:
+            old = self._buffer[slot]
+            old_mean = self._mean
+            self._mean += (close - old) / self.period
+            self._m2 += (close - old) * (close - self._mean + old - old_mean)
+        self._buffer[slot] = close
+        self._count = n + 1
+        if self._count % max(self.RESYNC_EVERY, self.period) == 0:
+            window = np.array(self._buffer[:min(self._count, self.period)])
+            self._mean = float(window.mean())
+            self._m2 = float(((window - self._mean) ** 2).sum())
+        if self._count >= self.period:
+            std = math.sqrt(max(self._m2, 0.0) / self.period)
+            self.value = self._mean
+            self.upper = self._mean + self.k * std
+            self.lower = self._mean - self.k * std
+        return self.value
+
+    def batch(self, data):
+        """Devuelve (media, banda superior, banda inferior)."""
+        closes = as_ohlcv(data)[:, CLOSE]
+        mid = np.full(len(closes), np.nan)
+        std = np.full(len(closes), np.nan)
+        if len(closes) >= self.period:
+            windows = sliding_window_view(closes, self.period)
+            mid[self.period - 1:] = windows.mean(axis=1)
+            std[self.period - 1:] = windows.std(axis=1)
+        return mid, mid + self.k * std, mid - self.k * std
+
+
+class ATR(Indicator):
+    """Average True Range de Wilder, sembrado con la media de los primeros 'period' rangos."""
+
+    def __init__(self, period=14):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self._prev_close = None
+        self._count = 0
+        self._sum = 0.0
+        self.value = NAN
+
+    def update(self, close, high=None, low=None, volume=None):
+        high = close if high is None else high
+        low = close if low is None else low
+        if self._prev_close is None:
+            tr = high - low
+        else:
+            tr = max(high - low, abs(high - self._prev_close), abs(low - self._prev_close))
+        self._prev_close = close
+        n = self._count
+        self._count = n + 1
+        if n < self.period:
+            self._sum += tr
+            if n == self.period - 1:
+                self.value = self._sum / self.period
+        else:
+            self.value += (tr - self.value) / self.period
+        return self.value
+
+    def batch(self, data):
+        ohlcv = as_ohlcv(data)
+        high, low, close = ohlcv[:, HIGH], ohlcv[:, LOW], ohlcv[:, CLOSE]
+        tr = high - low
+        if len(close) > 1:
+            prev = close[:-1]
+            tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(high[1:] - prev), np.abs(low[1:] - prev)))
+        return _ema_batch(tr, 1.0 / self.period, self.period)
+
+
+class VWAP(Indicator):
+    """
+    Precio promedio ponderado por volumen del precio típico (high+low+close)/3.
+    Con period=None es acumulado desde el último reset (por ejemplo, por
+    sesión); con un período, es móvil sobre las últimas 'period' velas.
+    """
+
+    RESYNC_EVERY = 1024
+
+    def __init__(self, period=None):
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        self._pv = 0.0
+        self._v = 0.0
+        self._count = 0
+        self._buffer = [(0.0, 0.0)] * (self.period or 1)
+        self.value = NAN
+
+    def update(self, close, high=None, low=None, volume=None):
+        high = close if high is None else high
+        low = close if low is None else low
+        volume = 1.0 if volume is None else volume
+        pv = (high + low + close) / 3.0 * volume
+        self._pv += pv
+        self._v += volume
+        n = self._count
+        self._count = n + 1
+        if self.period:
+            slot = n % self.period
+            if n >= self.period:
+                old_pv, old_v = self._buffer[slot]
+                self._pv -= old_pv
+                self._v -= old_v
+            self._buffer[slot] = (pv, volume)
+            if self._count % max(self.RESYNC_EVERY, self.period) == 0:
+                self._pv = math.fsum(p for p, _ in self._buffer)
+                self._v = math.fsum(v for _, v in self._buffer)
+            if self._count < self.period:
+                return self.value
+        self.value = self._pv / self._v if self._v > 0 else NAN
+        return self.value
+
+    def batch(self, data):
+        ohlcv = as_ohlcv(data)
+        volume = ohlcv[:, VOLUME]
+        pv = (ohlcv[:, HIGH] + ohlcv[:, LOW] + ohlcv[:, CLOSE]) / 3.0 * volume
+        if not self.period:
+            pv_sum, v_sum = np.cumsum(pv), np.cumsum(volume)
+        else:
+            pv_sum = np.full(len(pv), np.nan)
+            v_sum = np.full(len(pv), np.nan)
+            if len(pv) >= self.period:
+                pv_sum[self.period - 1:] = sliding_window_view(pv, self.period).sum(axis=1)
+                v_sum[self.period - 1:] = sliding_window_view(volume, self.period).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(v_sum > 0, pv_sum / v_sum, np.nan)
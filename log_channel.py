@@ -0,0 +1,74 @@
+# log_channel.py
+import collections
+import os
+import threading
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+# Nivel mínimo por defecto de los mensajes del bot (DEBUG, INFO, WARNING o ERROR)
+LOG_LEVEL = LEVEL_NAMES.get(os.getenv("LOG_LEVEL", "INFO").upper(), INFO)
+
+
+class LogChannel:
+    """
+    Canal de mensajes entre los bots y la GUI con tamaño acotado.
+
+    Los mensajes se guardan con su nivel en un buffer circular de 'maxlen'
+    entradas: si la GUI no alcanza a vaciarlo, se descartan los más viejos y
+    se cuentan en 'dropped' para poder avisarlo. Los mensajes por debajo de
+    'level' ni siquiera se formatean (ver enabled). El consumidor los retira
+    en lotes con drain.
+    """
+
+    def __init__(self, maxlen=10000, level=LOG_LEVEL):
+        self.level = level
+        self._buffer = collections.deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def depth(self):
+        """Mensajes pendientes de retirar."""
+        return len(self._buffer)
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def put(self, message, level=INFO):
+        if level < self.level:
+            return
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append((level, message))
+
+    def drain(self, max_items=None):
+        """
+        Retira hasta max_items mensajes (todos si es None) como lista de
+        (nivel, texto), junto con los descartados desde el último drain.
+        """
+        with self._lock:
+            n = len(self._buffer) if max_items is None else min(max_items, len(self._buffer))
+            items = [self._buffer.popleft() for _ in range(n)]
+            dropped, self.dropped = self.dropped, 0
+        return items, dropped
+
+
+def emit(channel, message, args, level, prefix=None):
+    """
+    Formatea (message % args) solo si el nivel está activo y lo envía al
+    canal, o lo imprime si no hay canal. Lo usan Bot._log y MultiBot._log.
+    """
+    if not (channel.enabled(level) if channel is not None else level >= LOG_LEVEL):
+        return
+    if args:
+        message = message % args
+    if prefix:
+        message = f"[{prefix}] {message}"
+    if channel is not None:
+        channel.put(message, level)
+    else:
+        print(message)
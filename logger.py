@@ -1,18 +1,210 @@
+import atexit
 import csv
+import glob
 import os
+import queue
+import re
+import threading
+import time
 from datetime import datetime
 
 LOG_FILE = os.getenv("LOG_FILE", "trades.csv")
+# Rotación opcional: por tamaño (bytes) y/o por antigüedad (segundos). 0 = desactivada.
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", "0"))
+LOG_ROTATE_SECONDS = int(os.getenv("LOG_ROTATE_SECONDS", "0"))
 
-# Inicializa CSV con cabeceras si no existe
-if not os.path.isfile(LOG_FILE):
-    with open(LOG_FILE, mode='w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(["timestamp", "action", "symbol", "price", "quantity", "cost", "revenue", "pnl"])
+# Sufijo que agrega la rotación a los archivos viejos (ver TradeLogWriter._maybe_rotate)
+ROTATED_SUFFIX = re.compile(r"-\d{8}-\d{6}(-\d+)?$")
+
+HEADER = ["timestamp", "action", "symbol", "price", "quantity", "cost", "revenue", "pnl"]
+
+
+class TradeLogWriter:
+    """
+    Escribe las operaciones en el CSV desde un hilo en segundo plano.
+
+    log_trade solo encola la fila, así que el hilo que ejecuta las órdenes
+    no espera al disco. El hilo escritor agrupa las filas que llegan dentro
+    de flush_interval segundos (o hasta batch_size) en una sola escritura,
+    rota el archivo por tamaño o antigüedad si se configuró y vacía la cola
+    al cerrar el proceso.
+    """
+
+    def __init__(self, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, rotate_seconds=LOG_ROTATE_SECONDS,
+                 flush_interval=1.0, batch_size=500):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._opened_at = time.time()
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # El hilo no sobrevive a un fork: cada proceso arranca el suyo
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="trade-log-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, row):
+        self._ensure_started()
+        self._queue.put(row)
+
+    def log_trade(self, action, symbol, price, quantity, cost=None, revenue=None, pnl=None):
+        ts = datetime.utcnow().isoformat()
+        self.write([ts, action, symbol, price, quantity, cost or "", revenue or "", pnl or ""])
+
+    def pending(self):
+        """Filas encoladas que todavía no se escribieron."""
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """Bloquea hasta que todas las filas encoladas estén en el disco."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch, waiters = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break  # Un flush pedido explícitamente no espera al resto del lote
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except OSError as e:
+                    print(f"Error al escribir {self.path}: {e}")
+            for waiter in waiters:
+                waiter.set()
+
+    def _write_batch(self, rows):
+        self._maybe_rotate()
+        new_file = not os.path.isfile(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, mode='a', newline='') as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(HEADER)
+                self._opened_at = time.time()
+            writer.writerows(rows)
+
+    def _maybe_rotate(self):
+        if not os.path.isfile(self.path):
+            return
+        too_big = self.max_bytes and os.path.getsize(self.path) >= self.max_bytes
+        too_old = self.rotate_seconds and time.time() - self._opened_at >= self.rotate_seconds
+        if too_big or too_old:
+            base, ext = os.path.splitext(self.path)
+            rotated = f"{base}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}"
+            n = 1
+            while os.path.exists(rotated + ext):
+                rotated = f"{base}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{n}"
+                n += 1
+            os.replace(self.path, rotated + ext)
+
+
+_writer = TradeLogWriter()
+atexit.register(_writer.flush, 5.0)
 
 
 def log_trade(action, symbol, price, quantity, cost=None, revenue=None, pnl=None):
-    ts = datetime.utcnow().isoformat()
-    with open(LOG_FILE, mode='a', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow([ts, action, symbol, price, quantity, cost or "", revenue or "", pnl or ""])
\ No newline at end of file
+    _writer.log_trade(action, symbol, price, quantity, cost, revenue, pnl)
+
+
+def bot_log_file(name, path=LOG_FILE):
+    """CSV de operaciones propio de un bot del supervisor, p. ej. trades_BTCUSDT.csv."""
+    base, ext = os.path.splitext(path)
+    return f"{base}_{name}{ext}"
+
+
+def trade_log_files(path=LOG_FILE):
+    """'path' y los CSV por bot que hay junto a él (bot_log_file), sin los rotados; solo los que existen."""
+    base, ext = os.path.splitext(path)
+    per_bot = sorted(p for p in glob.glob(glob.escape(base) + "_*" + ext)
+                     if not ROTATED_SUFFIX.search(os.path.splitext(p)[0]))
+    return ([path] if os.path.isfile(path) else []) + per_bot
+
+
+def pending_trades():
+    """Filas de log_trade que todavía esperan al hilo escritor."""
+    return _writer.pending()
+
+
+def flush_trades(timeout=None):
+    """Espera a que las operaciones registradas estén escritas en el CSV."""
+    _writer.flush(timeout)
+
+
+# --- Exportación columnar ---
+
+def read_trades_columns(archivo_csv=LOG_FILE):
+    """
+    Lee el CSV de operaciones como columnas NumPy tipadas: timestamp en
+    datetime64[us], action y symbol como texto y el resto en float64 (NaN si
+    la celda está vacía).
+    """
+    import numpy as np
+
+    with open(archivo_csv, newline='') as f:
+        rows = list(csv.reader(f))[1:]
+    columns = list(zip(*rows)) if rows else [()] * len(HEADER)
+
+    def floats(values):
+        return np.array([float(v) if v else np.nan for v in values], dtype=np.float64)
+
+    return {
+        "timestamp": np.array(columns[0], dtype="datetime64[us]"),
+        "action": np.array(columns[1], dtype="U4"),
+        "symbol": np.array(columns[2], dtype="U20"),
+        "price": floats(columns[3]),
+        "quantity": floats(columns[4]),
+        "cost": floats(columns[5]),
+        "revenue": floats(columns[6]),
+        "pnl": floats(columns[7]),
+    }
+
+
+def export_trades(archivo_csv=LOG_FILE, destino=None):
+    """
+    Exporta el CSV a un formato columnar tipado. Si 'destino' termina en
+    .parquet usa pandas + pyarrow; si no, escribe un .npz de NumPy que se
+    carga con load_trades_npz sin volver a parsear texto.
+    """
+    flush_trades()
+    destino = destino or os.path.splitext(archivo_csv)[0] + ".npz"
+    columns = read_trades_columns(archivo_csv)
+    if destino.endswith(".parquet"):
+        import pandas as pd
+        pd.DataFrame(columns).to_parquet(destino, index=False)
+    else:
+        import numpy as np
+        np.savez_compressed(destino, **columns)
+    return destino
+
+
+def load_trades_npz(path):
+    """Carga un .npz generado por export_trades como diccionario de columnas."""
+    import numpy as np
+
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
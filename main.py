@@ -1,166 +1,631 @@
 # main.py
-import json
-import math
-import os
+import asyncio
 import traceback
 import time
 import threading
+import numpy as np
 from dotenv import load_dotenv
-from binance.client import Client
-from config import load_config
-from strategy import MovingAverageCrossover
-from logger import log_trade
+from config import INTERVAL_MS, load_config
+from strategy import create_strategy
+from logger import log_trade, pending_trades
+from log_channel import DEBUG, INFO, WARNING, ERROR, LogChannel, emit
+from metrics import default_metrics, start_exporters
+from backtest import CLOSE, klines_to_array
+from candle_store import CANDLE_DIR, CandleStore
+from streaming import MarketStream
+from state_store import StateJournal
+from rest_client import RateLimitedClient
+from account import AccountModel
+from protection import FINAL_STATUSES, create_protection
+from symbol_rules import SymbolRules, exchange_info_path, load_rules
+from scheduler import Scheduler, server_clock, sync_server_time
 
 STATE_FILE = "state.json"
+# Cada cuántos segundos se reintenta cancelar la protección que dejó una
+# configuración anterior cuando el bot volvió al modo client
+STALE_PROTECTION_RETRY_SECONDS = 30
+
+def parse_symbol_info(symbol_info):
+    """Agrega a la respuesta de get_symbol_info los filtros que usa el bot."""
+    rules = SymbolRules(symbol_info)
+    symbol_info['step_size'] = rules.step_size
+    symbol_info['qty_precision'] = rules.qty_scale
+    symbol_info['tick_size'] = rules.tick_size
+    symbol_info['price_precision'] = rules.price_scale
+    symbol_info['min_notional'] = rules.min_notional
+    return symbol_info
 
 class Bot:
-    def __init__(self, log_queue=None):
+    """
+    Bot de un símbolo. Por defecto lee config.json y opera contra Binance;
+    para pruebas y simulaciones se le puede pasar un 'client' ya creado
+    (por ejemplo simulator.SimulatedExchange), la configuración 'cfg', un
+    'clock' con time() y wait(segundos) para el scheduler, el directorio de
+    velas y la función que registra las operaciones. La duración de cada
+    fase del bucle y los errores se registran en 'metrics'.
+    """
+
+    def __init__(self, log_queue=None, state_file=STATE_FILE, name=None, client=None, cfg=None,
+                 clock=None, candle_dir=CANDLE_DIR, trade_log=log_trade, metrics=None):
         self.log_queue = log_queue
+        self.state_file = state_file
+        self.name = name
         self.stop_event = threading.Event()
         self.bot_thread = None
+        self.clock = clock
+        self.candle_dir = candle_dir
+        self.trade_log = trade_log
+        self.metrics = metrics or default_metrics
 
-        self.client = None
-        self.cfg = None
+        self.client = client
+        self.cfg = cfg
         self.state = {}
         self.symbol_info = {}
+        self.rules = None
+        self.candles = None
+        self.journal = None
+        self.account = None
+        self.protection = None
+        # El stream de la cuenta (ejecuciones de la orden de protección) y el bucle tocan la misma posición
+        self._position_lock = threading.RLock()
+        self._protection_checked = 0.0
 
-    def _log(self, message):
-        """Envía un mensaje a la cola de la GUI si existe, si no, lo imprime."""
-        if self.log_queue:
-            self.log_queue.put(message)
-        else:
-            print(message)
+    def _log(self, message, *args, level=INFO):
+        """
+        Envía un mensaje al LogChannel de la GUI si existe, si no, lo imprime.
+        Con args el texto se arma como message % args solo si el nivel está
+        activo, así los mensajes frecuentes no cuestan nada cuando se filtran.
+        """
+        if level >= ERROR:
+            self.metrics.inc("bot_errors_total", bot=self.name or "bot")
+        emit(self.log_queue, message, args, level, prefix=self.name)
 
-    def _save_state(self):
-        """Guarda el estado actual en un archivo JSON."""
-        with open(STATE_FILE, 'w') as f:
-            json.dump(self.state, f, indent=4)
-        self._log(f"Estado guardado: {self.state}")
+    def _now(self):
+        return self.clock.time() if self.clock is not None else time.time()
+
+    def _timer(self, phase):
+        """with self._timer("klines"): ... mide una fase del bucle en bot_phase_seconds."""
+        return self.metrics.timer("bot_phase_seconds", bot=self.name or "bot", phase=phase)
+
+    def _save_state(self, force=False):
+        """
+        Registra el estado actual en el diario. Con force=True (compras y
+        ventas) se escribe y sincroniza en el acto; si no, las escrituras se
+        agrupan para no tocar el disco con cada nuevo máximo.
+        """
+        with self._timer("save_state"):
+            saved = self.journal.save(self.state, force=force)
+        if saved and force:
+            self._log("Estado guardado: %s", self.state)
 
     def _load_state(self):
-        """Carga el estado desde un archivo JSON."""
+        """Carga el estado desde el snapshot y el diario de state_file."""
         initial_state = {"btc_balance": 0.0, "entry_price": 0.0, "highest_price_since_buy": 0.0}
-        if not os.path.exists(STATE_FILE):
-            self.state = initial_state
-            return
-        try:
-            with open(STATE_FILE, 'r') as f:
-                self.state = json.load(f)
-        except (json.JSONDecodeError, IOError):
-            self.state = initial_state
+        self.journal = StateJournal(self.state_file)
+        self.state = self.journal.load(initial_state)
+        if not self.journal.recovered:
+            self._log(f"⚠️ No se pudo recuperar el estado de {self.state_file}. Revisa si hay una posición abierta en Binance.", level=WARNING)
 
     def setup(self):
         """Configura el bot, carga la configuración y se conecta al cliente."""
         try:
             self._log("Cargando configuración...")
             load_dotenv()
-            self.cfg = load_config()
-            api_key = self.cfg["api_key"]
-            api_secret = self.cfg["api_secret"]
+            if self.cfg is None:
+                self.cfg = load_config()
             testnet = self.cfg["testnet"]
 
-            self._log("Inicializando cliente de Binance...")
-            self.client = Client(api_key, api_secret, testnet=testnet)
-            self.client.ping() # Verificar conexión
-            self._log("Conexión con Binance exitosa.")
-
-            self._log(f"Obteniendo reglas de trading para {self.cfg['symbol']}...")
-            self.symbol_info = self.client.get_symbol_info(self.cfg['symbol'])
-            
-            lot_size = next(f for f in self.symbol_info['filters'] if f['filterType'] == 'LOT_SIZE')
-            price_filter = next(f for f in self.symbol_info['filters'] if f['filterType'] == 'PRICE_FILTER')
-            notional = next(f for f in self.symbol_info['filters'] if f['filterType'] == 'NOTIONAL')
-
-            self.symbol_info['step_size'] = float(lot_size['stepSize'])
-            self.symbol_info['qty_precision'] = int(round(-math.log(self.symbol_info['step_size'], 10), 0))
-            self.symbol_info['tick_size'] = float(price_filter['tickSize'])
-            self.symbol_info['price_precision'] = int(round(-math.log(self.symbol_info['tick_size'], 10), 0))
-            self.symbol_info['min_notional'] = float(notional['minNotional'])
+            if self.client is None:
+                self._log("Inicializando cliente de Binance...")
+                # api_url vacío = la API de Binance; sirve para apuntar a un servidor local de pruebas
+                self.client = RateLimitedClient(self.cfg["api_key"], self.cfg["api_secret"], testnet=testnet,
+                                                api_url=self.cfg.get('api_url') or None)
+                self._log("Conexión con Binance exitosa.")  # El constructor del cliente ya hace un ping
+                self._log(f"Obteniendo reglas de trading para {self.cfg['symbol']}...")
+                # De la tabla de reglas guardada en disco mientras no venza; solo se pide a Binance si hace falta
+                info_path = exchange_info_path(self.client)
+                raw_info = load_rules(self.client, info_path, log=self._log).get(self.cfg['symbol'])
+                if raw_info is None:
+                    # Símbolo nuevo que la copia guardada todavía no conoce
+                    raw_info = load_rules(self.client, info_path, ttl=0, log=self._log).get(self.cfg['symbol'])
+            else:
+                # Cliente provisto: sus reglas no se mezclan con la copia en disco de Binance
+                self.client.ping()
+                self._log(f"Obteniendo reglas de trading para {self.cfg['symbol']}...")
+                raw_info = self.client.get_symbol_info(self.cfg['symbol'])
+            if raw_info is None:
+                raise ValueError(f"Binance no reconoce el símbolo {self.cfg['symbol']}")
+            self.rules = SymbolRules(raw_info)
+            self.symbol_info = parse_symbol_info(dict(raw_info))
             self._log("Reglas de trading obtenidas.")
-            
+
+            self.candles = CandleStore(self.cfg['symbol'], self.cfg['interval'], self.candle_dir)
+
+            # Saldos en memoria: se cargan una vez y después los actualiza el user data stream
+            self.account = AccountModel(self.client, log=self._log, on_execution=self._on_execution,
+                                        url=self.cfg.get('stream_url') or None, testnet=testnet)
+            self.account.reconcile()
+
             return True
         except Exception as e:
-            self._log(f"Error en la configuración: {e}")
+            self._log(f"Error en la configuración: {e}", level=ERROR)
             traceback.print_exc()
             return False
 
+    def _fetch_candles(self, limit=100):
+        """
+        Devuelve las últimas 'limit' velas como array (n, 6); la última es la
+        vela en curso.
+
+        Las velas cerradas se guardan en el CandleStore, así que cada pasada
+        solo pide a Binance las velas posteriores a la última guardada (en
+        régimen normal, una o dos) en lugar de las 100 completas.
+        """
+        last = self.candles.last_open_time()
+        if last is None:
+            klines = self.client.get_klines(symbol=self.cfg['symbol'], interval=self.cfg['interval'], limit=limit)
+        else:
+            # Paginar por si el bot estuvo detenido más de 1000 velas
+            klines = []
+            start = last + INTERVAL_MS[self.cfg['interval']]
+            while True:
+                page = self.client.get_klines(symbol=self.cfg['symbol'], interval=self.cfg['interval'],
+                                              startTime=start, limit=1000)
+                klines.extend(page)
+                if len(page) < 1000:
+                    break
+                start = page[-1][0] + INTERVAL_MS[self.cfg['interval']]
+
+        data = klines_to_array(klines)
+        # La última vela que devuelve Binance es la que está en curso: no se guarda
+        self.candles.append(data[:-1])
+        return np.vstack((self.candles.tail(limit - 1), data[-1:]))
+
+    def _buy(self, current_price, usdt_balance):
+        """Dimensiona y coloca la orden de compra tras una señal."""
+        quantity = self._buy_quantity(current_price, usdt_balance)
+        if quantity is None:
+            return
+        self._log("Intentando colocar orden de compra...")
+        with self._timer("order"):
+            order = self.client.order_market_buy(symbol=self.cfg['symbol'], quantity=quantity)
+        self._record_buy(order)
+
+    def _buy_quantity(self, current_price, usdt_balance):
+        """
+        Cantidad a comprar ya formateada para la orden, o None si no hay
+        fondos suficientes o no se alcanza el nocional mínimo.
+        """
+        capital_to_risk = self.cfg['usdt_amount'] * self.cfg['risk']
+        if usdt_balance < capital_to_risk:
+            self._log(f"Fondos insuficientes. Se necesitan {capital_to_risk:.2f} USDT.", level=WARNING)
+            return None
+        qty = capital_to_risk / current_price
+        if not self.rules.valid_order(qty, current_price):
+            adjusted_qty = self.rules.qty_units(qty) / 10 ** self.rules.qty_scale
+            self._log(f"Valor nocional ({adjusted_qty * current_price:.2f}) es menor que el mínimo ({self.rules.min_notional}).", level=WARNING)
+            return None
+        return self.rules.quantity(qty)
+
+    def _record_buy(self, order):
+        """Actualiza el estado y el registro de trades con una orden de compra ejecutada."""
+        self.state['btc_balance'] = float(order["executedQty"])
+        cost = float(order["cummulativeQuoteQty"])
+        self.state['entry_price'] = cost / self.state['btc_balance']
+        self.state['highest_price_since_buy'] = self.state['entry_price']
+        self._log(f"🔔 BUY {self.state['btc_balance']:.{self.symbol_info['qty_precision']}f} BTC @ {self.state['entry_price']:.{self.symbol_info['price_precision']}f} USDT")
+        # Primero el estado: si el proceso muere aquí, la posición abierta no se pierde
+        self._save_state(force=True)
+        self.trade_log(action="BUY", symbol=self.cfg['symbol'], price=self.state['entry_price'], quantity=self.state['btc_balance'], cost=cost)
+        if self.protection is not None:
+            with self._position_lock:
+                self._protect(self._net_quantity(order))
+
+    def _net_quantity(self, order):
+        """Cantidad comprada descontando la comisión cobrada en el activo base, ajustada al stepSize."""
+        qty = float(order["executedQty"])
+        for fill in order.get("fills", []):
+            if fill.get("commissionAsset") == self.symbol_info['baseAsset']:
+                qty -= float(fill["commission"])
+        return self.rules.quantity(qty)
+
+    def _protect(self, quantity, stop=None):
+        """Coloca la orden de protección de la posición; si falla, la posición queda con el trailing stop del bot."""
+        try:
+            with self._timer("order"):
+                record = self.protection.place(quantity, self.state['entry_price'], self.state['highest_price_since_buy'],
+                                               stop=stop)
+        except Exception as e:
+            self._log(f"⚠️ No se pudo colocar la orden de protección: {e}. Se usará el trailing stop del bot.", level=ERROR)
+            self.state.pop('protection', None)
+            self._save_state(force=True)
+            return
+        self.state['protection'] = record
+        self._save_state(force=True)
+        self._log(f"🛡️ Protección {record['mode']} en el exchange: órdenes {record['orders']}, stop {record['stop']}")
+
+    def _resume_protection(self):
+        """Al arrancar con una posición abierta: confirma su orden de protección o la coloca si falta."""
+        if self.state.get('entry_price', 0.0) == 0:
+            return
+        record = self.state.get('protection')
+        if record and self.protection is None:
+            self._log(f"La configuración no usa protección en el exchange: se cancelan las órdenes {record['orders']}.")
+            self._cancel_stale_protection()
+        elif record:
+            self._sync_protection()
+        elif self.protection is not None:
+            try:
+                quantity = self._sell_quantity()
+            except Exception as e:
+                self._log(f"⚠️ No se pudo colocar la orden de protección: {e}. Se usará el trailing stop del bot.", level=ERROR)
+                return
+            if quantity is None:
+                self._position_missing()
+            else:
+                self._protect(quantity)
+
+    def _cancel_stale_protection(self):
+        """
+        La configuración volvió al modo client pero queda la protección de la
+        anterior, que bloquearía el saldo a vender. El registro se borra solo
+        cuando la cancelación funciona o las órdenes ya no están abiertas (si
+        se ejecutó, se registra la venta); si no, se conserva y se reintenta
+        en la próxima pasada del trailing stop.
+        """
+        self._protection_checked = self._now()
+        # Sin registro mientras tanto: la cancelación que informe el stream no es una pérdida de la protección
+        record = self.state.pop('protection')
+        try:
+            self.client.cancel_order(symbol=self.cfg['symbol'], orderId=record['orders'][0])
+        except Exception as e:
+            try:
+                orders = [self.client.get_order(symbol=self.cfg['symbol'], orderId=order_id)
+                          for order_id in record['orders']]
+            except Exception:
+                orders = None
+            if orders is None or any(order['status'] not in FINAL_STATUSES for order in orders):
+                self.state['protection'] = record
+                self._log(f"⚠️ No se pudo cancelar la orden de protección: {e}. Se reintentará.", level=WARNING)
+                return
+            filled = [order for order in orders if order['status'] == 'FILLED']
+            if filled:
+                self._protection_filled(filled[0]['executedQty'], filled[0]['cummulativeQuoteQty'])
+                return
+        self._save_state(force=True)
+
+    def _sync_protection(self, replacing=False):
+        """
+        Consulta por REST la orden de protección: al reiniciar, si se perdió
+        un evento del stream o si falló un reemplazo ('replacing').
+        """
+        record = self.state['protection']
+        try:
+            executed, closed = self.protection.status(record)
+        except Exception as e:
+            self._log(f"⚠️ No se pudo consultar la orden de protección: {e}", level=WARNING)
+            return
+        if executed is not None and executed['status'] == 'FILLED':
+            self._protection_filled(executed['executedQty'], executed['cummulativeQuoteQty'])
+        elif closed:
+            executed = executed or {'executedQty': 0, 'cummulativeQuoteQty': 0}
+            self._protection_closed(executed['executedQty'], executed['cummulativeQuoteQty'], replacing)
+
+    def _protection_filled(self, executed_qty, quote_qty):
+        self._log("🛡️ Orden de protección ejecutada en el exchange.")
+        self._record_sell({'executedQty': executed_qty, 'cummulativeQuoteQty': quote_qty})
+
+    def _protection_closed(self, executed_qty, quote_qty, replacing=False):
+        """
+        La orden de protección terminó sin ejecutarse completa. Lo que alcanzó
+        a venderse se registra y el resto se vuelve a proteger enseguida con
+        el mismo stop. Si no se vendió nada y no la cerró un reemplazo
+        fallido ('replacing'), la canceló alguien más: queda el trailing stop
+        del bot.
+        """
+        record = self.state.pop('protection')
+        executed = float(executed_qty)
+        if executed > 0:
+            self._log(f"🛡️ Orden de protección ejecutada en parte ({executed_qty}) y cerrada.", level=WARNING)
+            self._log_sell(executed, float(quote_qty))
+            self.state['btc_balance'] = max(0.0, self.state['btc_balance'] - executed)
+        elif not replacing:
+            self._log("⚠️ La orden de protección se canceló o venció sin ejecutarse. Se usará el trailing stop del bot.", level=WARNING)
+            self._save_state(force=True)
+            return
+        remaining = float(record['quantity']) - executed
+        if not self.rules.valid_order(remaining, record['stop']):
+            # Un resto por debajo de minQty/minNotional no se puede vender: la posición queda cerrada
+            self._log(f"El resto de la posición ({remaining}) no alcanza el mínimo para una orden.", level=WARNING)
+            self.state = {"btc_balance": 0.0, "entry_price": 0.0, "highest_price_since_buy": 0.0}
+            self._save_state(force=True)
+            return
+        self._save_state(force=True)
+        self._protect(self.rules.quantity(remaining), stop=record['stop'])
+
+    def _update_protection(self, current_price):
+        """Con la protección en el exchange: la sube con el máximo y confirma si ya debería haberse disparado."""
+        record = self.state['protection']
+        highest = self.state['highest_price_since_buy']
+        if self.protection.triggered(record, current_price, highest):
+            # El exchange la ejecuta solo; se consulta por si el evento del stream se perdió
+            now = self._now()
+            if now - self._protection_checked >= self.protection.ratchet_seconds:
+                self._protection_checked = now
+                self._sync_protection()
+        elif self.protection.due(record, highest):
+            self._ratchet_protection(record)
+
+    def _ratchet_protection(self, record):
+        """Reemplaza la orden de protección por una con el stop más alto."""
+        highest = self.state['highest_price_since_buy']
+        self._log("Subiendo el stop de %s a %s", record['stop'], self.protection.stop_price(highest))
+        # Sin registro mientras tanto: la cancelación que informe el stream no es una pérdida de la protección
+        del self.state['protection']
+        try:
+            with self._timer("order"):
+                self.state['protection'] = self.protection.replace(record, highest)
+        except Exception as e:
+            # La orden anterior puede seguir abierta, haberse ejecutado o haber quedado cancelada sin reemplazo
+            self.state['protection'] = record
+            self._log(f"⚠️ No se pudo subir el stop de la orden de protección: {e}", level=WARNING)
+            self._sync_protection(replacing=True)
+            return
+        self._save_state(force=True)
+
+    def _check_trailing_stop(self, current_price, verbose=True):
+        """
+        Actualiza el máximo desde la compra y vende si el precio cae por
+        debajo del stop. Si la posición tiene protección en el exchange, la
+        venta queda a cargo de esa orden y aquí solo se sube su stop.
+        """
+        with self._position_lock:
+            if self.state.get('entry_price', 0.0) == 0:
+                return  # La protección la cerró mientras se consultaba el precio
+            hit = self._trailing_stop_hit(current_price, verbose)
+            if self.state.get('protection') and self.protection is None:
+                # Mientras la orden anterior siga abierta el saldo está bloqueado y no se puede vender
+                if self._now() - self._protection_checked < STALE_PROTECTION_RETRY_SECONDS:
+                    return
+                self._cancel_stale_protection()
+                if self.state.get('protection') or self.state.get('entry_price', 0.0) == 0:
+                    return
+            if self.state.get('protection'):
+                self._update_protection(current_price)
+            elif hit:
+                self._log(f"🔴 Trailing Stop activado. Vendiendo...")
+                quantity = self._sell_quantity()
+                if quantity is None:
+                    self._position_missing()
+                    return
+                with self._timer("order"):
+                    order = self.client.order_market_sell(symbol=self.cfg['symbol'], quantity=quantity)
+                self._record_sell(order)
+
+    def _trailing_stop_hit(self, current_price, verbose=True):
+        """Actualiza el máximo desde la compra y devuelve True si hay que vender."""
+        if current_price > self.state['highest_price_since_buy']:
+            self.state['highest_price_since_buy'] = current_price
+            self._save_state()
+            # En modo streaming llega con cada tick al alza: se formatea solo si DEBUG está activo
+            self._log("Nuevo precio máximo: %.*f USDT", self.symbol_info['price_precision'],
+                      self.state['highest_price_since_buy'], level=DEBUG)
+
+        trailing_stop_price = self.state['highest_price_since_buy'] * (1 - self.cfg['trailing_stop'])
+        if verbose:
+            precision = self.symbol_info['price_precision']
+            self._log("Precio: %.*f | Stop: %.*f", precision, current_price, precision, trailing_stop_price)
+
+        return current_price < trailing_stop_price
+
+    def _sell_quantity(self):
+        """
+        Cantidad a vender de la posición, ajustada al stepSize, o None si no
+        alcanza minQty. Con el modelo de cuenta no se vende más que el saldo
+        libre (parte de la posición pudo venderse o retirarse a mano); si el
+        saldo libre es menor que la posición, antes se reconcilia por REST
+        porque el modelo puede estar atrasado con respecto al exchange. Si
+        esa consulta falla se propaga la excepción: con un saldo sin
+        confirmar no se da la posición por perdida y se reintenta después.
+        """
+        qty = self.state['btc_balance']
+        if self.account is not None:
+            asset = self.symbol_info['baseAsset']
+            if self.account.free(asset) < qty:
+                try:
+                    self.account.reconcile()
+                except Exception as e:
+                    self._log(f"⚠️ No se pudo consultar el saldo de {asset}: {e}", level=WARNING)
+                    raise
+            qty = min(qty, self.account.free(asset))
+        units = self.rules.qty_units(qty)
+        if units <= 0 or units < self.rules.min_qty_units:
+            return None
+        return self.rules.quantity(qty)
+
+    def _position_missing(self):
+        """No queda saldo para vender: la posición se vendió o retiró fuera del bot y se da por cerrada."""
+        self._log(f"⚠️ No hay saldo libre de {self.symbol_info['baseAsset']} para vender la posición "
+                  f"({self.state['btc_balance']}); se vendió o retiró fuera del bot. Se da por cerrada.", level=WARNING)
+        self.state = {"btc_balance": 0.0, "entry_price": 0.0, "highest_price_since_buy": 0.0}
+        self._save_state(force=True)
+
+    def _on_execution(self, event):
+        """
+        executionReport del user data stream: informa las ejecuciones del
+        símbolo, incluidas las parciales, y cierra la posición cuando se
+        ejecuta su orden de protección.
+        """
+        if event['s'] != self.cfg['symbol']:
+            return
+        if event['x'] == 'TRADE':
+            self._log("Ejecución %s %s %s @ %s (%s)", event['S'], event['l'], event['s'], event['L'], event['X'])
+        with self._position_lock:
+            record = self.state.get('protection')
+            if not record or event['i'] not in record['orders']:
+                return
+            if event['X'] == 'FILLED':
+                self._protection_filled(event['z'], event['Z'])
+            elif event['X'] in FINAL_STATUSES:
+                # En una OCO la pata que no se ejecuta vence: la posición sigue protegida por la otra
+                record['orders'].remove(event['i'])
+                if float(event['z']) > 0:
+                    # Ejecutada en parte (p. ej. PARTIALLY_FILLED y luego EXPIRED): se registra al cerrarse
+                    record['executed'] = (event['z'], event['Z'])
+                if not record['orders']:
+                    self._protection_closed(*record.get('executed', (0, 0)))
+
+    def _record_sell(self, order):
+        """Registra una orden de venta ejecutada y deja el estado sin posición."""
+        self._log_sell(float(order['executedQty']), float(order['cummulativeQuoteQty']))
+        self.state = {"btc_balance": 0.0, "entry_price": 0.0, "highest_price_since_buy": 0.0}
+        self._save_state(force=True)
+
+    def _log_sell(self, sold_qty, revenue):
+        pnl = revenue - (self.state['entry_price'] * sold_qty)
+        self._log(f"🔔 SELL {sold_qty:.{self.symbol_info['qty_precision']}f} BTC → PnL = {pnl:.2f} USDT")
+        self.trade_log(action="SELL", symbol=self.cfg['symbol'], price=(revenue/sold_qty), quantity=sold_qty, revenue=revenue, pnl=pnl)
+
     def run(self):
         """El bucle principal del bot."""
         if not self.setup():
-            self._log("Finalizando el bot debido a un error en la configuración.")
+            self._log("Finalizando el bot debido a un error en la configuración.", level=ERROR)
             return
 
-        strat = MovingAverageCrossover(self.cfg["ma_fast"], self.cfg["ma_slow"])
+        try:
+            strat = create_strategy(self.cfg)
+        except (ValueError, TypeError) as e:
+            self._log(f"Estrategia inválida en la configuración: {e}", level=ERROR)
+            return
+        try:
+            self.protection = create_protection(self.cfg, self.client, self.rules, clock=self._now)
+        except ValueError as e:
+            self._log(f"Protección inválida en la configuración: {e}", level=ERROR)
+            return
         self._load_state()
-        self._log(f"Estado inicial cargado: {self.state}")
+        self._log("Estado inicial cargado: %s", self.state)
+        self.account.start(self.stop_event)
+        with self._position_lock:
+            self._resume_protection()
+        self._register_gauges()
+        start_exporters(self.metrics, log=self._log)
 
         self._log(f"🚀 Bot iniciado para {self.cfg['symbol']}")
-        self._log(f"   Capital: {self.cfg['usdt_amount']:.2f} USDT | Riesgo: {self.cfg['risk']*100:.1f}% | Trailing: {self.cfg['trailing_stop']*100:.1f}%")
+        self._log(f"   Capital: {self.cfg['usdt_amount']:.2f} USDT | Riesgo: {self.cfg['risk']*100:.1f}% | Trailing: {self.cfg['trailing_stop']*100:.1f}% | Protección: {self.cfg.get('protection', 'client')}")
 
-        while not self.stop_event.is_set():
-            try:
-                self._log(f"\nLoop a las {time.strftime('%H:%M:%S')}")
-                
-                btc_balance = self.state.get('btc_balance', 0.0)
-                entry_price = self.state.get('entry_price', 0.0)
-                highest_price_since_buy = self.state.get('highest_price_since_buy', 0.0)
+        if self.cfg.get("mode") == "streaming":
+            self._run_streaming(strat)
+        else:
+            self._run_polling(strat)
 
-                actual_usdt_balance = float(self.client.get_asset_balance("USDT")["free"])
-                self._log(f"USDT: {actual_usdt_balance:.2f} | BTC: {btc_balance:.{self.symbol_info['qty_precision']}f}")
+        self.journal.close(self.state)
+        self._log("Bucle del bot detenido.")
 
-                klines = self.client.get_klines(symbol=self.cfg['symbol'], interval=self.cfg['interval'], limit=100)
-                closes = [float(k[4]) for k in klines]
-                current_price = closes[-1]
+    def _run_streaming(self, strat):
+        """
+        Modo streaming: el trailing stop se evalúa con cada actualización de
+        precio del stream y el cruce de medias al cierre de cada vela, usando
+        el modo incremental de la estrategia. MarketStream corre los callbacks
+        en un hilo aparte, así que pueden hacer llamadas REST sin frenar el stream.
+        """
+        def backfill():
+            # Al conectar (y tras cada reconexión) se rellenan por REST las velas perdidas
+            try:
+                candles = self._fetch_candles(max(100, strat.warmup + 1))
+                strat.reset()
+                strat.seed(candles[:-1])
+            except Exception as e:
+                self._log(f"⚠️ Error al rellenar velas: {e}", level=ERROR)
+                traceback.print_exc()
+
+        def on_price(price):
+            if self.state.get('entry_price', 0.0) == 0:
+                return
+            try:
+                self._check_trailing_stop(price, verbose=False)
+            except Exception as e:
+                self._log(f"⚠️ Error al evaluar el trailing stop: {e}", level=ERROR)
+                traceback.print_exc()
 
-                if entry_price == 0:
-                    if strat.should_buy(closes):
+        def on_kline_closed(k):
+            try:
+                # Cuánto tarda en llegar y procesarse el cierre de la vela (k['T'] es su close time)
+                self.metrics.observe("stream_lag_seconds", time.time() - k['T'] / 1000, bot=self.name or "bot")
+                close = float(k['c'])
+                if not self.candles.append([[k['t'], k['o'], k['h'], k['l'], k['c'], k['v']]]):
+                    return  # Vela ya cargada por el backfill
+                with self._timer("strategy"):
+                    strat.update(close, float(k['h']), float(k['l']), float(k['v']))
+                    signal = strat.buy_signal()
+                if self.state.get('entry_price', 0.0) == 0:
+                    if signal:
                         self._log("Señal de compra detectada.")
-                        capital_to_risk = self.cfg['usdt_amount'] * self.cfg['risk']
-                        if actual_usdt_balance < capital_to_risk:
-                            self._log(f"Fondos insuficientes. Se necesitan {capital_to_risk:.2f} USDT.")
-                        else:
-                            qty = capital_to_risk / current_price
-                            adjusted_qty = math.floor(qty / self.symbol_info['step_size']) * self.symbol_info['step_size']
-                            if adjusted_qty * current_price < self.symbol_info['min_notional']:
-                                self._log(f"Valor nocional ({adjusted_qty * current_price:.2f}) es menor que el mínimo ({self.symbol_info['min_notional']}).")
-                            else:
-                                self._log("Intentando colocar orden de compra...")
-                                order = self.client.order_market_buy(symbol=self.cfg['symbol'], quantity=f"{adjusted_qty:.{self.symbol_info['qty_precision']}f}")
-                                self.state['btc_balance'] = float(order["executedQty"])
-                                cost = float(order["cummulativeQuoteQty"])
-                                self.state['entry_price'] = cost / self.state['btc_balance']
-                                self.state['highest_price_since_buy'] = self.state['entry_price']
-                                self._log(f"🔔 BUY {self.state['btc_balance']:.{self.symbol_info['qty_precision']}f} BTC @ {self.state['entry_price']:.{self.symbol_info['price_precision']}f} USDT")
-                                log_trade(action="BUY", symbol=self.cfg['symbol'], price=self.state['entry_price'], quantity=self.state['btc_balance'], cost=cost)
-                                self._save_state()
+                        self._buy(close, self.account.free("USDT"))
                 else:
-                    if current_price > highest_price_since_buy:
-                        self.state['highest_price_since_buy'] = current_price
-                        self._save_state()
-                        self._log(f"Nuevo precio máximo: {self.state['highest_price_since_buy']:.{self.symbol_info['price_precision']}f} USDT")
-                    
-                    trailing_stop_price = self.state['highest_price_since_buy'] * (1 - self.cfg['trailing_stop'])
-                    self._log(f"Precio: {current_price:.{self.symbol_info['price_precision']}f} | Stop: {trailing_stop_price:.{self.symbol_info['price_precision']}f}")
-
-                    if current_price < trailing_stop_price:
-                        self._log(f"🔴 Trailing Stop activado. Vendiendo...")
-                        order = self.client.order_market_sell(symbol=self.cfg['symbol'], quantity=f"{self.state['btc_balance']:.{self.symbol_info['qty_precision']}f}")
-                        sold_qty = float(order['executedQty'])
-                        revenue = float(order['cummulativeQuoteQty'])
-                        pnl = revenue - (self.state['entry_price'] * sold_qty)
-                        self._log(f"🔔 SELL {sold_qty:.{self.symbol_info['qty_precision']}f} BTC → PnL = {pnl:.2f} USDT")
-                        log_trade(action="SELL", symbol=self.cfg['symbol'], price=(revenue/sold_qty), quantity=sold_qty, revenue=revenue, pnl=pnl)
-                        self.state = {"btc_balance": 0.0, "entry_price": 0.0, "highest_price_since_buy": 0.0}
-                        self._save_state()
-
+                    self._check_trailing_stop(close)
             except Exception as e:
-                self._log(f"⚠️ Error en bucle principal: {e}")
+                self._log(f"⚠️ Error al procesar la vela: {e}", level=ERROR)
                 traceback.print_exc()
-            
-            # Esperar 60 segundos o hasta que el evento de parada sea activado
-            self.stop_event.wait(60)
-        
-        self._log("Bucle del bot detenido.")
+
+        stream = MarketStream(self.cfg['symbol'], self.cfg['interval'], on_price, on_kline_closed,
+                              on_connect=backfill, url=self.cfg.get('stream_url') or None,
+                              testnet=self.cfg['testnet'], log=self._log)
+        asyncio.run(stream.run(self.stop_event))
+
+    def _run_polling(self, strat):
+        """
+        Modo polling: la entrada se evalúa justo después de cada cierre de
+        vela (con la hora del servidor) y, con una posición abierta, el
+        trailing stop cada cfg['trailing_seconds'] segundos.
+        """
+        if self.clock is not None:
+            scheduler = Scheduler(self.stop_event, clock=self.clock.time, wait=self.clock.wait, log=self._log)
+        else:
+            try:
+                sync_server_time(self.client)
+            except Exception as e:
+                self._log(f"⚠️ No se pudo sincronizar la hora con Binance: {e}", level=WARNING)
+            scheduler = Scheduler(self.stop_event, clock=server_clock(self.client), log=self._log)
+            scheduler.every(3600, lambda: sync_server_time(self.client), name="hora del servidor")
+        scheduler.on_candle_close(self.cfg['interval'], lambda: self._poll_entry(strat), name="entrada", run_now=True)
+        scheduler.every(self.cfg.get('trailing_seconds', 60), self._poll_trailing, name="trailing stop")
+        scheduler.run()
+
+    def _poll_entry(self, strat):
+        """Al cierre de cada vela: busca señal de compra si no hay posición abierta."""
+        if self.state.get('entry_price', 0.0) != 0:
+            return
+        now = self._now()
+        self._log("\nVela cerrada, evaluando entrada a las %s", time.strftime('%H:%M:%S', time.localtime(now)))
+        actual_usdt_balance = self.account.free("USDT")
+        self._log("USDT: %.2f | %s: %.*f", actual_usdt_balance, self.symbol_info['baseAsset'],
+                  self.symbol_info['qty_precision'], self.account.free(self.symbol_info['baseAsset']))
+
+        with self._timer("klines"):
+            candles = self._fetch_candles(max(100, strat.warmup + 1) + 1)
+        # La última fila es la vela que acaba de abrir: la señal se evalúa sobre velas cerradas,
+        # igual que en modo streaming y en el backtest; su cierre parcial es el precio actual
+        with self._timer("strategy"):
+            signal = strat.should_buy(candles[:-1])
+        if signal:
+            self._log("Señal de compra detectada.")
+            self._buy(float(candles[-1, CLOSE]), actual_usdt_balance)
+
+    def _poll_trailing(self):
+        """Con una posición abierta, consulta el precio y evalúa el trailing stop."""
+        if self.state.get('entry_price', 0.0) == 0:
+            return
+        with self._timer("ticker"):
+            ticker = self.client.get_symbol_ticker(symbol=self.cfg['symbol'])
+        self._check_trailing_stop(float(ticker['price']))
+
+    def _register_gauges(self):
+        """Profundidad de las colas del bot, evaluada solo cuando se leen las métricas."""
+        if isinstance(self.log_queue, LogChannel):
+            self.metrics.gauge_callback("queue_depth", self.log_queue.depth, queue="log")
+        self.metrics.gauge_callback("queue_depth", pending_trades, queue="trades")
+        self.metrics.gauge_callback("bot_in_position", lambda: int(self.state.get('entry_price', 0.0) != 0),
+                                    bot=self.name or "bot")
 
     def start(self):
         """Inicia el bot en un hilo separado."""
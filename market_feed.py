@@ -0,0 +1,381 @@
+# market_feed.py
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from backtest import OPEN_TIME, HIGH, LOW, CLOSE, klines_to_array
+from config import INTERVAL_MS
+from metrics import default_metrics
+from scheduler import Scheduler, next_candle_close, server_clock, sync_server_time
+
+# Velas cerradas que el feed conserva (y envía al suscribirse) por símbolo e intervalo
+FEED_HISTORY = int(os.getenv("FEED_HISTORY", "1000"))
+# Cada cuántos segundos el feed publica los precios de todos los símbolos
+FEED_PRICE_SECONDS = float(os.getenv("FEED_PRICE_SECONDS", "10"))
+# Cuánto espera un bot la vela recién cerrada antes de pedirla él mismo por REST
+FEED_WAIT_SECONDS = float(os.getenv("FEED_WAIT_SECONDS", "5"))
+
+
+class MarketFeed:
+    """
+    Publicador de datos de mercado para los procesos del supervisor.
+
+    Pide a Binance las velas de cada (símbolo, intervalo) una sola vez por
+    cierre de vela y los precios de todos los símbolos cada price_seconds
+    (una consulta para todos), y los publica por un socket local de
+    multiprocessing.connection a cada proceso suscrito. Al suscribirse, un
+    proceso recibe las últimas 'history' velas cerradas de cada serie y
+    después solo las nuevas, así que N estrategias sobre el mismo símbolo
+    cuestan las mismas consultas que una.
+
+    Mensajes: ("snapshot", clave, cerradas, en_curso), ("candles", clave,
+    nuevas_cerradas, en_curso) y ("prices", {símbolo: precio}, time.time()),
+    con clave = (símbolo, intervalo) y las velas como arrays OHLCV.
+    """
+
+    def __init__(self, client, keys, address, authkey, history=FEED_HISTORY, price_seconds=FEED_PRICE_SECONDS,
+                 log=print, metrics=None):
+        self.client = client
+        self.keys = sorted(set(keys))
+        self.address = address
+        self.authkey = authkey
+        self.history = min(history, 999)  # Más la vela en curso: 1000, el máximo por petición
+        self.price_seconds = price_seconds
+        self.log = log
+        self.metrics = metrics or default_metrics
+        self.symbols = {symbol for symbol, _ in self.keys}
+
+        self._lock = threading.Lock()
+        self._closed = {}  # clave -> array (n, 6) de velas cerradas
+        self._current = {}  # clave -> fila de la vela en curso
+        self._subscribers = {}  # conexión -> _Subscription
+        self._listener = None
+
+    def run(self, stop_event):
+        """Publica hasta que se active stop_event."""
+        self._listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self._accept, name="feed-accept", daemon=True).start()
+        self.metrics.gauge_callback("feed_subscribers", self.subscriber_count)
+
+        try:
+            sync_server_time(self.client)
+        except Exception as e:
+            self.log(f"⚠️ No se pudo sincronizar la hora con Binance: {e}")
+        scheduler = Scheduler(stop_event, clock=server_clock(self.client), log=self.log, metrics=self.metrics)
+        scheduler.every(3600, lambda: sync_server_time(self.client), name="hora del servidor")
+        for interval in sorted({interval for _, interval in self.keys}, key=INTERVAL_MS.get):
+            keys = [key for key in self.keys if key[1] == interval]
+            scheduler.on_candle_close(interval, lambda keys=keys: self._refresh_all(keys),
+                                      name=f"velas {interval}", run_now=True)
+        scheduler.every(self.price_seconds, self._publish_prices, name="precios")
+        self.log(f"Feed de mercado en {self.address[0]}:{self.address[1]} para {len(self.keys)} series.")
+        try:
+            scheduler.run()
+        finally:
+            self._listener.close()
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for conn in subscribers:
+                conn.close()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return  # Listener cerrado al detener el feed
+            except Exception as e:
+                self.log(f"⚠️ Conexión rechazada: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name="feed-subscriber", daemon=True).start()
+
+    def _serve(self, conn):
+        """Atiende a un suscriptor: registra sus series, le manda la foto inicial y espera a que se desconecte."""
+        try:
+            kind, keys = conn.recv()
+            if kind != "subscribe":
+                conn.close()
+                return
+            subscription = _Subscription({tuple(key) for key in keys})
+            with self._lock:
+                self._subscribers[conn] = subscription
+                snapshots = [(key, self._closed[key], self._current[key])
+                             for key in subscription.keys if key in self._closed]
+            for key, closed, current in snapshots:
+                self._publish(conn, subscription, key, closed, None, current)
+            while conn.recv() is not None:
+                pass
+        except (EOFError, OSError):
+            pass
+        finally:
+            self._drop(conn)
+
+    def _drop(self, conn):
+        with self._lock:
+            self._subscribers.pop(conn, None)
+        conn.close()
+
+    def _send(self, conn, subscription, message):
+        try:
+            with subscription.lock:
+                conn.send(message)
+        except (EOFError, OSError):
+            self._drop(conn)
+
+    def _publish(self, conn, subscription, key, closed, new, current):
+        """
+        Manda la foto completa a quien todavía no la tiene y solo las velas
+        nuevas al resto. Se decide con el lock del suscriptor tomado, así una
+        foto vieja nunca llega después de una actualización.
+        """
+        try:
+            with subscription.lock:
+                if key in subscription.snapshotted:
+                    if new is not None:
+                        conn.send(("candles", key, new, current))
+                else:
+                    conn.send(("snapshot", key, closed, current))
+                    subscription.snapshotted.add(key)
+        except (EOFError, OSError):
+            self._drop(conn)
+
+    def _refresh_all(self, keys):
+        for key in keys:
+            try:
+                self.refresh(key)
+            except Exception as e:
+                self.log(f"⚠️ Error al pedir velas de {key[0]} {key[1]}: {e}")
+                self.metrics.inc("feed_errors_total", series=f"{key[0]}_{key[1]}")
+
+    def refresh(self, key):
+        """Pide las velas nuevas de la serie y las publica a quienes la siguen."""
+        symbol, interval = key
+        interval_ms = INTERVAL_MS[interval]
+        closed = self._closed.get(key)
+        with self.metrics.timer("feed_refresh_seconds", interval=interval):
+            if closed is None or len(closed) == 0:
+                klines = self.client.get_klines(symbol=symbol, interval=interval, limit=self.history + 1)
+            else:
+                # Paginar por si el feed estuvo caído más de 1000 velas
+                klines = []
+                start = int(closed[-1, OPEN_TIME]) + interval_ms
+                while True:
+                    page = self.client.get_klines(symbol=symbol, interval=interval, startTime=start, limit=1000)
+                    klines.extend(page)
+                    if len(page) < 1000:
+                        break
+                    start = page[-1][0] + interval_ms
+        data = klines_to_array(klines)
+        if len(data) == 0:
+            return
+        new, current = data[:-1], data[-1]
+        if closed is not None and len(closed):
+            new = new[new[:, OPEN_TIME] > closed[-1, OPEN_TIME]]
+            closed = np.concatenate((closed, new))[-self.history:]
+        else:
+            closed = new[-self.history:]
+
+        with self._lock:
+            self._closed[key] = closed
+            self._current[key] = current
+            subscribers = [(conn, sub) for conn, sub in self._subscribers.items() if key in sub.keys]
+        for conn, subscription in subscribers:
+            self._publish(conn, subscription, key, closed, new, current)
+
+    def _publish_prices(self):
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        if not subscribers:
+            return
+        with self.metrics.timer("feed_refresh_seconds", interval="prices"):
+            tickers = self.client.get_all_tickers()
+        received = time.time()
+        prices = {t["symbol"]: float(t["price"]) for t in tickers if t["symbol"] in self.symbols}
+        for conn, subscription in subscribers:
+            wanted = {s: p for s, p in prices.items() if s in subscription.symbols}
+            if wanted:
+                self._send(conn, subscription, ("prices", wanted, received))
+
+
+class _Subscription:
+    """Series que sigue un suscriptor y las que ya recibieron su foto inicial."""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.symbols = {symbol for symbol, _ in keys}
+        self.snapshotted = set()
+        self.lock = threading.Lock()
+
+
+class FeedSubscriber:
+    """
+    Lado del proceso de trabajo: se conecta al MarketFeed, se suscribe a
+    'keys' y mantiene en memoria las velas y los precios que recibe. Si el
+    feed se cae, reintenta con backoff exponencial; mientras tanto los
+    FeedClient piden los datos por REST como siempre.
+    """
+
+    def __init__(self, address, authkey, keys, log=print, max_backoff=30.0):
+        self.address = address
+        self.authkey = authkey
+        self.keys = sorted(set(keys))
+        self.log = log
+        self.max_backoff = max_backoff
+        self.connected = threading.Event()
+        self.thread = None
+
+        self._cond = threading.Condition()
+        self._closed = {}
+        self._current = {}
+        self._prices = {}  # símbolo -> (precio, time.time() de la consulta)
+
+    def start(self, stop_event):
+        self.thread = threading.Thread(target=self._run, args=(stop_event,), name="feed-subscriber", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self, stop_event):
+        backoff = 1.0
+        while not stop_event.is_set():
+            try:
+                conn = Client(self.address, authkey=self.authkey)
+            except OSError:
+                stop_event.wait(backoff)
+                backoff = min(self.max_backoff, backoff * 2)
+                continue
+            backoff = 1.0
+            try:
+                conn.send(("subscribe", self.keys))
+                self.connected.set()
+                while not stop_event.is_set():
+                    if conn.poll(0.5):
+                        self._apply(conn.recv())
+            except (EOFError, OSError):
+                self.log("⚠️ Se perdió la conexión con el feed de mercado; se usará REST hasta reconectar.")
+            finally:
+                self.connected.clear()
+                conn.close()
+                with self._cond:
+                    # Lo recibido antes del corte puede tener huecos: se espera una foto nueva
+                    self._closed.clear()
+                    self._current.clear()
+
+    def _apply(self, message):
+        kind = message[0]
+        with self._cond:
+            if kind == "snapshot":
+                _, key, closed, current = message
+                self._closed[key] = closed
+                self._current[key] = current
+            elif kind == "candles":
+                _, key, new, current = message
+                if key in self._closed:
+                    self._closed[key] = np.concatenate((self._closed[key], new))[-FEED_HISTORY:]
+                    self._current[key] = current
+            elif kind == "prices":
+                _, prices, received = message
+                for symbol, price in prices.items():
+                    self._prices[symbol] = (price, received)
+            self._cond.notify_all()
+
+    def klines(self, key, min_current_open, timeout=0.0):
+        """
+        Velas (n, 6) de la serie terminando en la vela en curso, o None si
+        el feed no tiene (en 'timeout' segundos) la vela en curso que abrió
+        en min_current_open o una posterior.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                current = self._current.get(key)
+                if current is not None and current[OPEN_TIME] >= min_current_open:
+                    return np.vstack((self._closed[key], current))
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def price(self, symbol, max_age):
+        """Último precio publicado del símbolo, o None si tiene más de max_age segundos."""
+        with self._cond:
+            price, received = self._prices.get(symbol, (None, 0.0))
+        return price if price is not None and time.time() - received <= max_age else None
+
+
+class FeedClient:
+    """
+    Cliente del bot dentro de un proceso de trabajo del supervisor:
+    get_klines y get_symbol_ticker salen del FeedSubscriber del proceso y
+    todo lo demás (órdenes, cuenta, reglas) va al cliente real. Si el feed
+    no tiene los datos a tiempo, también se piden al cliente real, así que
+    el bot nunca se queda sin velas ni precio por una caída del feed.
+    """
+
+    def __init__(self, client, subscriber, wait_seconds=FEED_WAIT_SECONDS, max_price_age=None, metrics=None):
+        self.client = client
+        self.subscriber = subscriber
+        self.wait_seconds = wait_seconds
+        self.max_price_age = max_price_age or 2 * FEED_PRICE_SECONDS
+        self.metrics = metrics or default_metrics
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    # sync_server_time escribe el desfase: tiene que llegar al cliente que firma las peticiones
+    @property
+    def timestamp_offset(self):
+        return self.client.timestamp_offset
+
+    @timestamp_offset.setter
+    def timestamp_offset(self, value):
+        self.client.timestamp_offset = value
+
+    def get_klines(self, **params):
+        symbol, interval = params.get("symbol"), params.get("interval")
+        if (symbol, interval) in self.subscriber.keys and self.subscriber.connected.is_set():
+            now = time.time() + self.client.timestamp_offset / 1000
+            current_open = int(next_candle_close(now, interval) * 1000) - INTERVAL_MS[interval]
+            data = self.subscriber.klines((symbol, interval), current_open, self.wait_seconds)
+            klines = self._select(data, params) if data is not None else None
+            if klines is not None:
+                self.metrics.inc("feed_reads_total", source="feed")
+                return klines
+        self.metrics.inc("feed_reads_total", source="rest")
+        return self.client.get_klines(**params)
+
+    def _select(self, data, params):
+        """Filtra las velas como lo haría Binance con startTime/endTime/limit; None si el feed no alcanza."""
+        limit = min(int(params.get("limit", 500)), 1000)
+        start, end = params.get("startTime"), params.get("endTime")
+        if start is not None and len(data) and data[0, OPEN_TIME] > start:
+            return None  # El bot estuvo detenido más tiempo del que guarda el feed
+        data = data.copy()
+        # Como en Binance, la vela en curso lleva el último precio; los bots la descartan al buscar señales
+        price = self.subscriber.price(params["symbol"], self.max_price_age)
+        if price is not None:
+            data[-1, CLOSE] = price
+            data[-1, HIGH] = max(data[-1, HIGH], price)
+            data[-1, LOW] = min(data[-1, LOW], price)
+        if end is not None:
+            data = data[data[:, OPEN_TIME] <= end]
+        if start is not None:
+            data = data[data[:, OPEN_TIME] >= start][:limit]
+        else:
+            data = data[-limit:]
+        return [[int(row[0]), *row[1:]] for row in data.tolist()]
+
+    def get_symbol_ticker(self, **params):
+        symbol = params.get("symbol")
+        price = self.subscriber.price(symbol, self.max_price_age) if symbol else None
+        if price is not None:
+            self.metrics.inc("feed_reads_total", source="feed")
+            return {"symbol": symbol, "price": repr(price)}
+        self.metrics.inc("feed_reads_total", source="rest")
+        return self.client.get_symbol_ticker(**params)
@@ -0,0 +1,323 @@
+# metrics.py
+import bisect
+import csv
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Puerto del endpoint /metrics (formato Prometheus); 0 = desactivado
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# CSV con una instantánea de las métricas cada METRICS_CSV_SECONDS; vacío = desactivado
+METRICS_CSV = os.getenv("METRICS_CSV", "")
+METRICS_CSV_SECONDS = float(os.getenv("METRICS_CSV_SECONDS", "60"))
+# Al superar este tamaño el CSV se rota a <archivo>.1, <archivo>.2, ... (se conservan METRICS_CSV_BACKUPS)
+METRICS_CSV_MAX_BYTES = int(os.getenv("METRICS_CSV_MAX_BYTES", str(10 * 1024 * 1024)))
+METRICS_CSV_BACKUPS = int(os.getenv("METRICS_CSV_BACKUPS", "3"))
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CSV_COLUMNS = ["timestamp", "metric", "labels", "value"]
+
+
+class Histogram:
+    """Histograma de buckets fijos: observar es una búsqueda binaria y tres sumas."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # El último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimación del cuantil q interpolando dentro del bucket (como histogram_quantile)."""
+        if self.count == 0:
+            return float("nan")
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                low = self.buckets[i - 1] if i else 0.0
+                return low + (self.buckets[i] - low) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class _Timer:
+    """Context manager de Metrics.timer: mide con perf_counter y observa al salir."""
+
+    __slots__ = ("metrics", "name", "labels", "started")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+def _labels_text(key):
+    if not key:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+
+class Metrics:
+    """
+    Registro de métricas en memoria: contadores, gauges, gauges calculados
+    al leer (gauge_callback, sin costo en el camino caliente) e histogramas
+    de latencia.
+
+    Cada serie se identifica por nombre y etiquetas (kwargs). Registrar un
+    valor cuesta un lock y una operación de diccionario, así que se puede
+    dejar activo en producción. render() lo expone en el formato de texto de
+    Prometheus y snapshot() como filas para el CSV.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._callbacks = {}
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(labels.items()))] = value
+
+    def gauge_callback(self, name, func, **labels):
+        """Gauge cuyo valor es func(), evaluado solo al leer las métricas."""
+        with self._lock:
+            self._callbacks[(name, tuple(labels.items()))] = func
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def value(self, name, **labels):
+        """Valor actual de un contador o gauge (0 si todavía no se registró)."""
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0))
+
+    def timer(self, name, **labels):
+        """with metrics.timer("bot_phase_seconds", phase="klines"): ... observa la duración del bloque."""
+        return _Timer(self, name, labels)
+
+    def _gauge_values(self):
+        with self._lock:
+            gauges = dict(self._gauges)
+            callbacks = list(self._callbacks.items())
+        for key, func in callbacks:
+            try:
+                gauges[key] = func()
+            except Exception:
+                continue  # Un gauge roto no debe tirar el endpoint
+        return gauges
+
+    def snapshot(self):
+        """Lista de (métrica, etiquetas, valor); de cada histograma, count, sum y p50/p95/p99."""
+        gauges = self._gauge_values()
+        with self._lock:
+            rows = [(name, key, value) for (name, key), value in self._counters.items()]
+            for (name, key), h in self._histograms.items():
+                rows.append((name + "_count", key, h.count))
+                rows.append((name + "_sum", key, h.sum))
+                for q in (0.5, 0.95, 0.99):
+                    rows.append((f"{name}_p{int(q * 100)}", key, h.quantile(q)))
+        rows.extend((name, key, value) for (name, key), value in gauges.items())
+        return sorted(rows, key=lambda r: (r[0], r[1]))
+
+    def render(self):
+        """Métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+        gauges = self._gauge_values()
+        series = {}  # nombre -> (tipo, líneas)
+        with self._lock:
+            for (name, key), value in sorted(self._counters.items()):
+                series.setdefault(name, ("counter", []))[1].append(f"{name}{_labels_text(key)} {value}")
+            for (name, key), h in sorted(self._histograms.items()):
+                lines = series.setdefault(name, ("histogram", []))[1]
+                cumulative = 0
+                for bound, n in zip(h.buckets + ("+Inf",), h.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels_text(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels_text(key)} {h.sum}")
+                lines.append(f"{name}_count{_labels_text(key)} {h.count}")
+        for (name, key), value in sorted(gauges.items()):
+            series.setdefault(name, ("gauge", []))[1].append(f"{name}{_labels_text(key)} {value}")
+
+        out = []
+        for name, (kind, lines) in sorted(series.items()):
+            if name in self._help:
+                out.append(f"# HELP {name} {self._help[name]}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+# Un registro por proceso, como el RateLimiter compartido
+default_metrics = Metrics()
+default_metrics.describe("binance_request_seconds", "Latencia de las peticiones REST por endpoint")
+default_metrics.describe("binance_request_errors_total", "Peticiones REST fallidas por endpoint y estado")
+default_metrics.describe("rate_limit_wait_seconds", "Espera en el RateLimiter antes de cada petición")
+default_metrics.describe("bot_phase_seconds", "Duración de cada fase del bucle del bot")
+default_metrics.describe("bot_errors_total", "Errores registrados por el bot")
+default_metrics.describe("scheduler_lag_seconds", "Retraso de cada tarea respecto de su hora programada")
+default_metrics.describe("scheduler_job_seconds", "Duración de cada tarea del scheduler")
+default_metrics.describe("scheduler_job_errors_total", "Tareas del scheduler que terminaron con excepción")
+default_metrics.describe("queue_depth", "Elementos pendientes en las colas internas")
+default_metrics.describe("supervisor_process_up", "1 si el proceso hijo del supervisor está vivo")
+default_metrics.describe("supervisor_restarts_total", "Reinicios de cada proceso hijo del supervisor")
+default_metrics.describe("feed_reads_total", "Lecturas de velas y precios servidas por el feed o por REST")
+
+
+# --- Exportadores ---
+
+class MetricsServer:
+    """Endpoint HTTP local con las métricas en /metrics (formato Prometheus), en un hilo propio."""
+
+    def __init__(self, metrics=None, port=METRICS_PORT, host=METRICS_HOST):
+        registry = metrics or default_metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Sin una línea por cada scrape
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-http", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class CsvReporter:
+    """
+    Anexa una instantánea de las métricas al CSV cada 'interval' segundos,
+    en un hilo propio. Al superar max_bytes rota el archivo (path.1 es el
+    más reciente) y conserva 'backups' copias.
+    """
+
+    def __init__(self, path=METRICS_CSV, metrics=None, interval=METRICS_CSV_SECONDS,
+                 max_bytes=METRICS_CSV_MAX_BYTES, backups=METRICS_CSV_BACKUPS):
+        self.path = path
+        self.metrics = metrics or default_metrics
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-csv", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.write()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Error al escribir {self.path}: {e}")
+
+    def write(self):
+        rows = self.metrics.snapshot()
+        self._maybe_rotate()
+        new_file = not os.path.isfile(self.path) or os.path.getsize(self.path) == 0
+        ts = datetime.utcnow().isoformat()
+        with open(self.path, mode='a', newline='') as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(CSV_COLUMNS)
+            for name, key, value in rows:
+                writer.writerow([ts, name, _labels_text(key), value])
+
+    def _maybe_rotate(self):
+        if not self.max_bytes or not os.path.isfile(self.path) or os.path.getsize(self.path) < self.max_bytes:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def start_exporters(metrics=None, port=METRICS_PORT, csv_path=METRICS_CSV, log=print):
+    """
+    Arranca (una sola vez por proceso) el endpoint HTTP si port != 0 y el
+    CSV si csv_path no está vacío. Lo llaman Bot.run y MultiBot.run.
+    """
+    with _exporters_lock:
+        if port and "http" not in _exporters:
+            try:
+                _exporters["http"] = MetricsServer(metrics, port).start()
+                log(f"Métricas disponibles en http://{METRICS_HOST}:{_exporters['http'].port}/metrics")
+            except OSError as e:
+                log(f"⚠️ No se pudo abrir el puerto de métricas {port}: {e}")
+        if csv_path and "csv" not in _exporters:
+            _exporters["csv"] = CsvReporter(csv_path, metrics).start()
+    return _exporters
@@ -0,0 +1,317 @@
+# multi_bot.py
+import asyncio
+import threading
+import time
+import traceback
+
+from binance import AsyncClient
+from dotenv import load_dotenv
+
+from backtest import klines_to_array
+from candle_store import CandleStore
+from config import INTERVAL_MS, bot_names, load_config, symbol_configs
+from log_channel import INFO, WARNING, ERROR, LogChannel, emit
+from logger import pending_trades
+from metrics import default_metrics, start_exporters
+from main import Bot, parse_symbol_info
+from strategy import create_strategy
+from scheduler import Scheduler, server_clock
+from symbol_rules import SymbolRules, compile_rules, exchange_info_path, read_cached_rules, save_rules
+
+# Peso de cada endpoint REST según la documentación de Binance
+WEIGHT_EXCHANGE_INFO = 20
+WEIGHT_ALL_TICKERS = 4
+WEIGHT_ACCOUNT = 20
+WEIGHT_KLINES = 2
+WEIGHT_ORDER = 1
+
+
+class WeightBudget:
+    """Token bucket con el peso REST por minuto que comparten todos los símbolos."""
+
+    def __init__(self, weight_per_minute=1200):
+        self.capacity = weight_per_minute
+        self.tokens = float(weight_per_minute)
+        self.rate = weight_per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, weight):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                await asyncio.sleep((weight - self.tokens) / self.rate)
+
+
+class MultiBot:
+    """
+    Ejecuta la estrategia para varios símbolos en un solo proceso asyncio.
+
+    Todos los símbolos comparten un AsyncClient (una sesión HTTP con
+    conexiones keep-alive) y un presupuesto de peso REST. En cada pasada se
+    piden los precios de todos los símbolos en una sola llamada y los
+    saldos, solo si algún símbolo quiere comprar, en otra; las velas de cada
+    símbolo se piden únicamente cuando cerró una nueva. Cada símbolo
+    conserva su propio Bot (estado, state_<nombre>.json, estrategia y
+    trailing stop), así que la lógica de compra y venta es la misma.
+
+    Las pasadas las dispara un Scheduler: justo después del cierre de vela
+    de cada símbolo (para evaluar su entrada) y cada poll_seconds (para los
+    trailing stops de los símbolos con posición). Si nadie tiene posición,
+    entre cierres de vela no se hace ninguna consulta.
+
+    Los símbolos salen de la clave "symbols" de config.json: una lista de
+    nombres o de diccionarios que sobrescriben la configuración base, por
+    ejemplo [{"symbol": "ETHUSDT", "ma_fast": 5}]. Un mismo símbolo puede
+    aparecer varias veces con otra estrategia; cada entrada se identifica
+    por su "name" (ver config.bot_names).
+    """
+
+    def __init__(self, log_queue=None, poll_seconds=60, weight_per_minute=1200):
+        self.log_queue = log_queue
+        self.poll_seconds = poll_seconds
+        self.weight_per_minute = weight_per_minute
+        self.stop_event = threading.Event()
+        self.bot_thread = None
+
+        self.client = None
+        self.budget = None
+        self.bots = []
+        self.strategies = {}
+
+    def _log(self, message, *args, level=INFO):
+        if level >= ERROR:
+            default_metrics.inc("bot_errors_total", bot="multi")
+        emit(self.log_queue, message, args, level)
+
+    symbol_configs = staticmethod(symbol_configs)
+
+    async def _call(self, weight, method, **params):
+        started = time.perf_counter()
+        await self.budget.acquire(weight)
+        sent = time.perf_counter()
+        endpoint = method.__name__
+        default_metrics.observe("rate_limit_wait_seconds", sent - started, endpoint=endpoint)
+        try:
+            return await method(**params)
+        except Exception as e:
+            default_metrics.inc("binance_request_errors_total", endpoint=endpoint,
+                                status=str(getattr(e, "status_code", type(e).__name__)))
+            raise
+        finally:
+            default_metrics.observe("binance_request_seconds", time.perf_counter() - sent, endpoint=endpoint)
+
+    async def _setup(self):
+        load_dotenv()
+        cfg = load_config()
+        self.budget = WeightBudget(self.weight_per_minute)
+        self._log("Inicializando cliente asíncrono de Binance...")
+        self.client = await AsyncClient.create(cfg["api_key"], cfg["api_secret"], testnet=cfg["testnet"])
+
+        # Una sola consulta de reglas para todos los símbolos, y solo si la copia en disco venció
+        info_path = exchange_info_path(self.client)
+        rules = read_cached_rules(info_path)
+        if rules is None or any(c["symbol"] not in rules for c in self.symbol_configs(cfg)):
+            rules = compile_rules(await self._call(WEIGHT_EXCHANGE_INFO, self.client.get_exchange_info))
+            try:
+                save_rules(rules, info_path)
+            except OSError as e:
+                self._log(f"⚠️ No se pudo guardar la tabla de reglas: {e}")
+
+        self.bots = []
+        configs = self.symbol_configs(cfg)
+        stores = {}
+        for name, sym_cfg in zip(bot_names(configs), configs):
+            symbol = sym_cfg["symbol"]
+            bot = Bot(log_queue=self.log_queue, state_file=f"state_{name}.json", name=name)
+            bot.cfg = sym_cfg
+            bot.symbol_info = parse_symbol_info(dict(rules[symbol]))
+            bot.rules = SymbolRules(rules[symbol])
+            # Los bots del mismo símbolo e intervalo comparten las velas: un solo archivo en disco
+            key = (symbol, sym_cfg["interval"])
+            if key not in stores:
+                stores[key] = CandleStore(symbol, sym_cfg["interval"])
+            bot.candles = stores[key]
+            self.strategies[name] = create_strategy(sym_cfg)
+            bot._load_state()
+            self.bots.append(bot)
+            self._log("🚀 %s listo | Estado: %s", name, bot.state)
+            if sym_cfg.get("protection", "client") != "client":
+                # Las órdenes de protección las maneja Bot.run con el cliente síncrono
+                self._log(f"⚠️ {name}: el modo multi-símbolo usa el trailing stop del bot, se ignora protection={sym_cfg['protection']}.",
+                          level=WARNING)
+
+    async def _candles(self, bot, limit=100):
+        """
+        Últimas 'limit' velas cerradas (n, 6) del símbolo; solo pide velas a
+        Binance si cerró alguna. La señal se evalúa sobre velas cerradas,
+        como en Bot y en el backtest.
+        """
+        symbol, interval = bot.cfg["symbol"], bot.cfg["interval"]
+        interval_ms = INTERVAL_MS[interval]
+        last = bot.candles.last_open_time()
+        now = int(time.time() * 1000) + self.client.timestamp_offset
+        if last is None:
+            klines = await self._call(WEIGHT_KLINES, self.client.get_klines,
+                                      symbol=symbol, interval=interval, limit=limit + 1)
+        else:
+            # Paginar por si el runner estuvo detenido más de 1000 velas
+            klines = []
+            start = last + interval_ms
+            # Mientras la vela en curso (start) no cierre no hay nada nuevo que pedir
+            while now >= start + interval_ms:
+                page = await self._call(WEIGHT_KLINES, self.client.get_klines,
+                                        symbol=symbol, interval=interval, startTime=start, limit=1000)
+                klines.extend(page)
+                if len(page) < 1000:
+                    break
+                start = page[-1][0] + interval_ms
+        # Como en Bot._fetch_candles, solo se descarta la última fila de la última página (la vela en curso)
+        bot.candles.append(klines_to_array(klines)[:-1])
+        return bot.candles.tail(limit)
+
+    async def _evaluate(self, bot, current_price, balances):
+        try:
+            if bot.state.get('entry_price', 0.0) == 0:
+                strat = self.strategies[bot.name]
+                candles = await self._candles(bot, max(100, strat.warmup + 1))
+                if strat.should_buy(candles):
+                    bot._log("Señal de compra detectada.")
+                    await balances.buy(bot, current_price)
+            elif bot._trailing_stop_hit(current_price):
+                bot._log("🔴 Trailing Stop activado. Vendiendo...")
+                quantity = bot._sell_quantity()
+                if quantity is None:
+                    bot._position_missing()
+                    return
+                order = await self._call(WEIGHT_ORDER, self.client.order_market_sell,
+                                         symbol=bot.cfg["symbol"], quantity=quantity)
+                bot._record_sell(order)
+        except Exception as e:
+            bot._log(f"⚠️ Error en bucle principal: {e}", level=ERROR)
+            traceback.print_exc()
+
+    async def _tick(self, closed):
+        """
+        Evalúa la entrada de los símbolos sin posición cuya vela acaba de
+        cerrar (closed) y el trailing stop de los que tienen posición.
+        """
+        bots = [bot for bot in self.bots
+                if bot.state.get('entry_price', 0.0) != 0 or bot.cfg["symbol"] in closed]
+        if not bots:
+            return
+        self._log("\nLoop a las %s", time.strftime('%H:%M:%S'))
+        tickers = await self._call(WEIGHT_ALL_TICKERS, self.client.get_all_tickers)
+        prices = {t["symbol"]: float(t["price"]) for t in tickers}
+        balances = _SharedBalances(self)
+        await asyncio.gather(*(self._evaluate(bot, prices[bot.cfg["symbol"]], balances)
+                               for bot in bots))
+
+    async def _main(self):
+        try:
+            await self._setup()
+        except Exception as e:
+            self._log(f"Error en la configuración: {e}", level=ERROR)
+            traceback.print_exc()
+            self._log("Finalizando el bot debido a un error en la configuración.", level=ERROR)
+            if self.client:
+                await self.client.close_connection()
+            return
+
+        if isinstance(self.log_queue, LogChannel):
+            default_metrics.gauge_callback("queue_depth", self.log_queue.depth, queue="log")
+        default_metrics.gauge_callback("queue_depth", pending_trades, queue="trades")
+        start_exporters(log=self._log)
+
+        # Un solo scheduler para todos los símbolos: cada cierre de vela marca
+        # su símbolo para evaluar la entrada y cada poll_seconds se revisan los trailing stops
+        scheduler = Scheduler(self.stop_event, clock=server_clock(self.client), log=self._log)
+        closed, due = set(), [False]
+
+        def candle_closed(symbol):
+            closed.add(symbol)
+            due[0] = True
+
+        for bot in self.bots:
+            symbol = bot.cfg["symbol"]
+            scheduler.on_candle_close(bot.cfg["interval"], lambda symbol=symbol: candle_closed(symbol),
+                                      name=f"entrada {symbol}", run_now=True)
+        scheduler.every(self.poll_seconds, lambda: due.__setitem__(0, True), name="trailing stop")
+
+        try:
+            while not self.stop_event.is_set():
+                delay = scheduler.run_pending()
+                if due[0]:
+                    due[0] = False
+                    try:
+                        with default_metrics.timer("bot_phase_seconds", bot="multi", phase="tick"):
+                            await self._tick(set(closed))
+                    except Exception as e:
+                        self._log(f"⚠️ Error en bucle principal: {e}", level=ERROR)
+                        traceback.print_exc()
+                    closed.clear()
+                    continue
+                # Esperar hasta la próxima tarea o hasta que se pida la detención
+                await asyncio.sleep(min(0.5, delay if delay is not None else 0.5))
+        finally:
+            await self.client.close_connection()
+            for bot in self.bots:
+                bot.journal.close(bot.state)
+        self._log("Bucle del bot detenido.")
+
+    def run(self):
+        asyncio.run(self._main())
+
+    def start(self):
+        """Inicia el runner en un hilo separado."""
+        self.stop_event.clear()
+        self.bot_thread = threading.Thread(target=self.run, daemon=True)
+        self.bot_thread.start()
+        self._log("Hilo del bot iniciado.")
+
+    def stop(self):
+        """Detiene el runner."""
+        if self.bot_thread and self.bot_thread.is_alive():
+            self.stop_event.set()
+            self._log("Señal de detención enviada al bot.")
+
+
+class _SharedBalances:
+    """
+    Saldo de USDT de una pasada: se consulta una sola vez (y solo si alguien
+    quiere comprar) y se descuenta lo que gasta cada compra para que dos
+    símbolos no usen el mismo saldo.
+    """
+
+    def __init__(self, runner):
+        self.runner = runner
+        self.usdt = None
+        self.lock = asyncio.Lock()
+
+    async def buy(self, bot, current_price):
+        runner = self.runner
+        async with self.lock:
+            if self.usdt is None:
+                account = await runner._call(WEIGHT_ACCOUNT, runner.client.get_account)
+                self.usdt = next((float(b["free"]) for b in account["balances"] if b["asset"] == "USDT"), 0.0)
+            quantity = bot._buy_quantity(current_price, self.usdt)
+            if quantity is None:
+                return
+            bot._log("Intentando colocar orden de compra...")
+            order = await runner._call(WEIGHT_ORDER, runner.client.order_market_buy,
+                                       symbol=bot.cfg["symbol"], quantity=quantity)
+            self.usdt -= float(order["cummulativeQuoteQty"])
+            bot._record_buy(order)
+
+
+if __name__ == "__main__":
+    runner = MultiBot()
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,192 @@
+# optimizer.py
+import argparse
+import heapq
+import itertools
+import os
+import random
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from backtest import (DEFAULT_MIN_NOTIONAL, DEFAULT_STEP_SIZE, load_ohlcv, resample_ohlcv,
+                      run_backtest, summarize)
+from config import INTERVAL_MS, get_default_config, load_config, save_config
+
+# Espacio de búsqueda por defecto
+DEFAULT_GRID = {
+    "ma_fast": [5, 7, 10, 12, 15, 20, 25, 30],
+    "ma_slow": [20, 30, 40, 50, 60, 80, 100],
+    "trailing_stop": [0.005, 0.01, 0.015, 0.02, 0.03, 0.05],
+    "risk": [0.01, 0.05, 0.1, 0.25],
+    "interval": ["1m", "5m", "15m", "1h"],
+}
+
+# Parámetros que el optimizador escribe en config.json
+PARAM_KEYS = ("ma_fast", "ma_slow", "trailing_stop", "risk", "interval")
+
+# Estado de cada proceso del pool (se inicializa en _init_worker)
+_worker = {}
+
+
+def grid_combinations(grid):
+    """Genera todas las combinaciones de la grilla donde ma_fast < ma_slow (perezoso)."""
+    keys = list(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        params = dict(zip(keys, values))
+        if params["ma_fast"] < params["ma_slow"]:
+            yield params
+
+
+def random_combinations(grid, samples, seed=None):
+    """
+    Genera 'samples' combinaciones al azar de la grilla donde ma_fast < ma_slow.
+    El par de medias se sortea entre los pares válidos, así que no hay
+    rechazos; si la grilla no tiene ninguno, ValueError.
+    """
+    pairs = [(fast, slow) for fast in grid["ma_fast"] for slow in grid["ma_slow"] if fast < slow]
+    if not pairs:
+        raise ValueError("Ninguna combinación de la grilla cumple ma_fast < ma_slow.")
+    return _sample_combinations(grid, pairs, samples, random.Random(seed))
+
+
+def _sample_combinations(grid, pairs, samples, rng):
+    keys = list(grid)
+    for _ in range(samples):
+        fast, slow = rng.choice(pairs)
+        yield {k: fast if k == "ma_fast" else slow if k == "ma_slow" else rng.choice(grid[k]) for k in keys}
+
+
+def _share_arrays(series):
+    """Copia cada array de velas a un bloque de memoria compartida."""
+    blocks, specs = [], {}
+    for interval, data in series.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[:] = data
+        blocks.append(shm)
+        specs[interval] = (shm.name, data.shape, data.dtype.str)
+    return blocks, specs
+
+
+def _init_worker(specs, base_cfg, step_size, min_notional, fee):
+    """Cada proceso se conecta a los bloques compartidos una sola vez: las velas no se serializan."""
+    _worker["blocks"] = []
+    _worker["series"] = {}
+    for interval, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _worker["blocks"].append(shm)  # Mantener la referencia para que el buffer siga vivo
+        _worker["series"][interval] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    _worker["base_cfg"] = base_cfg
+    _worker["rules"] = (step_size, min_notional, fee)
+
+
+def _evaluate(params):
+    """Ejecuta un backtest con los parámetros dados y devuelve (params, resumen)."""
+    cfg = dict(_worker["base_cfg"], **params)
+    step_size, min_notional, fee = _worker["rules"]
+    trades = run_backtest(_worker["series"][cfg["interval"]], cfg,
+                          step_size=step_size, min_notional=min_notional, fee=fee)
+    return params, summarize(trades)
+
+
+def _usable_intervals(intervals, base_interval, log=print):
+    """Intervalos de 'intervals' que se pueden agregar a partir de velas de 'base_interval'."""
+    base_ms = INTERVAL_MS[base_interval]
+    usable = [i for i in intervals if INTERVAL_MS.get(i, 0) >= base_ms and INTERVAL_MS.get(i, 0) % base_ms == 0]
+    skipped = [i for i in intervals if i not in usable]
+    if skipped:
+        log(f"⚠️ Se omiten los intervalos {', '.join(skipped)}: no se pueden armar con velas de {base_interval}.")
+    if not usable:
+        raise ValueError(f"Ningún intervalo de la grilla se puede armar con velas de {base_interval}.")
+    return usable
+
+
+def _rank_key(result):
+    """Mayor PnL primero; a igual PnL, menor drawdown y luego más operaciones."""
+    _, summary = result
+    return (summary["pnl"], -summary["max_drawdown"], summary["trades"])
+
+
+def optimize(ohlcv, base_interval="1m", grid=None, samples=0, seed=None, base_cfg=None, workers=None,
+             top=20, chunksize=64, step_size=DEFAULT_STEP_SIZE, min_notional=DEFAULT_MIN_NOTIONAL,
+             fee=0.0, progress=None, log=print):
+    """
+    Evalúa combinaciones de parámetros sobre el histórico en un pool de procesos.
+
+    Recorre la grilla completa o, si samples > 0, esa cantidad de
+    combinaciones al azar. 'ohlcv' son velas de 'base_interval'; para cada
+    intervalo pedido se agregan una vez en el proceso principal y se publican
+    en memoria compartida. Los resultados se consumen a medida que llegan y solo se
+    conservan los 'top' mejores, así que la memoria no crece con la cantidad
+    de combinaciones. Devuelve una lista de (params, resumen) ordenada.
+    Los intervalos que no se pueden armar con velas de 'base_interval' (más
+    cortos o que no son múltiplos) se descartan con un aviso en 'log'.
+    """
+    base_cfg = dict(base_cfg or load_config())
+    grid = dict(grid or DEFAULT_GRID)
+    grid.setdefault("interval", [base_cfg["interval"]])
+    grid["interval"] = _usable_intervals(grid["interval"], base_interval, log)
+    if samples:
+        combinations = random_combinations(grid, samples, seed)
+    else:
+        combinations = grid_combinations(grid)
+    intervals = set(grid["interval"])
+
+    ohlcv = np.asarray(ohlcv, dtype=np.float64)
+    series = {i: (ohlcv if i == base_interval else resample_ohlcv(ohlcv, i)) for i in intervals}
+    blocks, specs = _share_arrays(series)
+    del series
+
+    best = []
+    try:
+        with Pool(processes=workers or os.cpu_count(), initializer=_init_worker,
+                  initargs=(specs, base_cfg, step_size, min_notional, fee)) as pool:
+            for n, result in enumerate(pool.imap_unordered(_evaluate, combinations, chunksize=chunksize), 1):
+                item = (_rank_key(result), n, result)
+                if len(best) < top:
+                    heapq.heappush(best, item)
+                else:
+                    heapq.heappushpop(best, item)
+                if progress and n % 1000 == 0:
+                    progress(n)
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    return [result for _, _, result in sorted(best, reverse=True)]
+
+
+def save_best_config(results, base_cfg=None, path="config.optimizado.json"):
+    """Escribe la mejor combinación en formato config.json."""
+    if not results:
+        return False, "No hay resultados para guardar."
+    params, _ = results[0]
+    cfg = dict(base_cfg or load_config())
+    cfg.update({k: params[k] for k in PARAM_KEYS if k in params})
+    return save_config(cfg, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimizador de parámetros del bot sobre velas históricas.")
+    parser.add_argument("velas", help="Archivo .npy o .npz (downloader.py) con velas OHLCV")
+    parser.add_argument("--base-interval", default="1m", help="Intervalo de las velas del archivo")
+    parser.add_argument("--samples", type=int, default=0, help="Combinaciones al azar (0 = grilla completa)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--out", default="config.optimizado.json")
+    args = parser.parse_args()
+
+    base_cfg = load_config() if os.path.exists("config.json") else get_default_config()
+    results = optimize(load_ohlcv(args.velas, mmap_mode="r"), args.base_interval, samples=args.samples,
+                       seed=args.seed, base_cfg=base_cfg, workers=args.workers, top=args.top,
+                       progress=lambda n: print(f"{n} combinaciones evaluadas..."))
+    print("--- Mejores combinaciones ---")
+    for params, summary in results:
+        print(f"{params} -> PnL {summary['pnl']:.2f} | DD {summary['max_drawdown']:.2f} | Trades {summary['trades']}")
+    ok, msg = save_best_config(results, base_cfg, args.out)
+    print(msg)
+
+
+if __name__ == "__main__":
+    main()
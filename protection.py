@@ -0,0 +1,143 @@
+# protection.py
+import os
+import time
+
+# Cómo se protege una posición abierta (cfg["protection"]):
+#   client          el bot vigila el precio y vende a mercado (trailing stop propio, el de siempre)
+#   stop_loss       orden STOP_LOSS en el exchange que el bot sube con cada nuevo máximo
+#   trailing_delta  orden STOP_LOSS con trailingDelta: el exchange sigue el máximo solo
+#   oco             OCO con toma de ganancias (cfg["take_profit"]) y STOP_LOSS que el bot sube
+PROTECTION_MODES = ("client", "stop_loss", "trailing_delta", "oco")
+
+# Suba relativa mínima del stop para reemplazar la orden: cada reemplazo cuesta una cancelación y una orden nueva
+RATCHET_STEP = float(os.getenv("RATCHET_STEP", "0.002"))
+# Segundos mínimos entre dos reemplazos de la misma orden
+RATCHET_SECONDS = float(os.getenv("RATCHET_SECONDS", "10"))
+FINAL_STATUSES = ("FILLED", "CANCELED", "REJECTED", "EXPIRED", "EXPIRED_IN_MATCH")
+
+
+class ProtectiveOrders:
+    """
+    Órdenes de protección en el exchange para la posición de un bot.
+
+    Tras cada compra, place() coloca la orden de venta que corresponde al
+    modo y devuelve un registro (dict serializable) que el bot guarda en su
+    estado: así la posición queda protegida aunque el proceso esté lento o
+    caído, y la latencia del stop depende del motor del exchange. Con
+    stop_loss y oco el stop sigue a highest * (1 - trailing_stop), pero la
+    orden solo se reemplaza si el nuevo stop supera al anterior en
+    ratchet_step y pasaron ratchet_seconds desde el último reemplazo, para
+    no gastar el límite de órdenes con cada tick al alza.
+    """
+
+    def __init__(self, client, symbol, rules, mode, trailing_stop, take_profit=0.0,
+                 ratchet_step=RATCHET_STEP, ratchet_seconds=RATCHET_SECONDS, clock=time.time):
+        if mode not in PROTECTION_MODES or mode == "client":
+            raise ValueError(f"Modo de protección inválido: {mode!r}. Opciones: {', '.join(PROTECTION_MODES)}")
+        if mode == "oco" and take_profit <= 0:
+            raise ValueError("El modo oco necesita take_profit > 0")
+        self.client = client
+        self.symbol = symbol
+        self.rules = rules
+        self.mode = mode
+        self.trailing_stop = trailing_stop
+        self.take_profit = take_profit
+        self.ratchet_step = ratchet_step
+        self.ratchet_seconds = ratchet_seconds
+        self.clock = clock
+
+    def stop_price(self, highest):
+        return float(self.rules.price(highest * (1 - self.trailing_stop)))
+
+    def place(self, quantity, entry_price, highest, stop=None):
+        """
+        Coloca la protección de 'quantity' (texto ya ajustado al stepSize) y
+        devuelve su registro. 'stop' fija el stop en lugar de calcularlo desde
+        'highest' (para volver a colocar uno que se perdió).
+        """
+        if stop is None:
+            stop = self.stop_price(highest)
+        if self.mode == "trailing_delta":
+            # trailingDelta en BIPS: 2% = 200
+            order = self.client.create_order(symbol=self.symbol, side="SELL", type="STOP_LOSS", quantity=quantity,
+                                             trailingDelta=max(1, round(self.trailing_stop * 10000)))
+            orders = [order["orderId"]]
+        elif self.mode == "stop_loss":
+            order = self.client.create_order(symbol=self.symbol, side="SELL", type="STOP_LOSS", quantity=quantity,
+                                             stopPrice=self.rules.price(stop))
+            orders = [order["orderId"]]
+        else:
+            target = self.rules.price(entry_price * (1 + self.take_profit), up=True)
+            order_list = self.client.create_oco_order(symbol=self.symbol, side="SELL", quantity=quantity,
+                                                      price=target, stopPrice=self.rules.price(stop))
+            orders = [o["orderId"] for o in order_list["orders"]]
+        return self._record(orders, stop, quantity, entry_price)
+
+    def _record(self, orders, stop, quantity, entry_price):
+        return {"mode": self.mode, "orders": orders, "stop": stop, "quantity": quantity, "entry": entry_price,
+                "updated": self.clock()}
+
+    def due(self, record, highest):
+        """True si conviene subir el stop de 'record' al de 'highest'."""
+        if record["mode"] == "trailing_delta":
+            return False
+        return (self.stop_price(highest) >= record["stop"] * (1 + self.ratchet_step)
+                and self.clock() - record["updated"] >= self.ratchet_seconds)
+
+    def replace(self, record, highest):
+        """
+        Sube el stop de 'record' al de 'highest' y devuelve el registro nuevo.
+        Un STOP_LOSS se reemplaza con cancelReplace: el exchange cancela y
+        coloca en la misma petición, sin un intervalo sin protección entre dos
+        llamadas. Binance no admite cancelReplace en órdenes de una OCO, así
+        que esa se cancela y se coloca otra enseguida. Si algo falla lanza la
+        excepción; la orden anterior puede haber quedado cancelada, así que el
+        llamador tiene que consultarla.
+        """
+        stop = self.stop_price(highest)
+        if record["mode"] == "stop_loss":
+            response = self.client.cancel_replace_order(symbol=self.symbol, cancelReplaceMode="STOP_ON_FAILURE",
+                                                        cancelOrderId=record["orders"][0], side="SELL",
+                                                        type="STOP_LOSS", quantity=record["quantity"],
+                                                        stopPrice=self.rules.price(stop))
+            return self._record([response["newOrderResponse"]["orderId"]], stop, record["quantity"], record["entry"])
+        self.cancel(record)
+        return self.place(record["quantity"], record["entry"], highest, stop=stop)
+
+    def cancel(self, record):
+        """Cancela la protección (en una OCO, cancelar una pata cancela la lista completa)."""
+        return self.client.cancel_order(symbol=self.symbol, orderId=record["orders"][0])
+
+    def triggered(self, record, price, highest):
+        """True si al precio actual la orden ya debería haberse disparado en el exchange."""
+        if record["mode"] == "trailing_delta":
+            return price <= self.stop_price(highest)
+        if record["mode"] == "oco" and price >= float(self.rules.price(record["entry"] * (1 + self.take_profit), up=True)):
+            return True
+        return price <= record["stop"]
+
+    def status(self, record):
+        """
+        Consulta las órdenes del registro: devuelve (orden con ejecuciones o
+        None, True si ya no queda ninguna abierta). La orden devuelta está
+        FILLED o tiene una ejecución parcial.
+        """
+        closed = True
+        executed = None
+        for order_id in record["orders"]:
+            order = self.client.get_order(symbol=self.symbol, orderId=order_id)
+            if order["status"] == "FILLED":
+                return order, True
+            if float(order["executedQty"]) > 0:
+                executed = order
+            closed = closed and order["status"] in FINAL_STATUSES
+        return executed, closed
+
+
+def create_protection(cfg, client, rules, clock=time.time):
+    """ProtectiveOrders según cfg["protection"], o None con el modo client (el trailing stop del bot)."""
+    mode = cfg.get("protection", "client")
+    if mode == "client":
+        return None
+    return ProtectiveOrders(client, cfg["symbol"], rules, mode, cfg["trailing_stop"],
+                            take_profit=cfg.get("take_profit", 0.0), clock=clock)
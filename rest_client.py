@@ -0,0 +1,248 @@
+# rest_client.py
+import random
+import re
+import threading
+import time
+
+import requests
+from binance.client import Client
+from binance.exceptions import BinanceAPIException
+from requests.adapters import HTTPAdapter
+
+from metrics import default_metrics
+
+# Peso de cada endpoint REST según la documentación de Binance (el resto pesa 1)
+ENDPOINT_WEIGHTS = {
+    "exchangeInfo": 20,
+    "account": 20,
+    "klines": 2,
+    "ticker/price": 2,
+    "openOrders": 6,
+    "allOrders": 20,
+    "myTrades": 20,
+}
+# Endpoints que además cuentan para los límites de órdenes
+ORDER_ENDPOINTS = ("order", "order/oco", "orderList/oco", "order/cancelReplace")
+
+# Cabeceras con lo consumido en cada ventana, p. ej. x-mbx-used-weight-1m u x-mbx-order-count-10s
+_USAGE_HEADER = re.compile(r"x-mbx-(used-weight|order-count)-(\d+)([smhd])$", re.IGNORECASE)
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class TokenBucket:
+    """Token bucket de una ventana de Binance: 'capacity' unidades cada 'window' segundos."""
+
+    def __init__(self, capacity, window):
+        self.capacity = capacity
+        self.window = window
+        self.rate = capacity / window
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, reserve=0.0):
+        """Segundos hasta que haya 'amount' unidades sin tocar las 'reserve' últimas."""
+        missing = amount + reserve - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def sync(self, used):
+        # Lo que informa el servidor manda: incluye lo que gastaron otros procesos con la misma IP o clave
+        self.tokens = min(self.tokens, self.capacity - used)
+
+
+class RateLimiter:
+    """
+    Límites de Binance compartidos por todos los clientes de un proceso.
+
+    Lleva un token bucket de peso por minuto (límite por IP) y dos de
+    órdenes (por 10 segundos y por día, límites por cuenta). Después de cada
+    respuesta se ajustan con las cabeceras x-mbx-used-weight-* y
+    x-mbx-order-count-*, así que también se respeta lo que consumen otros
+    procesos. Las órdenes tienen prioridad: mientras una espera, las
+    peticiones de datos de mercado no avanzan, y además no pueden gastar la
+    última fracción 'order_reserve' del peso del minuto.
+    """
+
+    def __init__(self, weight_per_minute=1200, orders_per_10s=50, orders_per_day=160000, order_reserve=0.1):
+        self.weight = TokenBucket(weight_per_minute, 60)
+        self.orders = {10: TokenBucket(orders_per_10s, 10), 86400: TokenBucket(orders_per_day, 86400)}
+        self.order_reserve = weight_per_minute * order_reserve
+        self._cond = threading.Condition()
+        self._orders_waiting = 0
+        self._paused_until = 0.0
+
+    def acquire(self, weight, order=False):
+        """Bloquea hasta que la petición entre en todos los límites y la descuenta."""
+        with self._cond:
+            if order:
+                self._orders_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._paused_until - now
+                    if wait <= 0:
+                        self.weight.refill(now)
+                        wait = self.weight.wait_time(weight, 0.0 if order else self.order_reserve)
+                        if order:
+                            for bucket in self.orders.values():
+                                bucket.refill(now)
+                                wait = max(wait, bucket.wait_time(1))
+                        elif self._orders_waiting:
+                            wait = max(wait, 0.05)  # Ceder el paso a las órdenes encoladas
+                    if wait <= 0:
+                        self.weight.tokens -= weight
+                        if order:
+                            for bucket in self.orders.values():
+                                bucket.tokens -= 1
+                        return
+                    self._cond.wait(wait)
+            finally:
+                if order:
+                    self._orders_waiting -= 1
+                    self._cond.notify_all()
+
+    def update(self, headers):
+        """Ajusta los buckets con las cabeceras de uso de una respuesta."""
+        with self._cond:
+            now = time.monotonic()
+            for name, value in headers.items():
+                match = _USAGE_HEADER.match(name)
+                if not match:
+                    continue
+                kind, amount, unit = match.groups()
+                window = int(amount) * _UNIT_SECONDS[unit.lower()]
+                if kind.lower() == "used-weight":
+                    if window == 60:
+                        self.weight.refill(now)
+                        self.weight.sync(int(value))
+                elif window in self.orders:
+                    self.orders[window].refill(now)
+                    self.orders[window].sync(int(value))
+
+    def pause(self, seconds):
+        """Detiene todas las peticiones (tras un 429/418) durante 'seconds'."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+# Un limitador por proceso: todos los bots de un mismo proceso comparten IP y clave
+default_limiter = RateLimiter()
+
+
+class RateLimitedClient(Client):
+    """
+    Client de python-binance que respeta los límites de peso y de órdenes.
+
+    Cada petición pasa por un RateLimiter (por defecto el compartido del
+    proceso) con el peso de su endpoint, usa un pool de conexiones
+    keep-alive y se reintenta con backoff exponencial con jitter ante 429,
+    418 (respetando Retry-After), errores 5xx y fallos de red. Las órdenes
+    solo se reintentan si Binance las rechazó sin procesarlas (429/418 o
+    timeout al conectar), para no duplicarlas. 'api_url' reemplaza la URL base
+    de la API (por ejemplo, un servidor HTTP local para pruebas). La
+    latencia de cada intento, la espera en el limitador y los errores se
+    registran en 'metrics'.
+    """
+
+    def __init__(self, api_key=None, api_secret=None, testnet=False, api_url=None, limiter=None,
+                 pool_size=10, max_retries=4, backoff=0.5, max_backoff=30.0, requests_params=None, metrics=None):
+        # Todo esto tiene que existir antes de super().__init__, que ya hace un ping
+        self.limiter = limiter or default_limiter
+        self.metrics = metrics or default_metrics
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        if api_url:
+            self.API_URL = self.API_TESTNET_URL = api_url.rstrip('/')
+        super().__init__(api_key, api_secret, requests_params=requests_params, testnet=testnet)
+
+    def _init_session(self):
+        session = super()._init_session()
+        # Un pool de conexiones keep-alive; los reintentos los maneja _request
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @staticmethod
+    def endpoint(uri):
+        """Ruta del endpoint sin la URL base ni la versión, p. ej. 'klines' u 'order/oco'."""
+        path = uri.split("?", 1)[0]
+        match = re.search(r"/v\d+/(.+)$", path)
+        return match.group(1) if match else path.rsplit("/", 1)[-1]
+
+    def _request(self, method, uri, signed, force_params=False, **kwargs):
+        path = self.endpoint(uri)
+        order = method == "post" and path in ORDER_ENDPOINTS
+        weight = ENDPOINT_WEIGHTS.get(path, 1)
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            self.limiter.acquire(weight, order=order)
+            sent = time.perf_counter()
+            self.metrics.observe("rate_limit_wait_seconds", sent - started, endpoint=path)
+            retry_after = None
+            previous = self.response
+            status = "ok"
+            try:
+                # _get_request_kwargs firma y modifica 'data': cada intento parte de una copia
+                attempt_kwargs = dict(kwargs)
+                if isinstance(kwargs.get("data"), dict):
+                    attempt_kwargs["data"] = dict(kwargs["data"])
+                return super()._request(method, uri, signed, force_params, **attempt_kwargs)
+            except BinanceAPIException as e:
+                status = str(e.status_code)
+                if e.status_code in (418, 429):
+                    retry_after = _retry_after(e.response)
+                    self.limiter.pause(retry_after if retry_after is not None else self._delay(attempt))
+                elif not (e.status_code >= 500 and not order):
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+            except requests.exceptions.ConnectTimeout:
+                status = "connect_timeout"
+                # No se llegó a conectar: es seguro reintentar incluso una orden
+                if attempt >= self.max_retries:
+                    raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                status = "network"
+                # Si la conexión cayó después de enviar una orden, pudo haberse ejecutado igual
+                if order or attempt >= self.max_retries:
+                    raise
+            except Exception:
+                status = "exception"
+                raise
+            finally:
+                self.metrics.observe("binance_request_seconds", time.perf_counter() - sent, endpoint=path)
+                if status != "ok":
+                    self.metrics.inc("binance_request_errors_total", endpoint=path, status=status)
+                if self.response is not None and self.response is not previous:
+                    self.limiter.update(self.response.headers)
+            time.sleep(retry_after if retry_after is not None else self._delay(attempt))
+            attempt += 1
+
+    def cancel_replace_order(self, **params):
+        """
+        Cancela una orden y coloca otra en una sola petición (POST
+        /api/v3/order/cancelReplace), que python-binance 1.0.15 todavía no
+        expone. Con cancelReplaceMode=STOP_ON_FAILURE la nueva solo se
+        coloca si la cancelación funcionó.
+        """
+        return self._post("order/cancelReplace", True, data=params)
+
+    def _delay(self, attempt):
+        # Full jitter: evita que muchos bots reintenten todos a la vez
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,322 @@
+# robustez.py
+import argparse
+import math
+import os
+from multiprocessing import Pool
+from statistics import NormalDist
+
+import numpy as np
+
+from backtest import (DEFAULT_MIN_NOTIONAL, DEFAULT_STEP_SIZE, OPEN_TIME, _timestamp, load_ohlcv,
+                      resample_ohlcv, run_backtest, summarize)
+from config import INTERVAL_MS, get_default_config, load_config
+from optimizer import optimize
+
+# Remuestreos por defecto de monte_carlo
+REMUESTREOS = int(os.getenv("ROBUSTEZ_REMUESTREOS", "20000"))
+# Memoria aproximada de cada bloque de remuestreos: acota el pico aunque se pidan millones
+BLOQUE_MB = float(os.getenv("ROBUSTEZ_BLOQUE_MB", "64"))
+METODOS = ("bootstrap", "permutacion")
+
+# Estado de cada proceso del pool (se inicializa en _iniciar_proceso)
+_proceso = {}
+
+
+def pnl_de_operaciones(operaciones):
+    """
+    PnL de cada operación cerrada, en orden, como array float64. Acepta el
+    resultado de backtest.run_backtest (o simulator.run_simulation), el
+    DataFrame 'cerrados' de analisis.emparejar_trades_fifo /
+    analisis_incremental, o directamente una secuencia de PnL.
+    """
+    if hasattr(operaciones, 'columns'):
+        return operaciones['pnl_operacion'].to_numpy(dtype=np.float64)
+    operaciones = list(operaciones)
+    if operaciones and isinstance(operaciones[0], dict):
+        return np.array([t['pnl'] for t in operaciones if t['action'] == 'SELL'], dtype=np.float64)
+    return np.asarray(operaciones, dtype=np.float64)
+
+
+def _metricas(pnl, capital, nivel_ruina):
+    """
+    Capital final, máximo drawdown y si se tocó el nivel de ruina para cada
+    fila de 'pnl' (remuestreos x operaciones), todo con operaciones por
+    columnas sobre el bloque completo.
+    """
+    equity = np.cumsum(pnl, axis=1)
+    equity += capital
+    pico = np.maximum.accumulate(equity, axis=1)
+    np.maximum(pico, capital, out=pico)
+    drawdown = np.max(pico - equity, axis=1)
+    return equity[:, -1].copy(), drawdown, equity.min(axis=1) <= nivel_ruina
+
+
+def _iniciar_proceso(pnl, capital, nivel_ruina):
+    _proceso['pnl'] = pnl
+    _proceso['capital'] = capital
+    _proceso['nivel_ruina'] = nivel_ruina
+
+
+def _simular_bloque(tarea):
+    """Un bloque de remuestreos con su propia semilla: (capital final, drawdown, ruina) por remuestreo."""
+    metodo, filas, semilla = tarea
+    pnl = _proceso['pnl']
+    rng = np.random.default_rng(semilla)
+    if metodo == 'bootstrap':
+        # Con reposición: cada secuencia sortea len(pnl) operaciones del historial
+        muestras = pnl[rng.integers(0, len(pnl), size=(filas, len(pnl)))]
+    else:
+        # Mismas operaciones en otro orden: el capital final no cambia, sí el camino
+        muestras = rng.permuted(np.broadcast_to(pnl, (filas, len(pnl))), axis=1)
+    return _metricas(muestras, _proceso['capital'], _proceso['nivel_ruina'])
+
+
+def _bandas(valores, confianza):
+    cola = (1 - confianza) / 2
+    bajo, mediana, alto = np.quantile(valores, (cola, 0.5, 1 - cola))
+    return {'media': float(np.mean(valores)), 'mediana': float(mediana), 'min': float(bajo), 'max': float(alto)}
+
+
+def _intervalo_wilson(exitos, n, confianza):
+    """Intervalo de Wilson para una proporción: no se sale de [0, 1] con probabilidades chicas."""
+    z = NormalDist().inv_cdf((1 + confianza) / 2)
+    p = exitos / n
+    centro = (p + z * z / (2 * n)) / (1 + z * z / n)
+    margen = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return max(0.0, centro - margen), min(1.0, centro + margen)
+
+
+def monte_carlo(operaciones, remuestreos=REMUESTREOS, metodo='bootstrap', capital=None, ruina=0.5,
+                confianza=0.9, semilla=None, workers=None, bloque_mb=BLOQUE_MB, progreso=None):
+    """
+    Remuestrea la secuencia de operaciones y devuelve bandas de confianza
+    para el capital final, el máximo drawdown y el riesgo de ruina.
+
+    Con metodo='bootstrap' cada secuencia sortea operaciones con
+    reposición (¿y si hubieran salido otras operaciones como estas?); con
+    'permutacion' se barajan las mismas operaciones (¿y si hubieran llegado
+    en otro orden?), así que el capital final es siempre el mismo y lo que
+    cambia es el drawdown. La equity parte de 'capital' (por defecto el
+    usdt_amount de la configuración) y hay ruina si en algún momento cae a
+    capital * (1 - ruina).
+
+    Los remuestreos se generan como matrices (bloque x operaciones) de
+    NumPy; cada bloque ocupa como mucho unos bloque_mb megabytes y los
+    bloques se reparten en un pool de 'workers' procesos (por defecto uno
+    por núcleo; con workers=1 se calculan en este proceso). Cada bloque
+    tiene su semilla derivada de 'semilla', así que el resultado no depende
+    de la cantidad de procesos. progreso(fraccion) se llama después de cada
+    bloque; si lanza una excepción, el cálculo se corta ahí.
+    """
+    if metodo not in METODOS:
+        raise ValueError(f"Método inválido: {metodo!r}. Opciones: {', '.join(METODOS)}")
+    pnl = pnl_de_operaciones(operaciones)
+    if pnl.size == 0:
+        raise ValueError("No hay operaciones cerradas para remuestrear")
+    if capital is None:
+        capital = get_default_config()['usdt_amount']
+    nivel_ruina = capital * (1 - ruina)
+
+    # Tres matrices de float64 del tamaño del bloque: muestras, equity y pico
+    filas = max(1, int(bloque_mb * 2 ** 20 // (pnl.size * 8 * 3)))
+    tamanos = [min(filas, remuestreos - inicio) for inicio in range(0, remuestreos, filas)]
+    semillas = np.random.SeedSequence(semilla).spawn(len(tamanos))
+    tareas = [(metodo, n, s) for n, s in zip(tamanos, semillas)]
+
+    finales = np.empty(remuestreos)
+    drawdowns = np.empty(remuestreos)
+    ruinas = 0
+    workers = min(workers or os.cpu_count(), len(tareas))
+    if workers == 1:
+        _iniciar_proceso(pnl, capital, nivel_ruina)
+        resultados = map(_simular_bloque, tareas)
+        pool = None
+    else:
+        pool = Pool(processes=workers, initializer=_iniciar_proceso, initargs=(pnl, capital, nivel_ruina))
+        resultados = pool.imap(_simular_bloque, tareas)
+    try:
+        inicio = 0
+        for final, drawdown, ruina_bloque in resultados:
+            finales[inicio:inicio + len(final)] = final
+            drawdowns[inicio:inicio + len(final)] = drawdown
+            ruinas += int(np.count_nonzero(ruina_bloque))
+            inicio += len(final)
+            if progreso:
+                progreso(inicio / remuestreos)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()  # Cortado a mitad de camino: los bloques pendientes ya no hacen falta
+
+    final_real, drawdown_real, ruina_real = _metricas(pnl[np.newaxis, :], capital, nivel_ruina)
+    ruina_min, ruina_max = _intervalo_wilson(ruinas, remuestreos, confianza)
+    return {
+        'metodo': metodo,
+        'remuestreos': remuestreos,
+        'operaciones': int(pnl.size),
+        'capital': capital,
+        'confianza': confianza,
+        'capital_final': _bandas(finales, confianza),
+        'max_drawdown': _bandas(drawdowns, confianza),
+        'riesgo_ruina': {'prob': ruinas / remuestreos, 'min': ruina_min, 'max': ruina_max},
+        'historico': {'capital_final': float(final_real[0]), 'max_drawdown': float(drawdown_real[0]),
+                      'ruina': bool(ruina_real[0])},
+    }
+
+
+def resumen_monte_carlo(resultado):
+    """Texto de varias líneas con las bandas de monte_carlo, para la consola o la GUI."""
+    nivel = f"{resultado['confianza'] * 100:.0f}%"
+    final, dd, ruina = resultado['capital_final'], resultado['max_drawdown'], resultado['riesgo_ruina']
+    return "\n".join([
+        f"--- Robustez ({resultado['metodo']}, {resultado['remuestreos']} remuestreos de "
+        f"{resultado['operaciones']} operaciones) ---",
+        f"Capital final: {final['mediana']:.2f} (banda {nivel}: {final['min']:.2f} a {final['max']:.2f}) | "
+        f"histórico {resultado['historico']['capital_final']:.2f}",
+        f"Máximo drawdown: {dd['mediana']:.2f} (banda {nivel}: {dd['min']:.2f} a {dd['max']:.2f}) | "
+        f"histórico {resultado['historico']['max_drawdown']:.2f}",
+        f"Riesgo de ruina: {ruina['prob'] * 100:.2f}% (banda {nivel}: {ruina['min'] * 100:.2f}% a "
+        f"{ruina['max'] * 100:.2f}%)",
+    ])
+
+
+def particiones_walk_forward(n, ventanas=5, proporcion_is=0.7, anclado=False):
+    """
+    Cortes (inicio_is, inicio_oos, fin_oos) de 'ventanas' pares
+    in-sample/out-of-sample sobre n velas. Los tramos out-of-sample son
+    consecutivos y no se solapan; cada in-sample es el tramo de
+    proporcion_is que lo precede (o, con anclado=True, todo desde la vela 0).
+    """
+    if not 0 < proporcion_is < 1:
+        raise ValueError("proporcion_is debe estar entre 0 y 1")
+    largo_oos = int(n / (ventanas + proporcion_is / (1 - proporcion_is)))
+    largo_is = n - ventanas * largo_oos
+    if largo_oos < 1:
+        raise ValueError(f"{n} velas no alcanzan para {ventanas} ventanas")
+    cortes = []
+    for v in range(ventanas):
+        inicio_oos = largo_is + v * largo_oos
+        cortes.append((0 if anclado else inicio_oos - largo_is, inicio_oos, inicio_oos + largo_oos))
+    return cortes
+
+
+def _backtest_oos(ohlcv, base_interval, inicio_oos, fin_oos, cfg, step_size, min_notional, fee):
+    """
+    Backtest de 'cfg' sobre las velas [inicio_oos, fin_oos). Se antepone el
+    tramo previo necesario para las medias, pero solo cuentan las
+    operaciones abiertas desde la primera vela out-of-sample.
+    """
+    intervalo = cfg['interval']
+    por_vela = max(1, INTERVAL_MS[intervalo] // INTERVAL_MS[base_interval])
+    desde = max(0, inicio_oos - (cfg['ma_slow'] + 1) * por_vela)
+    velas = ohlcv[desde:fin_oos]
+    if intervalo != base_interval:
+        velas = resample_ohlcv(velas, intervalo)
+    trades = run_backtest(velas, cfg, step_size=step_size, min_notional=min_notional, fee=fee)
+    corte = _timestamp(ohlcv[inicio_oos, OPEN_TIME] + INTERVAL_MS[intervalo])
+    primera = next((i for i, t in enumerate(trades) if t['action'] == 'BUY' and t['timestamp'] >= corte), len(trades))
+    return trades[primera:]
+
+
+def walk_forward(ohlcv, base_interval='1m', grid=None, ventanas=5, proporcion_is=0.7, anclado=False, samples=0,
+                 seed=None, base_cfg=None, workers=None, step_size=DEFAULT_STEP_SIZE,
+                 min_notional=DEFAULT_MIN_NOTIONAL, fee=0.0, progreso=None):
+    """
+    Validación walk-forward: en cada ventana se optimizan los parámetros con
+    optimizer.optimize sobre el tramo in-sample (en un pool con todos los
+    núcleos) y la mejor combinación se evalúa sobre el tramo out-of-sample
+    siguiente, que el optimizador no vio.
+
+    Devuelve {'ventanas': [...], 'oos': resumen, 'trades': operaciones
+    out-of-sample concatenadas, 'eficiencia': PnL por vela out-of-sample /
+    PnL por vela in-sample}. Una eficiencia cercana a 1 indica que lo
+    optimizado se sostiene fuera de la muestra; cerca de 0 o negativa, que
+    los parámetros se ajustaron al ruido. Las operaciones out-of-sample se
+    pueden pasar a monte_carlo.
+    """
+    base_cfg = dict(base_cfg or load_config())
+    ohlcv = np.asarray(ohlcv, dtype=np.float64)
+    resultados, oos_trades = [], []
+    pnl_is = ventanas_is = velas_oos = 0
+    for v, (inicio_is, inicio_oos, fin_oos) in enumerate(
+            particiones_walk_forward(len(ohlcv), ventanas, proporcion_is, anclado), 1):
+        mejores = optimize(ohlcv[inicio_is:inicio_oos], base_interval, grid=grid, samples=samples, seed=seed,
+                           base_cfg=base_cfg, workers=workers, top=1, step_size=step_size,
+                           min_notional=min_notional, fee=fee)
+        if not mejores:
+            continue
+        params, resumen_is = mejores[0]
+        trades = _backtest_oos(ohlcv, base_interval, inicio_oos, fin_oos, dict(base_cfg, **params),
+                               step_size, min_notional, fee)
+        resumen_oos = summarize(trades)
+        oos_trades.extend(trades)
+        pnl_is += resumen_is['pnl'] / (inicio_oos - inicio_is)
+        ventanas_is += 1
+        velas_oos += fin_oos - inicio_oos
+        resultados.append({'ventana': v, 'is': (inicio_is, inicio_oos), 'oos': (inicio_oos, fin_oos),
+                           'params': params, 'resumen_is': resumen_is, 'resumen_oos': resumen_oos})
+        if progreso:
+            progreso(v, resultados[-1])
+    resumen = summarize(oos_trades)
+    # PnL medio por vela de los tramos in-sample contra el de todo el out-of-sample
+    por_vela_is = pnl_is / ventanas_is if ventanas_is else 0.0
+    eficiencia = (resumen['pnl'] / velas_oos) / por_vela_is if velas_oos and por_vela_is > 0 else float('nan')
+    return {'ventanas': resultados, 'oos': resumen, 'trades': oos_trades, 'eficiencia': eficiencia}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo y walk-forward sobre operaciones o velas históricas.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    mc = sub.add_parser("montecarlo", help="Bandas de confianza remuestreando las operaciones cerradas")
+    mc.add_argument("trades", nargs="?", default="trades.csv", help="CSV de operaciones (por defecto trades.csv)")
+    mc.add_argument("--metodo", choices=METODOS, default="bootstrap")
+    mc.add_argument("--remuestreos", type=int, default=REMUESTREOS)
+    mc.add_argument("--capital", type=float, default=None)
+    mc.add_argument("--ruina", type=float, default=0.5, help="Caída del capital que cuenta como ruina (0.5 = 50%%)")
+    mc.add_argument("--confianza", type=float, default=0.9)
+    mc.add_argument("--seed", type=int, default=None)
+    mc.add_argument("--workers", type=int, default=None)
+
+    wf = sub.add_parser("walkforward", help="Optimización in-sample y evaluación out-of-sample por ventanas")
+    wf.add_argument("velas", help="Archivo .npy o .npz (downloader.py) con velas OHLCV")
+    wf.add_argument("--base-interval", default="1m", help="Intervalo de las velas del archivo")
+    wf.add_argument("--ventanas", type=int, default=5)
+    wf.add_argument("--is", dest="proporcion_is", type=float, default=0.7, help="Fracción in-sample de cada ventana")
+    wf.add_argument("--anclado", action="store_true", help="Cada in-sample empieza en la primera vela")
+    wf.add_argument("--samples", type=int, default=0, help="Combinaciones al azar por ventana (0 = grilla completa)")
+    wf.add_argument("--remuestreos", type=int, default=REMUESTREOS,
+                    help="Remuestreos de Monte Carlo sobre las operaciones out-of-sample (0 = ninguno)")
+    wf.add_argument("--seed", type=int, default=None)
+    wf.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    base_cfg = load_config() if os.path.exists("config.json") else get_default_config()
+    if args.comando == "montecarlo":
+        from analisis import analisis_combinado  # pandas solo hace falta para leer el CSV
+        operaciones = analisis_combinado(args.trades)['cerrados']
+        if operaciones.empty:
+            print(f"No hay operaciones cerradas en {args.trades}.")
+            return
+        resultado = monte_carlo(operaciones, args.remuestreos, args.metodo, capital=args.capital or base_cfg['usdt_amount'],
+                                ruina=args.ruina, confianza=args.confianza, semilla=args.seed, workers=args.workers)
+        print(resumen_monte_carlo(resultado))
+        return
+
+    resultado = walk_forward(load_ohlcv(args.velas, mmap_mode="r"), args.base_interval, ventanas=args.ventanas,
+                             proporcion_is=args.proporcion_is, anclado=args.anclado, samples=args.samples,
+                             seed=args.seed, base_cfg=base_cfg, workers=args.workers,
+                             progreso=lambda v, r: print(f"Ventana {v}: {r['params']} -> IS {r['resumen_is']['pnl']:.2f} "
+                                                         f"| OOS {r['resumen_oos']['pnl']:.2f} ({r['resumen_oos']['trades']} trades)"))
+    oos = resultado['oos']
+    print(f"Out-of-sample: PnL {oos['pnl']:.2f} | DD {oos['max_drawdown']:.2f} | Trades {oos['trades']} | "
+          f"Eficiencia {resultado['eficiencia']:.2f}")
+    if args.remuestreos and oos['trades']:
+        print(resumen_monte_carlo(monte_carlo(resultado['trades'], args.remuestreos, capital=base_cfg['usdt_amount'],
+                                              semilla=args.seed, workers=args.workers)))
+
+
+if __name__ == "__main__":
+    main()
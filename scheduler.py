@@ -0,0 +1,148 @@
+# scheduler.py
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+from config import INTERVAL_MS
+from metrics import default_metrics
+
+# Las velas semanales de Binance abren los lunes; el epoch (1970-01-01) fue jueves
+INTERVAL_ORIGIN_MS = {"1w": 4 * 86_400_000}
+# Segundos de margen tras el cierre de la vela para que Binance ya la tenga cerrada
+CANDLE_CLOSE_DELAY = 1.0
+
+
+def next_candle_close(now, interval):
+    """Instante (segundos epoch) en que cierra la vela de 'interval' en curso a la hora 'now'."""
+    interval_ms = INTERVAL_MS[interval]
+    origin = INTERVAL_ORIGIN_MS.get(interval, 0)
+    now_ms = int(now * 1000)
+    return ((now_ms - origin) // interval_ms + 1) * interval_ms / 1000 + origin / 1000
+
+
+def sync_server_time(client):
+    """
+    Mide la diferencia entre el reloj local y el de Binance (en ms, tomando
+    el punto medio del viaje de ida y vuelta), la deja en
+    client.timestamp_offset para las peticiones firmadas y la devuelve.
+    """
+    sent = time.time()
+    server_ms = client.get_server_time()['serverTime']
+    received = time.time()
+    client.timestamp_offset = int(server_ms - (sent + received) / 2 * 1000)
+    return client.timestamp_offset
+
+
+class Job:
+    """Tarea programada en un Scheduler; se cancela con Scheduler.cancel."""
+
+    __slots__ = ("callback", "name", "period", "interval", "delay", "next_run", "cancelled")
+
+    def __init__(self, callback, name, period=None, interval=None, delay=0.0):
+        self.callback = callback
+        self.name = name or getattr(callback, "__name__", "job")
+        self.period = period
+        self.interval = interval
+        self.delay = delay
+        self.next_run = 0.0
+        self.cancelled = False
+
+    def reschedule(self, now):
+        """Próxima ejecución posterior a 'now'; si se atrasó, no se encadenan las perdidas."""
+        if self.interval is not None:
+            self.next_run = next_candle_close(now - self.delay, self.interval) + self.delay
+        else:
+            self.next_run += self.period
+            if self.next_run <= now:
+                self.next_run = now + self.period
+
+
+class Scheduler:
+    """
+    Un solo temporizador (heap ordenado por próxima ejecución) para las
+    tareas de uno o varios bots: tareas periódicas (every) y tareas que
+    corren justo después de cada cierre de vela (on_candle_close).
+
+    'clock' devuelve la hora en segundos epoch; por defecto la local, pero se
+    le puede pasar una corregida con la hora del servidor (server_clock) o
+    un reloj simulado. 'wait(segundos)' duerme hasta la próxima tarea; por
+    defecto espera en stop_event, así que stop() despierta al bucle en el
+    acto. run_pending() sirve para manejar el scheduler desde otro bucle
+    (por ejemplo asyncio). El retraso de cada tarea respecto de su hora
+    programada (loop lag), su duración y sus errores van a 'metrics'.
+    """
+
+    def __init__(self, stop_event=None, clock=time.time, wait=None, log=print, metrics=None):
+        self.stop_event = stop_event or threading.Event()
+        self.clock = clock
+        self.wait = wait or self.stop_event.wait
+        self.log = log
+        self.metrics = metrics or default_metrics
+        self._heap = []
+        self._counter = itertools.count()
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.next_run, next(self._counter), job))
+        return job
+
+    def every(self, seconds, callback, name=None, run_now=False):
+        """Ejecuta callback() cada 'seconds' segundos (y enseguida con run_now=True)."""
+        job = Job(callback, name, period=seconds)
+        now = self.clock()
+        job.next_run = now if run_now else now + seconds
+        return self._push(job)
+
+    def on_candle_close(self, interval, callback, delay=CANDLE_CLOSE_DELAY, name=None, run_now=False):
+        """Ejecuta callback() 'delay' segundos después de cada cierre de vela de 'interval'."""
+        job = Job(callback, name, interval=interval, delay=delay)
+        if run_now:
+            job.next_run = self.clock()
+        else:
+            job.reschedule(self.clock())
+        return self._push(job)
+
+    def cancel(self, job):
+        job.cancelled = True  # Se descarta cuando llega al tope del heap
+
+    def run_pending(self):
+        """Ejecuta las tareas vencidas y devuelve los segundos hasta la próxima (None si no hay)."""
+        while self._heap:
+            when, _, job = self._heap[0]
+            if job.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            now = self.clock()
+            if when > now:
+                return when - now
+            heapq.heappop(self._heap)
+            self.metrics.observe("scheduler_lag_seconds", now - when, job=job.name)
+            started = time.perf_counter()
+            try:
+                job.callback()
+            except Exception as e:
+                self.metrics.inc("scheduler_job_errors_total", job=job.name)
+                self.log(f"⚠️ Error en la tarea {job.name}: {e}")
+                traceback.print_exc()
+            self.metrics.observe("scheduler_job_seconds", time.perf_counter() - started, job=job.name)
+            if not job.cancelled:
+                job.reschedule(self.clock())
+                self._push(job)
+        return None
+
+    def run(self):
+        """Bucle principal: ejecuta tareas hasta que stop_event se activa."""
+        while not self.stop_event.is_set():
+            delay = self.run_pending()
+            if self.stop_event.is_set():
+                break
+            self.wait(60.0 if delay is None else delay)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def server_clock(client):
+    """Reloj en segundos epoch corregido con client.timestamp_offset (ver sync_server_time)."""
+    return lambda: time.time() + client.timestamp_offset / 1000
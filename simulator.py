@@ -0,0 +1,708 @@
+# simulator.py
+import argparse
+import collections
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+from binance.exceptions import BinanceAPIException
+
+from backtest import OPEN_TIME, OPEN, HIGH, LOW, CLOSE, VOLUME, _timestamp, load_ohlcv, summarize
+from config import INTERVAL_MS, get_default_config
+from log_channel import WARNING, LogChannel
+from symbol_rules import SymbolRules
+
+
+class SimulatedClock:
+    """
+    Reloj de una simulación, en segundos epoch.
+
+    time() devuelve la hora simulada y advance()/wait() la adelantan en
+    lugar de dormir: con speed=None el tiempo salta en el acto
+    (fast-forward); con speed=N corre N veces más rápido que el reloj real.
+    Al llegar a 'end' activa 'finished' y llama una vez a on_end().
+    time y wait se pasan tal cual a Scheduler (ver Bot(clock=...)).
+    """
+
+    def __init__(self, start, end=None, speed=None, on_end=None):
+        self.now = float(start)
+        self.end = end
+        self.speed = speed
+        self.on_end = on_end
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        if seconds <= 0:
+            return
+        if self.speed:
+            time.sleep(seconds / self.speed)
+        with self._lock:
+            self.now += seconds
+            ended = self.end is not None and self.now >= self.end and not self.finished.is_set()
+            if ended:
+                self.finished.set()
+        if ended and self.on_end:
+            self.on_end()
+
+    def wait(self, seconds):
+        """Adelanta el reloj 'seconds' segundos; devuelve True si la simulación terminó."""
+        self.advance(seconds)
+        return self.finished.is_set()
+
+
+def _api_error(code, msg, status_code=400):
+    """Mismo error que levanta python-binance cuando Binance rechaza una petición."""
+    return BinanceAPIException(None, status_code, json.dumps({"code": code, "msg": msg}))
+
+
+def _fmt(value):
+    return f"{value:.8f}"
+
+
+class SimulatedExchange:
+    """
+    Exchange en memoria que implementa los métodos de Client que usan Bot y
+    AccountModel, sobre un histórico OHLCV (n, 6) de un símbolo.
+
+    El reloj (self.clock, un SimulatedClock) arranca en la apertura de la
+    vela start_index y termina al cierre de la última. Dentro de cada vela
+    el precio recorre open -> low -> high -> close (open -> high -> low ->
+    close si la vela es bajista), así que el trailing stop ve los mínimos y
+    máximos intermedios; get_klines devuelve la vela en curso a medio
+    formar, como Binance.
+
+    Las órdenes de mercado se ejecutan al precio del momento más 'slippage'
+    (fracción, en contra), llenan 'fill_ratio' de la cantidad (el resto
+    vence, como una orden sin liquidez suficiente) y pagan 'fee' en el
+    activo recibido. Valida LOT_SIZE, NOTIONAL y saldo con los mismos
+    errores (BinanceAPIException) que Binance. Cada llamada adelanta el
+    reloj 'latency' segundos (un número o una función que devuelve uno).
+
+    También acepta órdenes de venta STOP_LOSS (con stopPrice o
+    trailingDelta) y OCO (LIMIT_MAKER + STOP_LOSS), que bloquean el saldo
+    hasta ejecutarse o cancelarse, y cancel_replace_order sobre un STOP_LOSS. Al comienzo de cada llamada se recorre
+    el precio desde la anterior: un stop se ejecuta a su precio de disparo
+    menos 'slippage' (o al de apertura si la vela abrió por debajo), y un
+    límite, a su precio.
+    Los eventos del user data stream se entregan a las funciones
+    registradas con subscribe_user_data.
+    """
+
+    def __init__(self, ohlcv, symbol="BTCUSDT", interval="1h", balances=None, fee=0.001, slippage=0.0,
+                 fill_ratio=1.0, latency=0.0, speed=None, start_index=100, base_asset=None, quote_asset="USDT",
+                 step_size="0.00001", tick_size="0.01", min_qty="0.00001", min_notional="5.0"):
+        self.ohlcv = np.asarray(ohlcv, dtype=np.float64)
+        if len(self.ohlcv) == 0:
+            raise ValueError("El histórico está vacío")
+        self.open_times = self.ohlcv[:, OPEN_TIME].astype(np.int64)
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.fee = fee
+        self.slippage = slippage
+        self.fill_ratio = fill_ratio
+        self.latency = latency
+        self.quote_asset = quote_asset
+        self.base_asset = base_asset or (symbol[:-len(quote_asset)] if symbol.endswith(quote_asset) else symbol)
+
+        self.symbol_info = {
+            "symbol": symbol,
+            "status": "TRADING",
+            "baseAsset": self.base_asset,
+            "quoteAsset": self.quote_asset,
+            "orderTypes": ["MARKET", "STOP_LOSS", "LIMIT_MAKER"],
+            "ocoAllowed": True,
+            "filters": [
+                {"filterType": "PRICE_FILTER", "minPrice": tick_size, "maxPrice": "1000000.00", "tickSize": tick_size},
+                {"filterType": "LOT_SIZE", "minQty": min_qty, "maxQty": "9000.00000000", "stepSize": step_size},
+                {"filterType": "NOTIONAL", "minNotional": min_notional},
+                {"filterType": "TRAILING_DELTA", "minTrailingAboveDelta": 10, "maxTrailingAboveDelta": 2000,
+                 "minTrailingBelowDelta": 10, "maxTrailingBelowDelta": 2000},
+            ],
+        }
+        self.rules = SymbolRules(self.symbol_info)
+
+        start_index = min(max(start_index, 0), len(self.ohlcv) - 1)
+        self.clock = SimulatedClock(self.open_times[start_index] / 1000,
+                                    end=(self.open_times[-1] + self.interval_ms) / 1000, speed=speed)
+        self.timestamp_offset = 0
+
+        self.balances = collections.defaultdict(float)
+        self.balances.update(balances if balances is not None else {quote_asset: 10000.0})
+        self.locked = collections.defaultdict(float)  # Saldo reservado por las órdenes abiertas
+        self.orders = []  # Respuestas de todas las órdenes, en orden
+        self._by_id = {}
+        self._open = {}  # orderId -> orden abierta con su disparo (ver _rest)
+        self._matched_ms = self._now_ms()
+        self.calls = collections.Counter()  # Llamadas por método, para pruebas de carga
+        self._listeners = []
+        self._order_ids = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._list_ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    # --- Reloj y precio ---
+
+    def _round_trip(self, method):
+        self.calls[method] += 1
+        latency = self.latency() if callable(self.latency) else self.latency
+        self.clock.advance(latency)
+        with self._lock:
+            self._match()
+
+    def _now_ms(self):
+        return int(self.clock.time() * 1000)
+
+    def _index(self, now_ms):
+        """Índice de la vela en curso a la hora now_ms (la última si ya terminó el histórico)."""
+        i = int(np.searchsorted(self.open_times, now_ms, side="right")) - 1
+        return min(max(i, 0), len(self.ohlcv) - 1)
+
+    def _partial(self, i, now_ms):
+        """(precio, high, low, volumen) de la vela i hasta now_ms, según el recorrido intravela."""
+        o, h, l, c, v = self.ohlcv[i, OPEN:VOLUME + 1]
+        frac = min(max((now_ms - self.open_times[i]) / self.interval_ms, 0.0), 1.0)
+        points = (o, l, h, c) if c >= o else (o, h, l, c)
+        pos = frac * 3
+        k = min(int(pos), 2)
+        price = float(points[k] + (points[k + 1] - points[k]) * (pos - k))
+        visited = points[:k + 1] + (price,)
+        return price, max(visited), min(visited), v * frac
+
+    def _path(self, start_ms, end_ms):
+        """
+        Recorrido del precio entre start_ms y end_ms como puntos (precio,
+        salto): los vértices intravela de _partial y, en cada cambio de vela,
+        el salto del cierre a la apertura siguiente (salto=True).
+        """
+        first, last = self._index(start_ms), self._index(end_ms)
+        points = [(self._partial(first, start_ms)[0], False)]
+        for i in range(first, last + 1):
+            o, h, l, c = self.ohlcv[i, OPEN:CLOSE + 1]
+            for k, price in enumerate((o, l, h, c) if c >= o else (o, h, l, c)):
+                if start_ms < self.open_times[i] + k * self.interval_ms / 3 <= end_ms:
+                    points.append((float(price), k == 0))
+        points.append((self._partial(last, end_ms)[0], False))
+        return points
+
+    def price(self):
+        """Precio de mercado a la hora simulada actual."""
+        now_ms = self._now_ms()
+        return self._partial(self._index(now_ms), now_ms)[0]
+
+    def _kline(self, i, now_ms):
+        open_time = int(self.open_times[i])
+        close_time = open_time + self.interval_ms - 1
+        if now_ms > close_time:
+            o, h, l, c, v = self.ohlcv[i, OPEN:VOLUME + 1]
+        else:
+            o = self.ohlcv[i, OPEN]
+            c, h, l, v = self._partial(i, now_ms)
+        return [open_time, _fmt(o), _fmt(h), _fmt(l), _fmt(c), _fmt(v), close_time,
+                _fmt(v * c), 0, "0", "0", "0"]
+
+    # --- Endpoints de mercado ---
+
+    def ping(self):
+        self._round_trip("ping")
+        return {}
+
+    def get_server_time(self):
+        self._round_trip("get_server_time")
+        return {"serverTime": self._now_ms()}
+
+    def get_exchange_info(self):
+        self._round_trip("get_exchange_info")
+        return {"timezone": "UTC", "serverTime": self._now_ms(), "rateLimits": [], "symbols": [self.symbol_info]}
+
+    def get_symbol_info(self, symbol):
+        self._round_trip("get_symbol_info")
+        return dict(self.symbol_info) if symbol == self.symbol else None
+
+    def get_symbol_ticker(self, symbol=None, **params):
+        self._round_trip("get_symbol_ticker")
+        self._check_symbol(symbol)
+        return {"symbol": self.symbol, "price": _fmt(self.price())}
+
+    def get_klines(self, symbol=None, interval=None, limit=500, startTime=None, endTime=None, **params):
+        """Velas hasta la hora simulada, con los mismos parámetros que la API (la última, en curso)."""
+        self._round_trip("get_klines")
+        self._check_symbol(symbol)
+        if interval != self.interval:
+            raise _api_error(-1120, "Invalid interval.")
+        limit = min(int(limit), 1000)
+        now_ms = self._now_ms()
+        last = self._index(now_ms)
+        if endTime is not None:
+            last = min(last, int(np.searchsorted(self.open_times, endTime, side="right")) - 1)
+        if startTime is not None:
+            first = int(np.searchsorted(self.open_times, startTime, side="left"))
+            stop = min(last + 1, first + limit)
+        else:
+            stop = last + 1
+            first = max(0, stop - limit)
+        return [self._kline(i, now_ms) for i in range(first, stop)]
+
+    def _check_symbol(self, symbol):
+        if symbol is not None and symbol != self.symbol:
+            raise _api_error(-1121, "Invalid symbol.")
+
+    # --- Cuenta ---
+
+    def _balance_entry(self, asset):
+        return {"asset": asset, "free": _fmt(self.balances[asset]), "locked": _fmt(self.locked[asset])}
+
+    def get_account(self, **params):
+        self._round_trip("get_account")
+        with self._lock:
+            return {"canTrade": True, "accountType": "SPOT", "updateTime": self._now_ms(),
+                    "balances": [self._balance_entry(a) for a in sorted(self.balances)]}
+
+    def get_asset_balance(self, asset, **params):
+        self._round_trip("get_asset_balance")
+        with self._lock:
+            return self._balance_entry(asset) if asset in self.balances else None
+
+    # --- Órdenes ---
+
+    def order_market_buy(self, **params):
+        return self.create_order(side="BUY", type="MARKET", **params)
+
+    def order_market_sell(self, **params):
+        return self.create_order(side="SELL", type="MARKET", **params)
+
+    def create_order(self, symbol=None, side=None, type=None, quantity=None, quoteOrderQty=None,
+                     newClientOrderId=None, stopPrice=None, trailingDelta=None, **params):
+        self._round_trip("create_order")
+        self._check_symbol(symbol)
+        if type not in ("MARKET", "STOP_LOSS"):
+            raise _api_error(-1116, "Invalid orderType.")
+        if side not in ("BUY", "SELL"):
+            raise _api_error(-1117, "Invalid side.")
+        with self._lock:
+            if type == "STOP_LOSS":
+                return self._stop_order(side, quantity, stopPrice, trailingDelta, newClientOrderId)
+            return self._market_order(side, quantity, quoteOrderQty, newClientOrderId)
+
+    def _order_units(self, side, quantity, quote_qty, price):
+        """Cantidad de la orden en unidades de stepSize, validada con LOT_SIZE, NOTIONAL y el saldo libre."""
+        rules = self.rules
+        scale = 10 ** rules.qty_scale
+        if quantity is not None:
+            units = rules.qty_units(quantity)
+            if Decimal(str(quantity)) != Decimal(units).scaleb(-rules.qty_scale):
+                raise _api_error(-1013, "Filter failure: LOT_SIZE")
+        elif quote_qty is not None:
+            units = rules.qty_units(float(quote_qty) / price)
+        else:
+            raise _api_error(-1102, "Mandatory parameter 'quantity' was not sent, was empty/null, or malformed.")
+        if units <= 0 or units < rules.min_qty_units:
+            raise _api_error(-1013, "Filter failure: LOT_SIZE")
+        if units / scale * price < rules.min_notional:
+            raise _api_error(-1013, "Filter failure: NOTIONAL")
+
+        base, quote = self.base_asset, self.quote_asset
+        if side == "BUY" and units / scale * price > self.balances[quote] + 1e-9:
+            raise _api_error(-2010, "Account has insufficient balance for requested action.")
+        if side == "SELL" and units / scale > self.balances[base] + 1e-12:
+            raise _api_error(-2010, "Account has insufficient balance for requested action.")
+        return units
+
+    def _market_order(self, side, quantity, quote_qty, client_order_id):
+        rules = self.rules
+        scale = 10 ** rules.qty_scale
+        price = self.price() * (1 + self.slippage if side == "BUY" else 1 - self.slippage)
+        units = self._order_units(side, quantity, quote_qty, price)
+        base, quote = self.base_asset, self.quote_asset
+        executed_units = int(units * self.fill_ratio) // rules.step_units * rules.step_units
+        executed = executed_units / scale
+        quote_qty = executed * price
+        if side == "BUY":
+            commission, commission_asset = executed * self.fee, base
+            self.balances[quote] -= quote_qty
+            self.balances[base] += executed - commission
+        else:
+            commission, commission_asset = quote_qty * self.fee, quote
+            self.balances[base] -= executed
+            self.balances[quote] += quote_qty - commission
+
+        order_id = next(self._order_ids)
+        now_ms = self._now_ms()
+        status = "FILLED" if executed_units == units else "EXPIRED"
+        fills = []
+        if executed_units:
+            fills.append({"price": _fmt(price), "qty": _fmt(executed), "commission": _fmt(commission),
+                          "commissionAsset": commission_asset, "tradeId": next(self._trade_ids)})
+        order = {
+            "symbol": self.symbol, "orderId": order_id, "orderListId": -1,
+            "clientOrderId": client_order_id or f"sim-{order_id}", "transactTime": now_ms,
+            "price": _fmt(0.0), "origQty": _fmt(units / scale), "executedQty": _fmt(executed),
+            "cummulativeQuoteQty": _fmt(quote_qty), "status": status, "timeInForce": "GTC",
+            "type": "MARKET", "side": side, "fills": fills,
+        }
+        self.orders.append(order)
+        self._by_id[order_id] = order
+        self._publish_order(order, price, commission, commission_asset)
+        return order
+
+    def _new_order(self, type, side, units, client_order_id, list_id=-1, price=0.0, **fields):
+        """Registra una orden que queda abierta (NEW) en el libro."""
+        order_id = next(self._order_ids)
+        order = {
+            "symbol": self.symbol, "orderId": order_id, "orderListId": list_id,
+            "clientOrderId": client_order_id or f"sim-{order_id}", "transactTime": self._now_ms(),
+            "price": _fmt(price), "origQty": _fmt(units / 10 ** self.rules.qty_scale), "executedQty": _fmt(0.0),
+            "cummulativeQuoteQty": _fmt(0.0), "status": "NEW", "timeInForce": "GTC",
+            "type": type, "side": side, "fills": [], **fields,
+        }
+        self.orders.append(order)
+        self._by_id[order_id] = order
+        return order
+
+    def _rest(self, order, stop=None, delta=None, limit=None, sibling=None):
+        """
+        Deja la orden en el libro con su disparo: 'stop' fijo, 'delta'
+        (trailingDelta como fracción, sobre el máximo desde que se colocó) o
+        'limit'; 'sibling' es la otra pata de una OCO.
+        """
+        self._open[order["orderId"]] = {"order": order, "stop": stop, "delta": delta, "limit": limit,
+                                        "peak": self.price(), "sibling": sibling}
+
+    def _stop_order(self, side, quantity, stop_price, trailing_delta, client_order_id):
+        if side != "SELL":
+            raise _api_error(-1116, "Only SELL stop orders are simulated.")
+        if stop_price is None and trailing_delta is None:
+            raise _api_error(-1102, "Param 'stopPrice' or 'trailingDelta' must be sent, but both were empty/null!")
+        if stop_price is not None and trailing_delta is not None:
+            raise _api_error(-1116, "Trailing orders with an activation price are not simulated.")
+        price = self.price()
+        units = self._order_units(side, quantity, None, price)
+        fields = {}
+        if trailing_delta is not None:
+            delta = int(trailing_delta)
+            if not 10 <= delta <= 2000:
+                raise _api_error(-1013, "Filter failure: TRAILING_DELTA")
+            fields["trailingDelta"] = delta
+        elif float(stop_price) >= price:
+            raise _api_error(-2010, "Order would trigger immediately.")
+        else:
+            fields["stopPrice"] = _fmt(float(stop_price))
+        order = self._new_order("STOP_LOSS", side, units, client_order_id, **fields)
+        self._rest(order, stop=float(stop_price) if stop_price is not None else None,
+                   delta=fields["trailingDelta"] / 10000 if trailing_delta is not None else None)
+        self._lock_base(units)
+        self._publish(self._report(order, "NEW"))
+        self._publish_balances()
+        return dict(order)
+
+    def order_oco_sell(self, **params):
+        return self.create_oco_order(side="SELL", **params)
+
+    def create_oco_order(self, symbol=None, side=None, quantity=None, price=None, stopPrice=None,
+                         stopLimitPrice=None, listClientOrderId=None, **params):
+        """OCO de venta: LIMIT_MAKER a 'price' y STOP_LOSS a 'stopPrice'; al ejecutarse una, la otra vence."""
+        self._round_trip("create_oco_order")
+        self._check_symbol(symbol)
+        if side != "SELL":
+            raise _api_error(-1116, "Only SELL OCO orders are simulated.")
+        if stopLimitPrice is not None:
+            raise _api_error(-1116, "STOP_LOSS_LIMIT legs are not simulated.")
+        with self._lock:
+            market = self.price()
+            limit, stop = float(price), float(stopPrice)
+            if not limit > market > stop:
+                raise _api_error(-2010, "The relationship of the prices for the orders is not correct.")
+            units = self._order_units("SELL", quantity, None, market)
+            list_id = next(self._list_ids)
+            stop_order = self._new_order("STOP_LOSS", "SELL", units, None, list_id, stopPrice=_fmt(stop))
+            limit_order = self._new_order("LIMIT_MAKER", "SELL", units, None, list_id, price=limit)
+            self._rest(stop_order, stop=stop, sibling=limit_order["orderId"])
+            self._rest(limit_order, limit=limit, sibling=stop_order["orderId"])
+            self._lock_base(units)  # Las dos patas comparten la misma cantidad
+            for order in (stop_order, limit_order):
+                self._publish(self._report(order, "NEW"))
+            self._publish_balances()
+            legs = (stop_order, limit_order)
+            return {
+                "orderListId": list_id, "contingencyType": "OCO", "listStatusType": "EXEC_STARTED",
+                "listOrderStatus": "EXECUTING", "listClientOrderId": listClientOrderId or f"sim-list-{list_id}",
+                "transactionTime": self._now_ms(), "symbol": self.symbol,
+                "orders": [{"symbol": self.symbol, "orderId": o["orderId"], "clientOrderId": o["clientOrderId"]}
+                           for o in legs],
+                "orderReports": [dict(o) for o in legs],
+            }
+
+    def cancel_order(self, symbol=None, orderId=None, **params):
+        """Cancela una orden abierta; en una OCO cancela también la otra pata."""
+        self._round_trip("cancel_order")
+        self._check_symbol(symbol)
+        with self._lock:
+            entry = self._open.get(orderId)
+            if entry is None:
+                raise _api_error(-2011, "Unknown order sent.")
+            self._close(entry, "CANCELED")
+            return dict(entry["order"])
+
+    def cancel_replace_order(self, symbol=None, cancelReplaceMode=None, cancelOrderId=None, side=None, type=None,
+                             quantity=None, stopPrice=None, trailingDelta=None, newClientOrderId=None, **params):
+        """Cancela un STOP_LOSS y coloca otro en la misma llamada (solo STOP_ON_FAILURE)."""
+        self._round_trip("cancel_replace_order")
+        self._check_symbol(symbol)
+        if cancelReplaceMode != "STOP_ON_FAILURE":
+            raise _api_error(-1116, "Only STOP_ON_FAILURE cancel-replace is simulated.")
+        if type != "STOP_LOSS":
+            raise _api_error(-1116, "Invalid orderType.")
+        with self._lock:
+            entry = self._open.get(cancelOrderId)
+            if entry is None or entry["sibling"] is not None:
+                # Binance no reemplaza órdenes de una OCO
+                raise _api_error(-2022, "Order cancel-replace failed.")
+            self._close(entry, "CANCELED")
+            canceled = dict(entry["order"])
+            try:
+                order = self._stop_order(side, quantity, stopPrice, trailingDelta, newClientOrderId)
+            except BinanceAPIException:
+                # Como en Binance, la cancelación queda hecha aunque la orden nueva falle
+                raise _api_error(-2021, "Order cancel-replace partially failed.")
+            return {"cancelResult": "SUCCESS", "newOrderResult": "SUCCESS",
+                    "cancelResponse": canceled, "newOrderResponse": order}
+
+    def get_order(self, symbol=None, orderId=None, **params):
+        self._round_trip("get_order")
+        self._check_symbol(symbol)
+        with self._lock:
+            if orderId not in self._by_id:
+                raise _api_error(-2013, "Order does not exist.")
+            return dict(self._by_id[orderId])
+
+    def get_open_orders(self, symbol=None, **params):
+        self._round_trip("get_open_orders")
+        self._check_symbol(symbol)
+        with self._lock:
+            return [dict(entry["order"]) for entry in self._open.values()]
+
+    def _lock_base(self, units):
+        qty = units / 10 ** self.rules.qty_scale
+        self.balances[self.base_asset] -= qty
+        self.locked[self.base_asset] += qty
+
+    def _match(self):
+        """Ejecuta las órdenes abiertas que el precio alcanzó desde la llamada anterior."""
+        now_ms = self._now_ms()
+        since, self._matched_ms = self._matched_ms, now_ms
+        if not self._open or now_ms <= since:
+            return
+        points = self._path(since, now_ms)
+        for (p0, _), (p1, gap) in zip(points, points[1:]):
+            for order_id in list(self._open):
+                entry = self._open.get(order_id)
+                if entry is None:
+                    continue  # Pata de una OCO que venció en este mismo tramo
+                price = self._trigger(entry, p0, p1, gap)
+                if price is not None:
+                    self._close(entry, "FILLED", price)
+
+    def _trigger(self, entry, p0, p1, gap):
+        """Precio de ejecución si la orden se dispara en el tramo p0 -> p1, o None."""
+        if entry["limit"] is not None:
+            return entry["limit"] if p1 >= entry["limit"] else None
+        if entry["delta"] is not None:
+            entry["peak"] = max(entry["peak"], p0)
+            stop = entry["peak"] * (1 - entry["delta"])
+        else:
+            stop = entry["stop"]
+        if p1 > stop:
+            return None
+        return (p1 if gap or p0 <= stop else stop) * (1 - self.slippage)
+
+    def _close(self, entry, status, price=None):
+        """
+        Cierra una orden abierta y su pata hermana liberando el saldo
+        bloqueado: con 'price' la ejecuta completa (la hermana vence), si no
+        las deja en 'status'.
+        """
+        legs = [entry]
+        if entry["sibling"] in self._open:
+            legs.append(self._open[entry["sibling"]])
+        for leg in legs:
+            del self._open[leg["order"]["orderId"]]
+        order = entry["order"]
+        base, quote = self.base_asset, self.quote_asset
+        executed = float(order["origQty"])
+        self.locked[base] -= executed
+        if price is None:
+            self.balances[base] += executed
+            for leg in legs:
+                leg["order"]["status"] = status
+                self._publish(self._report(leg["order"], status))
+            self._publish_balances()
+            return
+        for leg in legs[1:]:
+            leg["order"]["status"] = "EXPIRED"
+            self._publish(self._report(leg["order"], "EXPIRED"))
+        quote_qty = executed * price
+        commission = quote_qty * self.fee
+        self.balances[quote] += quote_qty - commission
+        order.update(status="FILLED", executedQty=order["origQty"], cummulativeQuoteQty=_fmt(quote_qty),
+                     fills=[{"price": _fmt(price), "qty": order["origQty"], "commission": _fmt(commission),
+                             "commissionAsset": quote, "tradeId": next(self._trade_ids)}])
+        self._publish_order(order, price, commission, quote)
+
+    # --- User data stream ---
+
+    def subscribe_user_data(self, callback):
+        """Registra callback(evento) para los eventos del user data stream (ver AccountModel.start)."""
+        self._listeners.append(callback)
+
+    def stream_get_listen_key(self):
+        self._round_trip("stream_get_listen_key")
+        return "simulated-listen-key"
+
+    def stream_keepalive(self, listenKey):
+        self._round_trip("stream_keepalive")
+        return {}
+
+    def stream_close(self, listenKey):
+        self._round_trip("stream_close")
+        return {}
+
+    def _publish(self, event):
+        for callback in self._listeners:
+            callback(event)
+
+    def _report(self, order, execution, **fields):
+        """executionReport de 'order'; sin ejecución salvo que 'fields' traiga l, L, n y N."""
+        now_ms = self._now_ms()
+        report = {
+            "e": "executionReport", "E": now_ms, "s": self.symbol, "c": order["clientOrderId"],
+            "S": order["side"], "o": order["type"], "f": order["timeInForce"], "q": order["origQty"],
+            "p": order["price"], "P": order.get("stopPrice", _fmt(0.0)), "g": order["orderListId"],
+            "i": order["orderId"], "T": now_ms, "z": order["executedQty"], "Z": order["cummulativeQuoteQty"],
+            "x": execution, "X": order["status"], "l": _fmt(0.0), "L": _fmt(0.0), "n": "0", "N": None,
+        }
+        report.update(fields)
+        return report
+
+    def _publish_order(self, order, price, commission, commission_asset):
+        if order["fills"]:
+            partial = order["status"] != "FILLED"
+            self._publish(self._report(order, "TRADE", X="PARTIALLY_FILLED" if partial else "FILLED",
+                                       l=order["executedQty"], L=_fmt(price), n=_fmt(commission), N=commission_asset))
+        if order["status"] != "FILLED":
+            self._publish(self._report(order, "EXPIRED"))
+        self._publish_balances()
+
+    def _publish_balances(self):
+        now_ms = self._now_ms()
+        self._publish({"e": "outboundAccountPosition", "E": now_ms, "u": now_ms,
+                       "B": [{"a": a, "f": _fmt(self.balances[a]), "l": _fmt(self.locked[a])}
+                             for a in (self.base_asset, self.quote_asset)]})
+
+    def equity(self):
+        """Valor de la cuenta en el activo de cotización al precio actual (incluido el saldo bloqueado)."""
+        with self._lock:
+            base = self.balances[self.base_asset] + self.locked[self.base_asset]
+            return self.balances[self.quote_asset] + base * self.price()
+
+
+def synthetic_ohlcv(n, interval="1h", start_ms=1_600_000_000_000, price=30000.0, volatility=0.01, seed=None):
+    """
+    Velas sintéticas (n, 6) de un paseo aleatorio geométrico, para
+    simulaciones y benchmarks sin descargar datos.
+    """
+    rng = np.random.default_rng(seed)
+    interval_ms = INTERVAL_MS[interval]
+    start_ms -= start_ms % interval_ms
+    closes = price * np.exp(np.cumsum(rng.normal(0.0, volatility, n)))
+    opens = np.concatenate(([price], closes[:-1]))
+    spread = np.abs(rng.normal(0.0, volatility / 2, (2, n))) * closes
+    ohlcv = np.empty((n, 6), dtype=np.float64)
+    ohlcv[:, OPEN_TIME] = start_ms + np.arange(n) * interval_ms
+    ohlcv[:, OPEN] = opens
+    ohlcv[:, HIGH] = np.maximum(opens, closes) + spread[0]
+    ohlcv[:, LOW] = np.maximum(np.minimum(opens, closes) - spread[1], closes * 0.01)
+    ohlcv[:, CLOSE] = closes
+    ohlcv[:, VOLUME] = rng.gamma(2.0, 50.0, n)
+    return ohlcv
+
+
+def run_simulation(ohlcv, cfg=None, workdir=None, log_queue=None, quiet=True, **exchange_options):
+    """
+    Ejecuta el Bot.run real (modo polling) contra un SimulatedExchange sobre
+    'ohlcv' hasta el final del histórico, con el reloj en fast-forward.
+
+    'cfg' se combina con la configuración por defecto; el estado y las velas
+    van a 'workdir' (un directorio temporal si es None) y las operaciones se
+    devuelven en vez de escribirse en trades.csv. Sin log_queue y con
+    quiet=True solo se guardan las advertencias en un LogChannel que nadie
+    lee, para no imprimir miles de líneas; con quiet=False se imprimen. Devuelve (exchange, trades), con trades en el
+    mismo formato que backtest.run_backtest.
+    """
+    from main import Bot
+
+    run_cfg = get_default_config()
+    run_cfg.update(cfg or {})
+    run_cfg["mode"] = "polling"
+    exchange_options.setdefault("balances", {exchange_options.get("quote_asset", "USDT"): run_cfg["usdt_amount"]})
+    exchange = SimulatedExchange(ohlcv, symbol=run_cfg["symbol"], interval=run_cfg["interval"], **exchange_options)
+    trades = []
+
+    def record_trade(action, symbol, price, quantity, cost=None, revenue=None, pnl=None):
+        trades.append(dict(timestamp=_timestamp(exchange.clock.time() * 1000), action=action, symbol=symbol,
+                           price=price, quantity=quantity, cost=cost, revenue=revenue, pnl=pnl))
+
+    with tempfile.TemporaryDirectory(prefix="simulacion-") as tmp:
+        base_dir = workdir or tmp
+        if log_queue is None and quiet:
+            log_queue = LogChannel(maxlen=1000, level=WARNING)
+        bot = Bot(log_queue=log_queue,
+                  state_file=os.path.join(base_dir, "state.json"), client=exchange, cfg=run_cfg,
+                  clock=exchange.clock, candle_dir=os.path.join(base_dir, "data"), trade_log=record_trade)
+        exchange.clock.on_end = bot.stop_event.set
+        bot.run()
+    return exchange, trades
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ejecuta el bot contra un exchange simulado sobre velas históricas.")
+    parser.add_argument("velas", nargs="?", help="Archivo .npy o .npz (downloader.py) con velas OHLCV; sin él se usan velas sintéticas")
+    parser.add_argument("--synthetic", type=int, default=5000, help="Cantidad de velas sintéticas")
+    parser.add_argument("--interval", default=None, help="Intervalo de las velas (por defecto el de la configuración)")
+    parser.add_argument("--fee", type=float, default=0.001)
+    parser.add_argument("--slippage", type=float, default=0.0)
+    parser.add_argument("--fill-ratio", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia simulada por llamada (s)")
+    parser.add_argument("--speed", type=float, default=None, help="Veces más rápido que el reloj real (sin valor: al instante)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true", help="Imprime los mensajes del bot")
+    args = parser.parse_args()
+
+    cfg = {}
+    if args.interval:
+        cfg["interval"] = args.interval
+    interval = args.interval or get_default_config()["interval"]
+    ohlcv = load_ohlcv(args.velas) if args.velas else synthetic_ohlcv(args.synthetic, interval, seed=args.seed)
+
+    started = time.perf_counter()
+    exchange, trades = run_simulation(ohlcv, cfg, quiet=not args.verbose,
+                                      fee=args.fee, slippage=args.slippage, fill_ratio=args.fill_ratio,
+                                      latency=args.latency, speed=args.speed)
+    elapsed = time.perf_counter() - started
+    simulated = len(ohlcv) * INTERVAL_MS[interval] / 1000
+    print(summarize(trades))
+    print(f"Órdenes: {len(exchange.orders)} | Llamadas: {sum(exchange.calls.values())} | "
+          f"Saldo final: {exchange.equity():.2f} {exchange.quote_asset}")
+    print(f"{len(ohlcv)} velas en {elapsed:.2f} s ({simulated / elapsed:,.0f}x el tiempo real)")
+
+
+if __name__ == "__main__":
+    main()
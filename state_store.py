@@ -0,0 +1,151 @@
+# state_store.py
+import json
+import os
+import threading
+import time
+
+
+class StateJournal:
+    """
+    Persistencia del estado del bot a prueba de cortes.
+
+    Cada cambio se anexa como una línea JSON al diario (<path>.journal) en
+    lugar de reescribir el archivo completo. Las escrituras se agrupan: como
+    mucho max_writes_per_second por segundo, y si llegan más rápido solo se
+    guarda el último estado pendiente (nuevos máximos del trailing stop).
+    Las escrituras forzadas (compras y ventas) van siempre al disco con
+    fsync. Cada snapshot_every entradas el estado se vuelca a <path> con
+    escritura atómica (archivo temporal + fsync + rename) y el diario se
+    vacía. Al cargar se lee el snapshot y se reproduce el diario encima.
+    """
+
+    def __init__(self, path, max_writes_per_second=1.0, snapshot_every=500):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.min_interval = 1.0 / max_writes_per_second
+        self.snapshot_every = snapshot_every
+
+        self._lock = threading.Lock()
+        self._journal = None
+        self._entries = 0
+        self._last_write = 0.0
+        self._pending = None
+        self._timer = None
+        self.recovered = True
+
+    def load(self, default):
+        """
+        Devuelve el último estado guardado, o 'default' si no hay ninguno.
+        Si existían archivos pero no se pudo recuperar nada, deja
+        self.recovered en False para que el bot lo avise.
+        """
+        state = None
+        found = False
+        if os.path.exists(self.path):
+            found = True
+            try:
+                with open(self.path, 'r') as f:
+                    state = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                state = None
+
+        self._entries = 0
+        if os.path.exists(self.journal_path):
+            valid_bytes = 0
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Línea a medio escribir por un corte: se descarta
+                    try:
+                        state = json.loads(line)
+                    except ValueError:
+                        break
+                    found = True
+                    valid_bytes += len(line)
+                    self._entries += 1
+            if valid_bytes != os.path.getsize(self.journal_path):
+                # Cortar la basura para que las próximas líneas no queden pegadas a ella
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(valid_bytes)
+
+        self.recovered = state is not None or not found
+        return dict(default) if state is None else state
+
+    def save(self, state, force=False):
+        """Registra un nuevo estado; con force=True se escribe y sincroniza en el acto."""
+        with self._lock:
+            now = time.monotonic()
+            if force or now - self._last_write >= self.min_interval:
+                self._pending = None
+                self._write(state, sync=force)
+                return True
+            # Agrupar: solo el último estado pendiente llega al disco
+            self._pending = dict(state)
+            if self._timer is None:
+                self._timer = threading.Timer(self._last_write + self.min_interval - now, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            return False
+
+    def flush(self):
+        """Escribe el estado pendiente, si lo hay."""
+        with self._lock:
+            self._timer = None
+            if self._pending is not None:
+                state, self._pending = self._pending, None
+                self._write(state, sync=True)
+
+    def _write(self, state, sync):
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a')
+        self._journal.write(json.dumps(state, separators=(',', ':')) + "\n")
+        self._journal.flush()
+        if sync:
+            os.fsync(self._journal.fileno())
+        self._last_write = time.monotonic()
+        self._entries += 1
+        if self._entries >= self.snapshot_every:
+            self._snapshot(state)
+
+    def _snapshot(self, state):
+        """Vuelca el estado a self.path de forma atómica y vacía el diario."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(os.path.dirname(os.path.abspath(self.path)))
+        if self._journal is not None:
+            self._journal.close()
+        # Recién ahora que el snapshot es durable se puede descartar el diario
+        self._journal = open(self.journal_path, 'w')
+        self._entries = 0
+
+    def close(self, state=None):
+        """Escribe lo pendiente y deja un snapshot con el estado final."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            final = state if state is not None else self._pending
+            self._pending = None
+            if final is not None:
+                self._snapshot(final)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+def _fsync_dir(path):
+    # En Windows no se pueden abrir directorios; el rename ya es atómico ahí
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
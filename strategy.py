@@ -1,15 +1,51 @@
 # strategy.py (Corregido)
 import numpy as np
 
+from backtest import CLOSE, HIGH, LOW, VOLUME
+from indicators import ATR, EMA, MACD, RSI, VWAP, Bollinger, as_ohlcv
+
 class Strategy:
+    # should_buy/should_sell reciben la lista de cierres o un array (n, 6) de
+    # velas; la última fila es la vela en curso
     def should_buy(self, closes): ...
     def should_sell(self, closes): ...
 
+def _closes(data):
+    """Cierres de una lista de cierres o de un array (n, 6) de velas."""
+    data = np.asarray(data, dtype=np.float64)
+    return data[:, CLOSE] if data.ndim == 2 else data
+
+# Diferencia relativa entre dos medias por debajo de la cual las rutas rápidas
+# (sumas móviles, cumsum) no deciden solas el cruce: el redondeo puede dar
+# vuelta la comparación, así que esas medias se recalculan con np.mean sobre
+# las mismas ventanas que usa should_buy/should_sell.
+MA_TIE_TOLERANCE = 1e-7
+
+
+def near_tie(a, b):
+    """True (elemento a elemento) donde dos medias están dentro de MA_TIE_TOLERANCE."""
+    return np.abs(a - b) <= MA_TIE_TOLERANCE * np.abs(b)
+
+
+def exact_moving_averages(closes, window, ma, indices):
+    """
+    Recalcula en el lugar ma[i] para cada i de indices como np.mean de la
+    ventana que termina en la vela i, igual que should_buy/should_sell.
+    """
+    for i in indices:
+        ma[i] = np.mean(closes[max(0, i - window + 1):i + 1])
+
 class MovingAverageCrossover(Strategy):
+    # Cada cuántas velas se recalculan las sumas desde el buffer para que el
+    # error de redondeo acumulado de las sumas móviles no crezca sin límite.
+    RESYNC_EVERY = 1024
+
     def __init__(self, fast: int, slow: int):
         self.fast, self.slow = fast, slow
+        self.reset()
 
     def should_buy(self, closes):
+        closes = _closes(closes)
         # Necesitamos al menos 'slow' + 1 velas para comparar la actual con la anterior
         if len(closes) < self.slow + 1:
             return False
@@ -26,6 +62,7 @@ class MovingAverageCrossover(Strategy):
         return ma_fast_actual > ma_slow_actual and ma_fast_anterior <= ma_slow_anterior
 
     def should_sell(self, closes):
+        closes = _closes(closes)
         # La lógica es la misma que para la compra
         if len(closes) < self.slow + 1:
             return False
@@ -39,4 +76,475 @@ class MovingAverageCrossover(Strategy):
         ma_slow_anterior = np.mean(closes[-self.slow-1:-1])
 
         # La señal de venta ocurre solo en el momento del cruce
-        return ma_fast_actual < ma_slow_actual and ma_fast_anterior >= ma_slow_anterior
\ No newline at end of file
+        return ma_fast_actual < ma_slow_actual and ma_fast_anterior >= ma_slow_anterior
+
+    # --- Modo streaming ---
+    # En lugar de pasar la lista completa de cierres en cada loop, se empuja una
+    # vela cerrada por vez con update(). La estrategia mantiene un buffer
+    # circular con las últimas max(fast, slow) + 1 velas y las sumas de ambas
+    # ventanas, así que cada actualización y cada consulta cuestan O(1) sin
+    # importar el tamaño de las ventanas. should_buy/should_sell siguen siendo
+    # la referencia: buy_signal()/sell_signal() devuelven lo mismo que
+    # llamarlas con la lista de todos los cierres empujados.
+
+    def reset(self):
+        """Vacía el estado del modo streaming."""
+        self._size = max(self.fast, self.slow) + 1
+        self._buffer = [0.0] * self._size
+        self._count = 0
+        self._sum_fast = 0.0
+        self._sum_slow = 0.0
+        self._prev_sum_fast = 0.0
+        self._prev_sum_slow = 0.0
+
+    def seed(self, closes):
+        """Precarga el modo streaming con un histórico de cierres (o de velas (n, 6))."""
+        for close in _closes(closes):
+            self.update(close)
+
+    def update(self, close, high=None, low=None, volume=None):
+        """Empuja el cierre de una vela cerrada y actualiza las sumas móviles."""
+        close = float(close)
+        n = self._count
+        self._prev_sum_fast = self._sum_fast
+        self._prev_sum_slow = self._sum_slow
+
+        self._sum_fast += close
+        if n >= self.fast:
+            self._sum_fast -= self._buffer[(n - self.fast) % self._size]
+        self._sum_slow += close
+        if n >= self.slow:
+            self._sum_slow -= self._buffer[(n - self.slow) % self._size]
+
+        self._buffer[n % self._size] = close
+        self._count = n + 1
+
+        # El recálculo cuesta O(ventana); hacerlo cada max(RESYNC_EVERY, ventana)
+        # velas mantiene el costo amortizado en O(1)
+        if self._count % max(self.RESYNC_EVERY, self._size) == 0:
+            self._resync()
+
+    def _resync(self):
+        """Recalcula las sumas desde el buffer para descartar el error acumulado."""
+        def window_sum(end, length):
+            return float(np.sum([self._buffer[i % self._size] for i in range(max(0, end - length), end)]))
+
+        n = self._count
+        self._sum_fast = window_sum(n, self.fast)
+        self._sum_slow = window_sum(n, self.slow)
+        self._prev_sum_fast = window_sum(n - 1, self.fast)
+        self._prev_sum_slow = window_sum(n - 1, self.slow)
+
+    @property
+    def ready(self):
+        """True cuando hay suficientes velas para evaluar un cruce."""
+        return self._count >= self.slow + 1
+
+    def _moving_averages(self):
+        # Con menos velas que la ventana, la referencia promedia las que hay
+        n = self._count
+        return (self._sum_fast / min(n, self.fast), self._sum_slow / min(n, self.slow),
+                self._prev_sum_fast / min(n - 1, self.fast), self._prev_sum_slow / min(n - 1, self.slow))
+
+    def _signal_averages(self):
+        # Si las medias casi empatan, el signo de la diferencia lo decide
+        # np.mean sobre el buffer en orden cronológico, como la referencia
+        averages = self._moving_averages()
+        if near_tie(averages[0], averages[1]) or near_tie(averages[2], averages[3]):
+            n = self._count
+            closes = np.array([self._buffer[i % self._size] for i in range(max(0, n - self._size), n)])
+            return (np.mean(closes[-self.fast:]), np.mean(closes[-self.slow:]),
+                    np.mean(closes[-self.fast-1:-1]), np.mean(closes[-self.slow-1:-1]))
+        return averages
+
+    def buy_signal(self):
+        """Señal de compra sobre las velas empujadas con update()."""
+        if not self.ready:
+            return False
+        ma_fast_actual, ma_slow_actual, ma_fast_anterior, ma_slow_anterior = self._signal_averages()
+        return ma_fast_actual > ma_slow_actual and ma_fast_anterior <= ma_slow_anterior
+
+    def sell_signal(self):
+        """Señal de venta sobre las velas empujadas con update()."""
+        if not self.ready:
+            return False
+        ma_fast_actual, ma_slow_actual, ma_fast_anterior, ma_slow_anterior = self._signal_averages()
+        return ma_fast_actual < ma_slow_actual and ma_fast_anterior >= ma_slow_anterior
+
+    @property
+    def warmup(self):
+        """Velas necesarias antes de que pueda haber señal."""
+        return self.slow + 1
+
+    def signals(self, data):
+        """
+        Señales de compra y venta de cada vela de un histórico, como arrays
+        booleanos: signals(datos)[0][i] == should_buy(datos[:i + 1]).
+        """
+        closes = _closes(data)
+        n = len(closes)
+        acc = np.concatenate(([0.0], np.cumsum(closes)))
+        idx = np.arange(1, n + 1)
+
+        def averages(window):
+            # Con menos velas que la ventana se promedian las que hay, como la referencia
+            start = np.maximum(0, idx - window)
+            return (acc[idx] - acc[start]) / (idx - start)
+
+        fast, slow = averages(self.fast), averages(self.slow)
+        ties = np.flatnonzero(near_tie(fast, slow))
+        exact_moving_averages(closes, self.fast, fast, ties)
+        exact_moving_averages(closes, self.slow, slow, ties)
+        prev_fast = np.concatenate(([np.nan], fast[:-1]))
+        prev_slow = np.concatenate(([np.nan], slow[:-1]))
+        valid = idx >= self.slow + 1
+        buy = valid & (fast > slow) & (prev_fast <= prev_slow)
+        sell = valid & (fast < slow) & (prev_fast >= prev_slow)
+        return buy, sell
+
+
+# --- Estrategias armadas con indicadores ---
+
+class IndicatorStrategy(Strategy):
+    """
+    Base de las estrategias construidas con los indicadores de indicators.py.
+
+    Cada subclase define qué indicadores usa (_make), qué valores lee de
+    ellos en streaming (_values) y en lote (_series), y sus reglas _buy/_sell
+    sobre (actual, anterior). Las reglas se escriben con operadores que
+    sirven tanto para escalares como para arrays, así que el modo streaming
+    (update + buy_signal, O(1) por vela) y el modo lote (signals /
+    should_buy, con NumPy) aplican exactamente la misma regla. Mientras un
+    indicador vale NaN las comparaciones dan False y no hay señal.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def _make(self):
+        raise NotImplementedError
+
+    def _values(self, close):
+        raise NotImplementedError
+
+    def _series(self, ohlcv):
+        raise NotImplementedError
+
+    def _buy(self, cur, prev):
+        raise NotImplementedError
+
+    def _sell(self, cur, prev):
+        raise NotImplementedError
+
+    def reset(self):
+        self._indicators = self._make()
+        self._cur = self._prev = None
+
+    def update(self, close, high=None, low=None, volume=None):
+        for indicator in self._indicators:
+            indicator.update(close, high, low, volume)
+        self._prev, self._cur = self._cur, self._values(close)
+
+    def seed(self, data):
+        for row in as_ohlcv(data):
+            self.update(row[CLOSE], row[HIGH], row[LOW], row[VOLUME])
+
+    @property
+    def ready(self):
+        return self._prev is not None and all(indicator.ready for indicator in self._indicators)
+
+    def buy_signal(self):
+        return self._prev is not None and bool(self._buy(self._cur, self._prev))
+
+    def sell_signal(self):
+        return self._prev is not None and bool(self._sell(self._cur, self._prev))
+
+    def signals(self, data):
+        cur = self._series(as_ohlcv(data))
+        prev = tuple(np.concatenate(([np.nan], values[:-1])) for values in cur)
+        with np.errstate(invalid='ignore'):
+            return np.asarray(self._buy(cur, prev), dtype=bool), np.asarray(self._sell(cur, prev), dtype=bool)
+
+    def should_buy(self, closes):
+        buy, _ = self.signals(closes)
+        return bool(len(buy) and buy[-1])
+
+    def should_sell(self, closes):
+        _, sell = self.signals(closes)
+        return bool(len(sell) and sell[-1])
+
+
+def _crosses_above(a, b, prev_a, prev_b):
+    return (a > b) & (prev_a <= prev_b)
+
+
+def _crosses_below(a, b, prev_a, prev_b):
+    return (a < b) & (prev_a >= prev_b)
+
+
+class EmaCrossover(IndicatorStrategy):
+    """Compra cuando la EMA rápida cruza por encima de la lenta; vende en el cruce inverso."""
+
+    def __init__(self, fast=9, slow=21):
+        self.fast, self.slow = fast, slow
+        super().__init__()
+
+    @property
+    def warmup(self):
+        return 4 * self.slow  # Lo que tarda la EMA en olvidar la siembra
+
+    def _make(self):
+        self._fast, self._slow = EMA(self.fast), EMA(self.slow)
+        return [self._fast, self._slow]
+
+    def _values(self, close):
+        return self._fast.value, self._slow.value
+
+    def _series(self, ohlcv):
+        return EMA(self.fast).batch(ohlcv), EMA(self.slow).batch(ohlcv)
+
+    def _buy(self, cur, prev):
+        return _crosses_above(cur[0], cur[1], prev[0], prev[1])
+
+    def _sell(self, cur, prev):
+        return _crosses_below(cur[0], cur[1], prev[0], prev[1])
+
+
+class MacdCrossover(IndicatorStrategy):
+    """Compra cuando el MACD cruza por encima de su señal; vende en el cruce inverso."""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast, self.slow, self.signal = fast, slow, signal
+        super().__init__()
+
+    @property
+    def warmup(self):
+        return 4 * self.slow + self.signal
+
+    def _make(self):
+        self._macd = MACD(self.fast, self.slow, self.signal)
+        return [self._macd]
+
+    def _values(self, close):
+        return self._macd.value, self._macd.signal
+
+    def _series(self, ohlcv):
+        macd, signal, _ = MACD(self.fast, self.slow, self.signal).batch(ohlcv)
+        return macd, signal
+
+    def _buy(self, cur, prev):
+        return _crosses_above(cur[0], cur[1], prev[0], prev[1])
+
+    def _sell(self, cur, prev):
+        return _crosses_below(cur[0], cur[1], prev[0], prev[1])
+
+
+class RsiReversal(IndicatorStrategy):
+    """Compra cuando el RSI sale de sobreventa (cruza 'oversold' hacia arriba); vende al salir de sobrecompra."""
+
+    def __init__(self, period=14, oversold=30.0, overbought=70.0):
+        self.period, self.oversold, self.overbought = period, oversold, overbought
+        super().__init__()
+
+    @property
+    def warmup(self):
+        return 4 * self.period
+
+    def _make(self):
+        self._rsi = RSI(self.period)
+        return [self._rsi]
+
+    def _values(self, close):
+        return (self._rsi.value,)
+
+    def _series(self, ohlcv):
+        return (RSI(self.period).batch(ohlcv),)
+
+    def _buy(self, cur, prev):
+        return (cur[0] > self.oversold) & (prev[0] <= self.oversold)
+
+    def _sell(self, cur, prev):
+        return (cur[0] < self.overbought) & (prev[0] >= self.overbought)
+
+
+class BollingerReversal(IndicatorStrategy):
+    """Compra cuando el cierre vuelve a entrar por la banda inferior; vende cuando vuelve a entrar por la superior."""
+
+    def __init__(self, period=20, k=2.0):
+        self.period, self.k = period, k
+        super().__init__()
+
+    @property
+    def warmup(self):
+        return self.period + 1
+
+    def _make(self):
+        self._bands = Bollinger(self.period, self.k)
+        return [self._bands]
+
+    def _values(self, close):
+        return close, self._bands.lower, self._bands.upper
+
+    def _series(self, ohlcv):
+        _, upper, lower = Bollinger(self.period, self.k).batch(ohlcv)
+        return ohlcv[:, CLOSE], lower, upper
+
+    def _buy(self, cur, prev):
+        return _crosses_above(cur[0], cur[1], prev[0], prev[1])
+
+    def _sell(self, cur, prev):
+        return _crosses_below(cur[0], cur[2], prev[0], prev[2])
+
+
+class VwapTrend(IndicatorStrategy):
+    """
+    Filtro de tendencia: señal de compra mientras el cierre está por encima
+    del VWAP y de venta mientras está por debajo. Pensado para combinarse
+    con AllOf y una estrategia de cruce.
+    """
+
+    def __init__(self, period=None):
+        self.period = period
+        super().__init__()
+
+    @property
+    def warmup(self):
+        return (self.period or 1) + 1
+
+    def _make(self):
+        self._vwap = VWAP(self.period)
+        return [self._vwap]
+
+    def _values(self, close):
+        return close, self._vwap.value
+
+    def _series(self, ohlcv):
+        return ohlcv[:, CLOSE], VWAP(self.period).batch(ohlcv)
+
+    def _buy(self, cur, prev):
+        return cur[0] > cur[1]
+
+    def _sell(self, cur, prev):
+        return cur[0] < cur[1]
+
+
+class AtrBreakout(IndicatorStrategy):
+    """Compra cuando el cierre sube más de 'multiplier' ATR respecto del anterior; vende en la ruptura a la baja."""
+
+    def __init__(self, period=14, multiplier=1.0):
+        self.period, self.multiplier = period, multiplier
+        super().__init__()
+
+    @property
+    def warmup(self):
+        return 4 * self.period
+
+    def _make(self):
+        self._atr = ATR(self.period)
+        return [self._atr]
+
+    def _values(self, close):
+        return close, self._atr.value
+
+    def _series(self, ohlcv):
+        return ohlcv[:, CLOSE], ATR(self.period).batch(ohlcv)
+
+    def _buy(self, cur, prev):
+        return cur[0] > prev[0] + self.multiplier * prev[1]
+
+    def _sell(self, cur, prev):
+        return cur[0] < prev[0] - self.multiplier * prev[1]
+
+
+class AllOf(Strategy):
+    """Combina estrategias: hay señal solo si todas la dan en la misma vela."""
+
+    combine = staticmethod(np.logical_and.reduce)
+    check = staticmethod(all)
+
+    def __init__(self, strategies):
+        self.strategies = list(strategies)
+
+    @property
+    def warmup(self):
+        return max(s.warmup for s in self.strategies)
+
+    @property
+    def ready(self):
+        return all(s.ready for s in self.strategies)
+
+    def reset(self):
+        for s in self.strategies:
+            s.reset()
+
+    def seed(self, data):
+        for s in self.strategies:
+            s.seed(data)
+
+    def update(self, close, high=None, low=None, volume=None):
+        for s in self.strategies:
+            s.update(close, high, low, volume)
+
+    def buy_signal(self):
+        return self.check(s.buy_signal() for s in self.strategies)
+
+    def sell_signal(self):
+        return self.check(s.sell_signal() for s in self.strategies)
+
+    def signals(self, data):
+        results = [s.signals(data) for s in self.strategies]
+        return self.combine([b for b, _ in results]), self.combine([s for _, s in results])
+
+    def should_buy(self, closes):
+        buy, _ = self.signals(closes)
+        return bool(len(buy) and buy[-1])
+
+    def should_sell(self, closes):
+        _, sell = self.signals(closes)
+        return bool(len(sell) and sell[-1])
+
+
+class AnyOf(AllOf):
+    """Combina estrategias: hay señal si alguna la da."""
+
+    combine = staticmethod(np.logical_or.reduce)
+    check = staticmethod(any)
+
+
+STRATEGIES = {
+    "ma_crossover": MovingAverageCrossover,
+    "ema_crossover": EmaCrossover,
+    "macd": MacdCrossover,
+    "rsi": RsiReversal,
+    "bollinger": BollingerReversal,
+    "vwap": VwapTrend,
+    "atr_breakout": AtrBreakout,
+}
+
+
+def create_strategy(cfg):
+    """
+    Crea la estrategia indicada en cfg["strategy"]: el nombre de una de
+    STRATEGIES, un diccionario con "name" y sus parámetros, o
+    {"all": [...]} / {"any": [...]} para combinarlas. Por defecto
+    "ma_crossover" con ma_fast y ma_slow, como antes. Ejemplo:
+    {"all": [{"name": "macd"}, {"name": "vwap", "period": 50}]}
+    """
+    return _build_strategy(cfg.get("strategy") or "ma_crossover", cfg)
+
+
+def _build_strategy(spec, cfg):
+    if isinstance(spec, str):
+        spec = {"name": spec}
+    if "all" in spec:
+        return AllOf(_build_strategy(s, cfg) for s in spec["all"])
+    if "any" in spec:
+        return AnyOf(_build_strategy(s, cfg) for s in spec["any"])
+    params = {k: v for k, v in spec.items() if k != "name"}
+    name = spec.get("name")
+    if name not in STRATEGIES:
+        raise ValueError(f"Estrategia desconocida: {name!r}. Opciones: {', '.join(STRATEGIES)}")
+    if name == "ma_crossover":
+        params.setdefault("fast", cfg["ma_fast"])
+        params.setdefault("slow", cfg["ma_slow"])
+    return STRATEGIES[name](**params)
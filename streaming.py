@@ -0,0 +1,171 @@
+# streaming.py
+import argparse
+import asyncio
+import json
+import random
+
+import aiohttp
+from aiohttp import web
+
+STREAM_URL = "wss://stream.binance.com:9443"
+TESTNET_STREAM_URL = "wss://testnet.binance.vision"
+
+
+class MarketStream:
+    """
+    Suscripción a los streams de velas y bookTicker de un símbolo.
+
+    Llama a on_price(precio) con cada actualización del mejor bid y a
+    on_kline_closed(k) cada vez que cierra una vela (k es el objeto 'k' del
+    evento kline de Binance). Si la conexión se corta, reconecta con backoff
+    exponencial y vuelve a llamar a on_connect() para que el bot rellene por
+    REST las velas que se perdió mientras estaba desconectado.
+
+    Los callbacks pueden bloquear (el bot hace llamadas REST en ellos), así
+    que se ejecutan en un hilo con asyncio.to_thread, de a uno y en el orden
+    de los mensajes, sin frenar el event loop (heartbeat y lectura del socket).
+    """
+
+    def __init__(self, symbol, interval, on_price, on_kline_closed, on_connect=None,
+                 url=None, testnet=False, log=print, max_backoff=60):
+        self.symbol = symbol.lower()
+        self.interval = interval
+        self.on_price = on_price
+        self.on_kline_closed = on_kline_closed
+        self.on_connect = on_connect
+        self.base_url = (url or (TESTNET_STREAM_URL if testnet else STREAM_URL)).rstrip('/')
+        self.log = log
+        self.max_backoff = max_backoff
+
+    def stream_url(self):
+        streams = f"{self.symbol}@kline_{self.interval}/{self.symbol}@bookTicker"
+        return f"{self.base_url}/stream?streams={streams}"
+
+    async def run(self, stop_event):
+        """Mantiene la conexión abierta hasta que stop_event (threading.Event) se activa."""
+        backoff = 1
+        async with aiohttp.ClientSession() as session:
+            while not stop_event.is_set():
+                try:
+                    async with session.ws_connect(self.stream_url(), heartbeat=20) as ws:
+                        self.log("Stream de mercado conectado.")
+                        backoff = 1
+                        if self.on_connect:
+                            await asyncio.to_thread(self.on_connect)
+                        await self._consume(ws, stop_event)
+                    if not stop_event.is_set():
+                        self.log("⚠️ Stream de mercado cerrado por el servidor.")
+                except (OSError, asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    self.log(f"⚠️ Stream de mercado desconectado: {e}")
+
+                if stop_event.is_set():
+                    break
+                delay = backoff + random.uniform(0, backoff / 2)
+                self.log(f"Reconectando en {delay:.1f} s...")
+                await _sleep_unless_stopped(delay, stop_event)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    async def _consume(self, ws, stop_event):
+        # Cierra el socket cuando se pide la detención para que el 'async for' termine
+        async def close_on_stop():
+            await _sleep_unless_stopped(float("inf"), stop_event)
+            await ws.close()
+
+        watcher = asyncio.create_task(close_on_stop())
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                try:
+                    await self.dispatch(json.loads(msg.data))
+                except (ValueError, KeyError) as e:
+                    self.log(f"⚠️ Mensaje de stream inválido: {e}")
+        finally:
+            watcher.cancel()
+
+    async def dispatch(self, message):
+        """Envía un mensaje (combinado o simple) al callback que corresponda."""
+        data = message.get("data", message)
+        event = data.get("e")
+        if event == "kline":
+            k = data["k"]
+            if k["x"]:
+                await asyncio.to_thread(self.on_kline_closed, k)
+        elif event == "trade":
+            await asyncio.to_thread(self.on_price, float(data["p"]))
+        elif "b" in data and "a" in data:
+            # bookTicker: el bid es el precio al que vendería el trailing stop
+            await asyncio.to_thread(self.on_price, float(data["b"]))
+
+
+async def _sleep_unless_stopped(seconds, stop_event):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    while not stop_event.is_set() and loop.time() < deadline:
+        await asyncio.sleep(min(0.2, deadline - loop.time()))
+
+
+# --- Grabación y reproducción para pruebas sin conexión ---
+
+async def record(url, path, count):
+    """Graba 'count' mensajes de un stream real en un archivo JSON lines."""
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(url) as ws:
+            with open(path, 'w') as f:
+                for _ in range(count):
+                    f.write(await ws.receive_str() + "\n")
+
+
+async def replay_server(path, host="127.0.0.1", port=8765, delay=0.0):
+    """
+    Servidor WebSocket local que reenvía a cada cliente los mensajes grabados
+    y luego cierra la conexión, lo que permite probar también la reconexión.
+    Acepta cualquier ruta, así que sirve como URL base de MarketStream.
+    Devuelve el AppRunner de aiohttp (detener con await runner.cleanup()).
+    """
+    with open(path) as f:
+        messages = [line.strip() for line in f if line.strip()]
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        for message in messages:
+            await ws.send_str(message)
+            if delay:
+                await asyncio.sleep(delay)
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grabar o reproducir streams de mercado de Binance.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    rec = sub.add_parser("record")
+    rec.add_argument("url")
+    rec.add_argument("path")
+    rec.add_argument("--count", type=int, default=1000)
+    rep = sub.add_parser("replay")
+    rep.add_argument("path")
+    rep.add_argument("--port", type=int, default=8765)
+    rep.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.cmd == "record":
+        asyncio.run(record(args.url, args.path, args.count))
+    else:
+        async def serve_forever():
+            await replay_server(args.path, port=args.port, delay=args.delay)
+            print(f"Reproduciendo {args.path} en ws://127.0.0.1:{args.port}")
+            await asyncio.Future()
+        asyncio.run(serve_forever())
+
+
+if __name__ == "__main__":
+    main()
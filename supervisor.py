@@ -0,0 +1,355 @@
+# supervisor.py
+"""
+Ejecuta muchos bots repartidos en varios procesos (ver daemon.py --processes).
+
+Cada proceso de trabajo corre un grupo de bots en sus propios hilos, así
+que las estrategias pesadas usan todos los núcleos y un bot que se cuelga o
+tira el proceso solo afecta a su grupo. Un proceso aparte (market_feed.
+MarketFeed) pide las velas y los precios de cada símbolo una sola vez y los
+publica a todos. El supervisor reinicia con backoff exponencial los
+procesos que terminan o dejan de enviar latidos e informa el estado de cada
+uno por el log y por las métricas.
+"""
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from config import bot_names, symbol_configs
+from daemon import STOP_TIMEOUT
+from metrics import METRICS_CSV, METRICS_PORT, default_metrics, start_exporters
+
+# Cada cuántos segundos un proceso hijo informa su estado
+HEARTBEAT_SECONDS = float(os.getenv("HEARTBEAT_SECONDS", "5"))
+# Un proceso sin latidos durante este tiempo se considera colgado y se reinicia
+HEARTBEAT_TIMEOUT = float(os.getenv("HEARTBEAT_TIMEOUT", "60"))
+# Espera antes del primer reinicio; se duplica con cada caída seguida hasta RESTART_MAX_BACKOFF
+RESTART_BACKOFF = float(os.getenv("RESTART_BACKOFF", "1"))
+RESTART_MAX_BACKOFF = float(os.getenv("RESTART_MAX_BACKOFF", "300"))
+# Un proceso que duró esto sin caerse vuelve a empezar con el backoff mínimo
+STABLE_SECONDS = float(os.getenv("STABLE_SECONDS", "300"))
+# Cada cuántos segundos se escribe en el log el estado de todos los procesos
+REPORT_SECONDS = float(os.getenv("SUPERVISOR_REPORT_SECONDS", "60"))
+# Puerto local del feed de mercado; 0 = uno libre
+FEED_PORT = int(os.getenv("FEED_PORT", "0"))
+
+
+def bot_specs(cfg):
+    """
+    (nombre, archivo de estado, configuración) de cada bot. Varios bots
+    pueden operar el mismo símbolo con otra estrategia si cada entrada de
+    "symbols" trae su propio "name"; si no, se numeran.
+    """
+    configs = symbol_configs(cfg)
+    # Con uno solo usa state.json, como la GUI y daemon.py
+    return [(name, None if len(configs) == 1 else f"state_{name}.json", sym_cfg)
+            for name, sym_cfg in zip(bot_names(configs), configs)]
+
+
+def _free_port(host):
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def _rest_client(cfg):
+    from rest_client import RateLimitedClient
+
+    return RateLimitedClient(cfg["api_key"], cfg["api_secret"], testnet=cfg["testnet"],
+                             api_url=cfg.get("api_url") or None)
+
+
+def _child_exporters(name, port):
+    """Métricas de un proceso hijo: puerto propio y, si hay CSV, <archivo>-<proceso>.csv."""
+    csv_path = ""
+    if METRICS_CSV:
+        base, ext = os.path.splitext(METRICS_CSV)
+        csv_path = f"{base}-{name}{ext}"
+    start_exporters(port=port, csv_path=csv_path)
+
+
+def _heartbeats(name, health_queue, stop_event, stopping, status):
+    """Envía status() cada HEARTBEAT_SECONDS hasta que se detenga el proceso o status() devuelva None."""
+    health_queue.cancel_join_thread()  # Un latido perdido al salir no importa; no bloquear la salida
+    while True:
+        report = status()
+        if report is None:
+            return 1
+        health_queue.put((name, time.time(), report))
+        if stopping.wait(HEARTBEAT_SECONDS) or stop_event.is_set():
+            return 0
+
+
+def _worker_main(name, specs, feed_address, authkey, health_queue, stop_event, metrics_port, client_factory):
+    """Proceso de trabajo: corre los bots de 'specs' y termina con código 1 si alguno se detiene solo."""
+    from candle_store import CANDLE_DIR
+    from logger import TradeLogWriter, bot_log_file
+    from main import Bot
+    from market_feed import FeedClient, FeedSubscriber
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C lo maneja el supervisor
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    load_dotenv()
+    _child_exporters(name, metrics_port)
+
+    subscriber = None
+    if feed_address:
+        # Los bots en modo streaming reciben el mercado por su websocket
+        keys = [(c["symbol"], c["interval"]) for _, _, c in specs if c.get("mode") != "streaming"]
+        subscriber = FeedSubscriber(feed_address, authkey, keys).start(stopping)
+
+    bots, trade_logs = [], []
+    for bot_name, state_file, cfg in specs:
+        client = (client_factory or _rest_client)(cfg)
+        if subscriber is not None:
+            client = FeedClient(client, subscriber)
+        options = {"state_file": state_file} if state_file else {}
+        # Un CSV por bot (no por proceso): el escritor solo coordina a los hilos de su proceso, y
+        # así las compras y ventas de un bot quedan en el mismo archivo aunque cambie el reparto
+        trade_logs.append(TradeLogWriter(bot_log_file(bot_name)))
+        # Velas en un directorio por bot: dos procesos nunca anexan al mismo CandleStore
+        bots.append(Bot(cfg=cfg, name=bot_name, client=client, trade_log=trade_logs[-1].log_trade,
+                        candle_dir=os.path.join(CANDLE_DIR, "workers", bot_name), **options))
+    for bot in bots:
+        bot.start()
+
+    def status():
+        dead = [bot.name for bot in bots if not bot.bot_thread.is_alive()]
+        if dead and not (stopping.is_set() or stop_event.is_set()):
+            print(f"⚠️ [{name}] Se detuvieron: {', '.join(dead)}. Reiniciando el proceso.", flush=True)
+            return None
+        return {
+            "pid": os.getpid(),
+            "feed": subscriber.connected.is_set() if subscriber is not None else None,
+            "bots": [{"name": bot.name, "symbol": bot.cfg["symbol"], "alive": bot.bot_thread.is_alive(),
+                      "in_position": bot.state.get("entry_price", 0.0) != 0,
+                      "errors": default_metrics.value("bot_errors_total", bot=bot.name)} for bot in bots],
+        }
+
+    exit_code = 1
+    try:
+        exit_code = _heartbeats(name, health_queue, stop_event, stopping, status)
+    finally:
+        stopping.set()
+        for bot in bots:
+            bot.stop_event.set()
+        for bot in bots:
+            bot.bot_thread.join(STOP_TIMEOUT)
+        for trade_log in trade_logs:
+            trade_log.flush(timeout=5.0)
+    sys.exit(exit_code)
+
+
+def _feed_main(name, keys, address, authkey, health_queue, stop_event, metrics_port, cfg, price_seconds,
+               client_factory):
+    """Proceso del feed de mercado: MarketFeed en un hilo y latidos desde el principal."""
+    from market_feed import MarketFeed
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    load_dotenv()
+    _child_exporters(name, metrics_port)
+
+    feed = MarketFeed((client_factory or _rest_client)(cfg), keys, address, authkey, price_seconds=price_seconds)
+    thread = threading.Thread(target=feed.run, args=(stopping,), name="market-feed", daemon=True)
+    thread.start()
+
+    def status():
+        if not thread.is_alive() and not (stopping.is_set() or stop_event.is_set()):
+            return None
+        return {"pid": os.getpid(), "subscribers": feed.subscriber_count()}
+
+    exit_code = 1
+    try:
+        exit_code = _heartbeats(name, health_queue, stop_event, stopping, status)
+    finally:
+        stopping.set()
+        thread.join(STOP_TIMEOUT)
+    sys.exit(exit_code)
+
+
+def _bot_summary(bot):
+    text = bot["name"]
+    if not bot["alive"]:
+        text += " (detenido)"
+    if bot["in_position"]:
+        text += " en posición"
+    if bot["errors"]:
+        text += f", {bot['errors']} errores"
+    return text
+
+
+class _Child:
+    """Un proceso hijo del supervisor: cómo arrancarlo y su historial de caídas."""
+
+    def __init__(self, name, target, args):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process = None
+        self.started = 0.0
+        self.restarts = 0
+        self.failures = 0  # Caídas seguidas sin llegar a STABLE_SECONDS
+        self.next_start = 0.0
+        self.last_exit = None
+        self.heartbeat = 0.0
+        self.status = {}
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+
+class Supervisor:
+    """
+    Reparte los bots de la configuración en 'processes' procesos (por
+    defecto uno por núcleo, nunca más que bots) y los mantiene vivos.
+
+    Los procesos se crean con spawn, así no heredan hilos ni conexiones del
+    supervisor. Un proceso que termina sin que se lo pidan, o que pasa
+    HEARTBEAT_TIMEOUT sin latidos, se reinicia tras RESTART_BACKOFF
+    segundos, el doble con cada caída seguida (hasta RESTART_MAX_BACKOFF).
+    Con feed=True un proceso extra publica el mercado a todos; si se cae,
+    los bots piden los datos por REST hasta que vuelva. 'client_factory'
+    (cfg -> cliente) reemplaza a RateLimitedClient en todos los procesos y
+    tiene que poder importarse desde ellos (una función de módulo).
+    """
+
+    def __init__(self, cfg, processes=None, feed=True, client_factory=None, log=print, metrics=None):
+        self.cfg = cfg
+        self.log = log
+        self.metrics = metrics or default_metrics
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = self.context.Event()
+        self.health_queue = self.context.Queue()
+        self.children = []
+
+        specs = bot_specs(cfg)
+        processes = max(1, min(len(specs), processes or os.cpu_count() or 1))
+        groups = [specs[i::processes] for i in range(processes)]
+        port = iter(range(METRICS_PORT + 1, METRICS_PORT + processes + 2)) if METRICS_PORT else None
+
+        feed_address = authkey = None
+        keys = sorted({(c["symbol"], c["interval"]) for _, _, c in specs if c.get("mode") != "streaming"})
+        if feed and keys:
+            feed_address = ("127.0.0.1", FEED_PORT or _free_port("127.0.0.1"))
+            authkey = os.urandom(16)
+            price_seconds = min(c.get("trailing_seconds", 60) for _, _, c in specs)
+            self._add("feed", _feed_main, (keys, feed_address, authkey, self.health_queue, self.stop_event,
+                                           next(port) if port else 0, cfg, price_seconds, client_factory))
+        for i, group in enumerate(groups):
+            self._add(f"worker-{i}", _worker_main, (group, feed_address, authkey, self.health_queue,
+                                                    self.stop_event, next(port) if port else 0, client_factory))
+
+    def _add(self, name, target, args):
+        child = _Child(name, target, (name,) + args)
+        self.children.append(child)
+        self.metrics.gauge_callback("supervisor_process_up", lambda: int(child.alive()), process=name)
+        self.metrics.gauge_callback("supervisor_heartbeat_age_seconds",
+                                    lambda: time.monotonic() - child.heartbeat, process=name)
+
+    def _spawn(self, child):
+        child.process = self.context.Process(target=child.target, args=child.args, name=child.name, daemon=False)
+        child.process.start()
+        child.started = child.heartbeat = time.monotonic()
+        bots = child.args[1] if child.target is _worker_main else ()
+        self.log(f"{child.name} iniciado (pid {child.process.pid}){': ' if bots else ''}"
+                 f"{', '.join(name for name, _, _ in bots)}")
+
+    def start(self):
+        for child in self.children:
+            self._spawn(child)
+
+    def _drain(self):
+        while True:
+            try:
+                name, _, report = self.health_queue.get_nowait()
+            except queue.Empty:
+                return
+            for child in self.children:
+                if child.name == name:
+                    child.heartbeat = time.monotonic()
+                    child.status = report
+
+    def poll(self):
+        """Procesa los latidos y reinicia los procesos caídos o colgados cuando vence su backoff."""
+        self._drain()
+        now = time.monotonic()
+        for child in self.children:
+            if child.alive():
+                if now - child.heartbeat <= HEARTBEAT_TIMEOUT:
+                    continue
+                self.log(f"⚠️ {child.name} lleva {now - child.heartbeat:.0f} s sin latidos; se detiene.")
+                child.process.kill()
+                child.process.join(5)
+            if child.process is not None:
+                child.last_exit = child.process.exitcode
+                child.failures = 1 if now - child.started >= STABLE_SECONDS else child.failures + 1
+                delay = min(RESTART_MAX_BACKOFF, RESTART_BACKOFF * 2 ** (child.failures - 1))
+                child.process = None
+                child.status = {}
+                child.restarts += 1
+                child.next_start = now + delay
+                self.metrics.inc("supervisor_restarts_total", process=child.name)
+                self.log(f"⚠️ {child.name} terminó (código {child.last_exit}); se reinicia en {delay:.0f} s.")
+            if now >= child.next_start:
+                self._spawn(child)
+
+    def health(self):
+        """Estado de cada proceso: vivo, pid, reinicios, último código de salida, antigüedad del latido y bots."""
+        now = time.monotonic()
+        return [{"name": child.name, "alive": child.alive(),
+                 "pid": child.process.pid if child.process is not None else None,
+                 "restarts": child.restarts, "last_exit": child.last_exit,
+                 "heartbeat_age": now - child.heartbeat if child.alive() else None,
+                 **child.status} for child in self.children]
+
+    def report(self):
+        for h in self.health():
+            if not h["alive"]:
+                self.log(f"{h['name']}: detenido | reinicios: {h['restarts']} | último código: {h['last_exit']}")
+                continue
+            line = f"{h['name']}: pid {h['pid']} | latido hace {h['heartbeat_age']:.0f} s | reinicios: {h['restarts']}"
+            if h.get("feed") is not None:
+                line += f" | feed: {'conectado' if h['feed'] else 'REST'}"
+            if "subscribers" in h:
+                line += f" | suscriptores: {h['subscribers']}"
+            bots = [_bot_summary(b) for b in h.get("bots", [])]
+            self.log(line + (" | " + "; ".join(bots) if bots else ""))
+
+    def run(self, stop_event=None):
+        """Arranca los procesos y los supervisa hasta que se active stop_event. Devuelve el código de salida."""
+        stop_event = stop_event or threading.Event()
+        start_exporters(self.metrics, log=self.log)
+        self.start()
+        next_report = time.monotonic() + REPORT_SECONDS
+        try:
+            while not stop_event.wait(0.5):
+                self.poll()
+                if time.monotonic() >= next_report:
+                    next_report += REPORT_SECONDS
+                    self.report()
+        finally:
+            self.stop()
+        return 0
+
+    def stop(self):
+        """Pide a todos los procesos que se detengan y mata a los que no lo hacen a tiempo."""
+        self.log("Deteniendo procesos...")
+        self.stop_event.set()
+        deadline = time.monotonic() + STOP_TIMEOUT + HEARTBEAT_SECONDS + 5
+        while any(child.alive() for child in self.children) and time.monotonic() < deadline:
+            self._drain()  # Un hijo con latidos sin leer en la cola no puede terminar
+            time.sleep(0.2)
+        for child in self.children:
+            if child.alive():
+                self.log(f"⚠️ {child.name} no se detuvo a tiempo; se fuerza el cierre.")
+                child.process.kill()
+                child.process.join(5)
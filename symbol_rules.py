@@ -0,0 +1,175 @@
+# symbol_rules.py
+import json
+import os
+import re
+import time
+from decimal import Decimal
+from urllib.parse import urlparse
+
+# Plantilla del archivo: se guarda uno por servidor, p. ej. exchange_info_testnet.binance.vision.json
+EXCHANGE_INFO_FILE = os.getenv("EXCHANGE_INFO_FILE", "exchange_info.json")
+# Antigüedad máxima (segundos) de las reglas guardadas antes de volver a pedir el exchangeInfo
+EXCHANGE_INFO_TTL = int(os.getenv("EXCHANGE_INFO_TTL", str(12 * 3600)))
+
+
+class SymbolRules:
+    """
+    Reglas de trading de un símbolo compiladas a enteros.
+
+    stepSize y tickSize se guardan como (unidades, escala): 0.00001000 es
+    1 unidad con escala 5. Las cantidades y precios se pasan a unidades
+    enteras de esa escala a partir de su representación decimal, así que
+    ajustar al paso es una resta de enteros sin errores de redondeo de float
+    (0.003 con paso 0.001 da 0.003 y no 0.002).
+    """
+
+    __slots__ = ("symbol", "base_asset", "quote_asset", "step_units", "qty_scale",
+                 "tick_units", "price_scale", "min_qty_units", "min_notional")
+
+    def __init__(self, symbol_info):
+        filters = {f['filterType']: f for f in symbol_info['filters']}
+        self.symbol = symbol_info['symbol']
+        self.base_asset = symbol_info.get('baseAsset')
+        self.quote_asset = symbol_info.get('quoteAsset')
+        self.step_units, self.qty_scale = _units_and_scale(filters['LOT_SIZE']['stepSize'])
+        self.tick_units, self.price_scale = _units_and_scale(filters['PRICE_FILTER']['tickSize'])
+        self.min_qty_units = _to_units(filters['LOT_SIZE']['minQty'], self.qty_scale)
+        notional = filters.get('NOTIONAL') or filters.get('MIN_NOTIONAL')
+        self.min_notional = float(notional['minNotional']) if notional else 0.0
+
+    @property
+    def step_size(self):
+        return self.step_units / 10 ** self.qty_scale
+
+    @property
+    def tick_size(self):
+        return self.tick_units / 10 ** self.price_scale
+
+    def qty_units(self, qty):
+        """Cantidad en unidades enteras, redondeada hacia abajo al stepSize."""
+        units = _to_units(qty, self.qty_scale)
+        return units - units % self.step_units
+
+    def price_units(self, price, up=False):
+        """Precio en unidades enteras ajustado al tickSize (hacia abajo, o hacia arriba con up=True)."""
+        units = _to_units(price, self.price_scale, up)
+        remainder = units % self.tick_units
+        if remainder and up:
+            return units - remainder + self.tick_units
+        return units - remainder
+
+    def quantity(self, qty):
+        """Cantidad ajustada al stepSize como texto para la orden."""
+        return format_units(self.qty_units(qty), self.qty_scale)
+
+    def price(self, price, up=False):
+        """Precio ajustado al tickSize como texto para la orden."""
+        return format_units(self.price_units(price, up), self.price_scale)
+
+    def valid_order(self, qty, price):
+        """True si la cantidad ajustada alcanza minQty y el nocional mínimo."""
+        units = self.qty_units(qty)
+        return (units > 0 and units >= self.min_qty_units
+                and units / 10 ** self.qty_scale * price >= self.min_notional)
+
+
+def _units_and_scale(value):
+    """'0.00100000' -> (1, 3): el paso como entero en la escala de sus decimales significativos."""
+    d = Decimal(value).normalize()
+    scale = max(0, -d.as_tuple().exponent)
+    return int(d.scaleb(scale)), scale
+
+
+def _to_units(value, scale, up=False):
+    # str() de un float es su representación decimal más corta: 0.003 -> '0.003'
+    d = Decimal(value if isinstance(value, str) else str(value)).scaleb(scale)
+    units = int(d)  # Trunca hacia cero
+    if up and d > units:
+        units += 1
+    return units
+
+
+def format_units(units, scale):
+    """Unidades enteras a texto decimal exacto: (1234, 3) -> '1.234'."""
+    if scale == 0:
+        return str(units)
+    sign = "-" if units < 0 else ""
+    whole, frac = divmod(abs(units), 10 ** scale)
+    return f"{sign}{whole}.{frac:0{scale}d}"
+
+
+# Filtros que usan SymbolRules y el bot; el resto del exchangeInfo no se guarda
+RULE_FILTERS = ("LOT_SIZE", "PRICE_FILTER", "NOTIONAL", "MIN_NOTIONAL")
+
+
+def compile_rules(exchange_info):
+    """
+    Tabla símbolo -> entrada reducida (símbolo, activos y los filtros de
+    RULE_FILTERS) a partir de la respuesta de get_exchange_info. Cada entrada
+    sirve tal cual para SymbolRules y parse_symbol_info.
+    """
+    return {s['symbol']: {'symbol': s['symbol'], 'status': s.get('status'),
+                          'baseAsset': s.get('baseAsset'), 'quoteAsset': s.get('quoteAsset'),
+                          'filters': [f for f in s['filters'] if f['filterType'] in RULE_FILTERS]}
+            for s in exchange_info['symbols']}
+
+
+# --- Cache en disco del exchangeInfo ---
+
+def exchange_info_path(client, path=EXCHANGE_INFO_FILE):
+    """
+    Archivo del exchangeInfo del servidor al que apunta 'client' (mainnet,
+    testnet o un api_url propio): 'path' con el host antes de la extensión.
+    Cada servidor tiene sus propios símbolos y filtros, así que no comparten
+    la copia.
+    """
+    base_url = client.API_TESTNET_URL if getattr(client, "testnet", False) else client.API_URL
+    host = re.sub(r"[^\w.-]", "_", urlparse(base_url).netloc or base_url)
+    root, ext = os.path.splitext(path)
+    return f"{root}_{host}{ext}"
+
+
+def read_cached_rules(path=EXCHANGE_INFO_FILE, ttl=EXCHANGE_INFO_TTL):
+    """Tabla de reglas guardada si existe y tiene menos de ttl segundos; si no, None."""
+    try:
+        if ttl is not None and time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path, 'r') as f:
+            table = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if isinstance(table.get('symbols'), list):
+        table = compile_rules(table)  # Copia de versiones que guardaban el exchangeInfo completo
+    return table
+
+
+def save_rules(table, path=EXCHANGE_INFO_FILE):
+    """Guarda la tabla de reglas de forma atómica (archivo temporal + rename)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(table, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_rules(client, path=EXCHANGE_INFO_FILE, ttl=EXCHANGE_INFO_TTL, log=print):
+    """
+    Tabla símbolo -> reglas de todos los símbolos: la guardada si sigue
+    vigente, si no se pide el exchangeInfo a Binance (peso 20), se compila y
+    se guarda. Si la consulta falla y hay una copia vencida, se usa esa.
+    """
+    table = read_cached_rules(path, ttl)
+    if table is not None:
+        return table
+    try:
+        table = compile_rules(client.get_exchange_info())
+    except Exception:
+        table = read_cached_rules(path, ttl=None)
+        if table is None:
+            raise
+        log(f"⚠️ No se pudo actualizar {path}; se usan las reglas guardadas.")
+        return table
+    try:
+        save_rules(table, path)
+    except OSError as e:
+        log(f"⚠️ No se pudo guardar {path}: {e}")
+    return table